@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from typing import Dict, Any, Optional
+from app.core.cache import ResultCache, get_result_cache
+from app.db.query_builder import template_stats
+from app.db.search_index import SearchIndexStore, get_search_index
+from app.db.zero_sales import ZeroSalesIndexStore, get_zero_sales_index
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+def cache_stats(cache: ResultCache = Depends(get_result_cache), zero_sales_index: Optional[ZeroSalesIndexStore] = Depends(get_zero_sales_index), search_index: Optional[SearchIndexStore] = Depends(get_search_index)) -> Dict[str, Any]:
+    index = zero_sales_index.current if zero_sales_index is not None else None
+    search = search_index.current if search_index is not None else None
+    return {
+        **cache.stats(),
+        "query_templates": template_stats(),
+        "zero_sales_index": index.stats() if index is not None else None,
+        "search_index": search.stats() if search is not None else None,
+    }
+
+# 删除某个接口的全部缓存结果，例如底层表重新加载之后
+@router.delete("/cache/{namespace}")
+async def invalidate_cache(namespace: str, cache: ResultCache = Depends(get_result_cache)) -> Dict[str, Any]:
+    return {"namespace": namespace, "deleted": await cache.invalidate(namespace)}
@@ -1,7 +1,22 @@
-from fastapi import APIRouter, HTTPException
+import functools
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
+from app.core.cache import ResultCache, get_result_cache
+from app.core.responses import FastJSONResponse, report_response
+from app.core.rows import Row, row_model
+from app.core.currency import to_optional_list
+from app.core.export import export_response
+from app.core.pagination import SortKey, next_cursor, order_by_clause, page_clause, seek_clause
+from app.core.totals import fetch_page_with_total
+from app.core.normalize import end_day_validator, id_list_validator
+from app.db.bigquery import get_bigquery_client
+from app.db.dimensions import Dimensions, DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.query_builder import FilterSet, QueryTemplate
+from app.db.results import Column, fetch_arrays, rows_from_columns, to_list
 from datetime import date, datetime
 
 router = APIRouter()
@@ -15,22 +30,56 @@ class DailyProductReportParams(BaseModel):
     online_start_date: Optional[datetime] = None
     online_end_date: Optional[datetime] = None
     site_ids: Optional[str] = None  # 新增：逗号分隔的site_id字符串
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传入时忽略 page
+    include_total: bool = True  # false 时不计算总数
+    estimate_total: bool = False  # true 时总数未缓存则先返回估计值
+    explain: bool = False  # true 时只返回预估扫描量和执行计划，不执行查询
+
+    _normalize_end_date = end_day_validator("end_date")
+    _normalize_site_ids = id_list_validator("site_ids")
 
 # Response model
 class DailyProductReportResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_estimated: bool = False
     result: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    explain: Optional[Dict[str, Any]] = None
 
-# Query function
-def query_daily_product_report(params: DailyProductReportParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+# One report row: the page query's columns plus the site fields from the
+# dimension tables, with their types declared up front
+@row_model
+class DailyProductRow(Row):
+    spu: Optional[str]
+    order_date: Optional[date]
+    order_month: Optional[str]
+    total_purchase_quantity: Optional[int]
+    total_order_amount_original: Optional[float]
+    online_time: Optional[str]
+    link: Optional[str]
+    product_img: Optional[str]
+    product_title: Optional[str]
+    marketing_expenses: Optional[str]
+    procurement_ratio: Optional[str]
+    refund_ratio: Optional[str]
+    site_id: Optional[int]
+    total_order_amount: Optional[float]
+    site_name: Optional[str]
+    site_type: Any
+    currency: Optional[str]
+    department_name: Optional[str]
 
-    # Calculate offset
-    offset = (params.page - 1) * params.limit
+# Keyset ordering of the report; one row per (order_date, spu, site_id),
+# so the last two keys break ties
+SORT_KEYS = [
+    SortKey("order_date", "DATE"),
+    SortKey("total_order_amount_original", "FLOAT64"),
+    SortKey("spu", "STRING"),
+    SortKey("site_id", "INT64"),
+]
 
-    # Base query
-    base_query = """
+# Filtered main_query CTE shared by the page, count and export queries
+MAIN_QUERY = QueryTemplate("daily_product_report", """
         WITH main_query AS (
             SELECT 
                 dps.product_id AS spu,
@@ -42,112 +91,155 @@ def query_daily_product_report(params: DailyProductReportParams) -> Dict[str, An
                 CONCAT(IF(INSTR(dps.link, 'https') > 0, '', 'https://'), dps.link) AS link,
                 g.main_image AS product_img,
                 g.title AS product_title,
-                s.brand AS site_name,
-                s.site_type,
-                s.currency,
-                bd.department_name,
                 '-' AS marketing_expenses,
                 '-' AS procurement_ratio,
                 '-' AS refund_ratio,
-                CASE 
-                    WHEN s.currency = 'USD' THEN dps.total_order_amount 
-                    ELSE ROUND(dps.total_order_amount * er.rate_to_cny / er_usd.rate_to_cny, 2) 
-                END AS total_order_amount
+                dps.site_id,
+                dps.total_order_amount
             FROM 
                 `allwebi.mv_daily_product_sales` AS dps 
-            LEFT JOIN 
-                `allwebi.tb_sites` AS s 
-                ON dps.site_id = s.site_id 
-            LEFT JOIN 
-                `allwebi.tb_brand_department` AS bd 
-                ON s.brand_department_id = bd.id 
             LEFT JOIN 
                 `allwebi.tb_goods` AS g 
                 ON dps.product_id = g.p_id 
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er  -- add this join
-                ON s.currency = er.currency_symbol AND dps.order_month = er.exchange_date 
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er_usd  -- add this join
-                ON 'USD' = er_usd.currency_symbol AND dps.order_month = er_usd.exchange_date 
-            {where_clause}
-            ORDER BY 
-                dps.order_date DESC,
-                dps.total_order_amount DESC
+            WHERE TRUE
+            {where}
         )
-        SELECT *, (SELECT COUNT(*) FROM main_query) AS total_records
-        FROM main_query
-        LIMIT {limit} OFFSET {offset}
-    """
-
-    # Construct WHERE clause
-    where_conditions = []
-    if params.start_date:
-        where_conditions.append("CAST(dps.order_date AS DATE) >= @start_date")
-    if params.end_date:
-        where_conditions.append("CAST(dps.order_date AS DATE) <= @end_date")
-    if params.online_start_date:
-        where_conditions.append("""
-            (dps.latest_online_time != '' AND 
+    """, {
+    "start_date": {"where": "AND CAST(dps.order_date AS DATE) >= @start_date"},
+    "end_date": {"where": "AND CAST(dps.order_date AS DATE) <= @end_date"},
+    "online_start_date": {"where": """AND (dps.latest_online_time != '' AND 
              SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) IS NOT NULL AND 
-             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) >= @online_start_date)
-        """)
-    if params.online_end_date:
-        where_conditions.append("""
-            (dps.latest_online_time != '' AND 
+             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) >= @online_start_date)"""},
+    "online_end_date": {"where": """AND (dps.latest_online_time != '' AND 
              SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) IS NOT NULL AND 
-             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) <= @online_end_date)
-        """)
-    if params.site_ids:
-        site_ids = [id.strip() for id in params.site_ids.split(',')]
-        where_conditions.append(f"dps.site_id IN UNNEST(@site_ids)")
-    
-    where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-    
-    # Format the query with the WHERE clause and pagination
-    query = base_query.format(
-        where_clause=where_clause,
-        limit=params.limit,
-        offset=offset
-    )
+             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', dps.latest_online_time) <= @online_end_date)"""},
+    "site_ids": {"where": "AND dps.site_id IN UNNEST(@site_ids)"},
+})
 
-    # Set up query parameters
-    query_params = []
+def build_main_query(params: DailyProductReportParams) -> Tuple[str, List[Any]]:
+    filters = FilterSet()
     if params.start_date:
-        query_params.append(bigquery.ScalarQueryParameter("start_date", "DATE", params.start_date))
+        filters.add("start_date", bigquery.ScalarQueryParameter("start_date", "DATE", params.start_date))
     if params.end_date:
-        query_params.append(bigquery.ScalarQueryParameter("end_date", "DATE", params.end_date))
+        filters.add("end_date", bigquery.ScalarQueryParameter("end_date", "DATE", params.end_date))
     if params.online_start_date:
-        query_params.append(bigquery.ScalarQueryParameter("online_start_date", "TIMESTAMP", params.online_start_date))
+        filters.add("online_start_date", bigquery.ScalarQueryParameter("online_start_date", "TIMESTAMP", params.online_start_date))
     if params.online_end_date:
-        query_params.append(bigquery.ScalarQueryParameter("online_end_date", "TIMESTAMP", params.online_end_date))
+        filters.add("online_end_date", bigquery.ScalarQueryParameter("online_end_date", "TIMESTAMP", params.online_end_date))
     if params.site_ids:
         site_ids = [int(id.strip()) for id in params.site_ids.split(',')]
-        query_params.append(bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+        filters.add("site_ids", bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+
+    return MAIN_QUERY.render(filters.active), filters.params
+
+# Site, department and USD amount come from the in-memory dimension tables
+def enrich_columns(columns: Dict[str, Column], dims: Dimensions) -> None:
+    # site_id 是游标排序键，保留在结果中
+    sites = [dims.site_fields(site_id) for site_id in to_list(columns.get("site_id", []))]
+    for field in ("site_name", "site_type", "currency", "department_name"):
+        columns[field] = [site[field] for site in sites]
 
+    # 整页一次性换算成美元
+    amounts = dims.exchange_rates.convert_to_usd(
+        columns["total_order_amount"], columns["currency"], columns["order_month"]
+    )
+    columns["total_order_amount"] = to_optional_list(amounts)
+
+# Page query: one page of rows in keyset order
+def page_query(params: DailyProductReportParams) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params)
+
+    # Cursor requests seek past the last row instead of using an offset
+    seek, cursor_params = seek_clause(params.cursor, SORT_KEYS)
+    limit_clause, page_params = page_clause(params.cursor, params.page, params.limit)
+
+    query = main_query + f"""
+        SELECT *
+        FROM main_query
+        {seek}
+        {order_by_clause(SORT_KEYS)}
+        {limit_clause}
+    """
+    return query, query_params + cursor_params + page_params
+
+# Count query: total rows for the filter set, independent of the page
+def count_query(params: DailyProductReportParams) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params)
+    return main_query + "SELECT COUNT(*) AS total_records FROM main_query", query_params
+
+# Queries one request runs, for the dry-run preflight
+def plan_daily_product_report(params: DailyProductReportParams, client: bigquery.Client) -> Dict[str, Tuple[str, List[Any]]]:
+    return {"page": page_query(params), "count": count_query(params)}
+
+# Query function: one page of rows
+def query_daily_product_report(params: DailyProductReportParams, client: bigquery.Client, dimensions: DimensionStore) -> Dict[str, Any]:
+    job_config = query_job_config("daily_product_report")
+    query, query_params = page_query(params)
     job_config.query_parameters = query_params
 
     # Execute the query
     query_job = client.query(query, job_config=job_config)
 
     # Process the query results
-    rows = [dict(row) for row in query_job]
-
-    if rows:
-        total_records = rows[0].get('total_records', 0)
-    else:
-        total_records = 0
+    columns = fetch_arrays(query_job)
+    enrich_columns(columns, dimensions.get(client))
+    rows = rows_from_columns(columns, DailyProductRow)
 
     return {
-        "total": total_records,
-        "result": rows
+        "result": rows,
+        "next_cursor": next_cursor(rows, SORT_KEYS, params.limit)
     }
 
-@router.post("/daily-product-report", response_model=DailyProductReportResponse)
-async def daily_product_report(params: DailyProductReportParams):
+# Count function
+def count_daily_product_report(params: DailyProductReportParams, client: bigquery.Client) -> int:
+    job_config = query_job_config("daily_product_report")
+    query, query_params = count_query(params)
+    job_config.query_parameters = query_params
+
+    rows = list(client.query(query, job_config=job_config).result())
+
+    return rows[0].total_records if rows else 0
+
+# Export query: every row of the report in page order, started but not read
+def start_daily_product_report_export(params: DailyProductReportParams, client: bigquery.Client) -> bigquery.QueryJob:
+    job_config = query_job_config("daily_product_report")
+    main_query, query_params = build_main_query(params)
+    job_config.query_parameters = query_params
+
+    query = main_query + f"""
+        SELECT *
+        FROM main_query
+        {order_by_clause(SORT_KEYS)}
+    """
+    return client.query(query, job_config=job_config)
+
+@router.post("/daily-product-report", response_model=DailyProductReportResponse, response_class=FastJSONResponse)
+async def daily_product_report(params: DailyProductReportParams, request: Request, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), dimensions: DimensionStore = Depends(get_dimension_store)):
     try:
-        response_data = query_daily_product_report(params)
+        response_data = await fetch_page_with_total(
+            "daily_product_report", params,
+            functools.partial(query_daily_product_report, dimensions=dimensions), count_daily_product_report,
+            cache, executor, client, plan=plan_daily_product_report,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return response_data
\ No newline at end of file
+    return report_response(request, response_data, DailyProductRow)
+
+# Streams the whole report as NDJSON or CSV; page, limit and cursor are ignored
+@router.post("/daily-product-report/export")
+async def export_daily_product_report(params: DailyProductReportParams, request: Request, format: str = "ndjson", client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), dimensions: DimensionStore = Depends(get_dimension_store)):
+    try:
+        dims = await executor.run(dimensions.get, client)
+        return await export_response(
+            request, executor,
+            functools.partial(start_daily_product_report_export, params, client),
+            format, "daily-product-report",
+            transform=functools.partial(enrich_columns, dims=dims),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Optional
+from google.cloud import bigquery
+from app.api.endpoints.product_sales_analysis_spu import DailyProductReportParams as ProductSalesAnalysisSpuParams, product_sales_analysis_spu_data
+from app.api.endpoints.product_sales_report import ProductSalesReportParams, product_sales_report_data
+from app.api.endpoints.product_sales_summary import ProductSalesSummaryParams, product_sales_summary_data
+from app.api.endpoints.top_products import TopProductsRequest, top_products_data
+from app.core.cache import ResultCache, get_result_cache, make_cache_key
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.snapshots import SnapshotStore, get_snapshot_store
+from app.db.bigquery import get_bigquery_client
+from app.db.dimensions import DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.rollup import RollupStore, get_rollup_store
+from app.db.search_index import SearchIndexStore, get_search_index
+
+router = APIRouter()
+
+# One sub-report: ``report`` is the path of the standalone endpoint and
+# ``params`` its usual request body
+class DashboardPart(BaseModel):
+    name: Optional[str] = None
+    report: str
+    params: Dict[str, Any] = {}
+
+class DashboardRequest(BaseModel):
+    parts: List[DashboardPart]
+
+class DashboardResponse(BaseModel):
+    parts: List[Dict[str, Any]]
+    elapsed_ms: float
+
+# Dependencies of the sub-reports, resolved once for the whole dashboard
+class DashboardContext:
+    def __init__(self, client, executor, cache, dimensions, snapshots, rollup, search):
+        self.client = client
+        self.executor = executor
+        self.cache = cache
+        self.dimensions = dimensions
+        self.snapshots = snapshots
+        self.rollup = rollup
+        self.search = search
+
+# report -> (request model, loader)
+REPORTS = {
+    "top-products": (
+        TopProductsRequest,
+        lambda params, ctx: top_products_data(params, ctx.client, ctx.executor, ctx.cache, ctx.rollup),
+    ),
+    "product-sales-report": (
+        ProductSalesReportParams,
+        lambda params, ctx: product_sales_report_data(params, ctx.client, ctx.executor, ctx.cache, ctx.dimensions, ctx.rollup),
+    ),
+    "product-sales-summary": (
+        ProductSalesSummaryParams,
+        lambda params, ctx: product_sales_summary_data(params, ctx.client, ctx.executor, ctx.cache, ctx.rollup),
+    ),
+    "product-sales-analysis-spu": (
+        ProductSalesAnalysisSpuParams,
+        lambda params, ctx: product_sales_analysis_spu_data(params, ctx.client, ctx.executor, ctx.cache, ctx.snapshots, ctx.dimensions, ctx.search),
+    ),
+}
+
+# Runs one part and turns any failure into that part's status, so one bad
+# sub-report does not fail the whole dashboard
+async def run_part(loader, params: BaseModel, ctx: DashboardContext) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        part = {"status": 200, "data": await loader(params, ctx)}
+    except HTTPException as e:
+        part = {"status": e.status_code, "error": e.detail}
+    except Exception as e:
+        part = {"status": 400, "error": str(e)}
+    part["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return part
+
+@router.post("/dashboard", response_model=DashboardResponse, response_class=FastJSONResponse)
+async def dashboard(request: DashboardRequest, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), dimensions: DimensionStore = Depends(get_dimension_store), snapshots: SnapshotStore = Depends(get_snapshot_store), rollup: Optional[RollupStore] = Depends(get_rollup_store), search: Optional[SearchIndexStore] = Depends(get_search_index)):
+    if len(request.parts) > settings.dashboard_max_parts:
+        raise HTTPException(status_code=400, detail=f"At most {settings.dashboard_max_parts} parts per dashboard")
+
+    started = time.perf_counter()
+    ctx = DashboardContext(client, executor, cache, dimensions, snapshots, rollup, search)
+
+    # 相同的子报表只执行一次
+    tasks: Dict[str, asyncio.Task] = {}
+    parts: List[Any] = []
+    for part in request.parts:
+        if part.report not in REPORTS:
+            parts.append({"status": 404, "error": f"Unknown report: {part.report}"})
+            continue
+        model, loader = REPORTS[part.report]
+        try:
+            params = model(**part.params)
+        except ValidationError as e:
+            parts.append({"status": 422, "error": [{"loc": err["loc"], "msg": err["msg"]} for err in e.errors()]})
+            continue
+        key = make_cache_key(part.report, params)
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(run_part(loader, params, ctx))
+        parts.append(tasks[key])
+
+    if tasks:
+        await asyncio.gather(*tasks.values())
+
+    result = []
+    for part, outcome in zip(request.parts, parts):
+        if isinstance(outcome, asyncio.Task):
+            outcome = outcome.result()
+        result.append({"name": part.name or part.report, "report": part.report, **outcome})
+
+    return FastJSONResponse({
+        "parts": result,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
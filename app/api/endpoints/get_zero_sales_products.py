@@ -1,7 +1,24 @@
-from fastapi import APIRouter, HTTPException, FastAPI
+import functools
+from fastapi import APIRouter, Depends, HTTPException, FastAPI, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import settings
+from app.core.responses import FastJSONResponse, report_response
+from app.core.rows import Row, row_model
+from app.core.export import export_response
+from app.core.pagination import SortKey, decode_cursor, next_cursor, order_by_clause, page_clause, seek_clause
+from app.core.totals import fetch_page_with_total
+from app.core.normalize import day_validator, end_day_validator, id_list_validator, tag_list_validator
+from app.db.bigquery import get_bigquery_client
+from app.db.dimensions import DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.query_builder import FilterSet, QueryTemplate
+from app.db.results import fetch_arrays, rows_from_columns, to_list
+from app.db.search_index import SearchIndexStore, get_search_index, resolve_searches
+from app.db.zero_sales import ZeroSalesIndex, ZeroSalesIndexStore, get_zero_sales_index
 from datetime import date, datetime
 
 router = APIRouter()
@@ -18,22 +35,44 @@ class GetZeroSalesProductsParams(BaseModel):
     title_search: Optional[str] = None
     tag_search: Optional[str] = None
     custom_tag_search: Optional[str] = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传入时忽略 page
+    include_total: bool = True  # false 时不计算总数
+    estimate_total: bool = False  # true 时总数未缓存则先返回估计值
+    explain: bool = False  # true 时只返回预估扫描量和执行计划，不执行查询
+
+    _normalize_days = day_validator("start_date", "online_start_date", "online_end_date")
+    _normalize_end_date = end_day_validator("end_date")
+    _normalize_site_ids = id_list_validator("site_ids")
+    _normalize_tags = tag_list_validator("tag_search", "custom_tag_search")
 
 # 响应模型
 class GetZeroSalesProductsResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_estimated: bool = False
     result: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    explain: Optional[Dict[str, Any]] = None
 
-# 查询函数
-def query_get_zero_sales_products(params: GetZeroSalesProductsParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+# 结果行：SQL 和索引两条路径输出相同的列，类型预先声明
+@row_model
+class ZeroSalesProductRow(Row):
+    product_id: Optional[str]
+    product_title: Optional[str]
+    online_time: Optional[str]
+    create_time: Any
+    product_img: Optional[str]
+    tags: Optional[str]
+    site_name: Optional[str]
+    department_name: Optional[str]
 
-    # 计算偏移量
-    offset = (params.page - 1) * params.limit
+# 游标分页的排序键，product_id 保证唯一
+SORT_KEYS = [
+    SortKey("online_time", "STRING"),
+    SortKey("product_id", "STRING"),
+]
 
-    # 基础查询
-    base_query = """
+# 分页、计数和导出共用的 main_query，筛选值全部走查询参数
+MAIN_QUERY = QueryTemplate("get_zero_sales_products", """
         WITH main_query AS (
             SELECT p.p_id as product_id,p.title as product_title,p.online_time,p.create_time,p.main_image as product_img,p.tags,s.brand AS site_name, bd.department_name AS department_name
 FROM `allwebi.tb_goods` p
@@ -42,134 +81,223 @@ LEFT JOIN
                 `allwebi.tb_sites` AS s ON s.site_id = p.site_id
             LEFT JOIN 
                 `allwebi.tb_brand_department` AS bd ON s.brand_department_id = bd.id 
-            LEFT JOIN 
-            `allwebi.tb_goods_tag` AS gt ON gt.product_spu = p.p_id 
 WHERE sp.product_id IS NULL
-        {create_time_filter}
-        {site_id_filter}
-        {title_search_filter}
-        {tag_search_filter}
-        {online_time_filter}
-        {custom_tag_filter}
+            {where}
         )
-        SELECT 
-            main_query.*,
-            (SELECT COUNT(*) FROM main_query) AS total_records
-        FROM 
-            main_query
-        ORDER BY 
-            online_time DESC
-        LIMIT {limit} OFFSET {offset}
-    """
+    """, {
+    "start_date": {"where": "AND DATE(p.create_time) >= @start_date"},
+    "end_date": {"where": "AND DATE(p.create_time) <= @end_date"},
+    "site_ids": {"where": "AND p.site_id IN UNNEST(@site_ids)"},
+    "title_search": {"where": "AND REGEXP_CONTAINS(p.title, CONCAT('(?i)', @title_search))"},
+    "tag_search": {"where": "AND REGEXP_CONTAINS(p.tags, @tag_search_regex)"},
+    "online_start_date": {"where": "AND p.online_time != '' AND DATE(p.online_time) >= @online_start_date"},
+    "online_end_date": {"where": "AND p.online_time != '' AND DATE(p.online_time) <= @online_end_date"},
+    # 自定义标签用 EXISTS 过滤，一个商品有多个标签时不会重复出现
+    "custom_tag_search": {"where": """AND EXISTS (
+                SELECT 1 FROM `allwebi.tb_goods_tag` AS gt
+                WHERE gt.product_spu = p.p_id AND REGEXP_CONTAINS(gt.tag, @custom_tag_search_regex))"""},
+    # 倒排索引解析出的搜索结果
+    "search_product_ids": {"where": "AND p.p_id IN UNNEST(@search_product_ids)"},
+})
 
-    create_time_filter = ""
-    if params.start_date and params.end_date:
-        start_date = datetime.strptime(params.start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(params.end_date, "%Y-%m-%d").date()
-        create_time_filter = "AND DATE(p.create_time) BETWEEN '{start_date}' AND '{end_date}'".format(
-            start_date=start_date,
-            end_date=end_date
-        )
-    elif params.start_date:
+# 逗号分隔的标签拼成不区分大小写的正则
+def tag_regex(value: str) -> str:
+    return r'(?i)(' + '|'.join(value.split(',')) + ')'
+
+# 搜索条件 -> (索引字段, 搜索词)
+def search_filters(params: GetZeroSalesProductsParams) -> Dict[str, Tuple[str, List[str]]]:
+    searches = {}
+    if params.title_search:
+        searches["title_search"] = ("title", [params.title_search])
+    if params.tag_search:
+        searches["tag_search"] = ("tags", params.tag_search.split(','))
+    if params.custom_tag_search:
+        searches["custom_tag_search"] = ("tag", params.custom_tag_search.split(','))
+    return searches
+
+def build_main_query(params: GetZeroSalesProductsParams, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    filters = FilterSet()
+    # 能由倒排索引解析的搜索条件换成商品 ID 数组，其余仍按正则过滤
+    product_ids, unresolved = resolve_searches(search, search_filters(params))
+    if product_ids is not None:
+        filters.add("search_product_ids", bigquery.ArrayQueryParameter("search_product_ids", "STRING", product_ids))
+    if params.start_date:
         start_date = datetime.strptime(params.start_date, "%Y-%m-%d").date()
-        create_time_filter = "AND DATE(p.create_time) >= '{start_date}'".format(
-            start_date=start_date
-        )
-    elif params.end_date:
+        filters.add("start_date", bigquery.ScalarQueryParameter("start_date", "DATE", start_date))
+    if params.end_date:
         end_date = datetime.strptime(params.end_date, "%Y-%m-%d").date()
-        create_time_filter = "AND DATE(p.create_time) <= '{end_date}'".format(
-            end_date=end_date
-        )
-
-    online_time_filter = ""
-    if params.online_start_date and params.online_end_date:
-        online_start_date = datetime.strptime(params.online_start_date, "%Y-%m-%d").date()
-        online_end_date = datetime.strptime(params.online_end_date, "%Y-%m-%d").date()
-        online_time_filter = "AND p.online_time != '' AND DATE(p.online_time) BETWEEN '{online_start_date}' AND '{online_end_date}'".format(
-            online_start_date=online_start_date,
-            online_end_date=online_end_date
-        )
-    elif params.online_start_date:
+        filters.add("end_date", bigquery.ScalarQueryParameter("end_date", "DATE", end_date))
+    if params.site_ids:
+        site_ids = [int(id.strip()) for id in params.site_ids.split(',')]
+        filters.add("site_ids", bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+    if "title_search" in unresolved:
+        filters.add("title_search", bigquery.ScalarQueryParameter("title_search", "STRING", params.title_search))
+    if "tag_search" in unresolved:
+        filters.add("tag_search", bigquery.ScalarQueryParameter("tag_search_regex", "STRING", tag_regex(params.tag_search)))
+    if params.online_start_date:
         online_start_date = datetime.strptime(params.online_start_date, "%Y-%m-%d").date()
-        online_time_filter = "AND p.online_time != '' AND DATE(p.online_time) >= '{online_start_date}'".format(
-            online_start_date=online_start_date
-        )
-    elif params.online_end_date:
+        filters.add("online_start_date", bigquery.ScalarQueryParameter("online_start_date", "DATE", online_start_date))
+    if params.online_end_date:
         online_end_date = datetime.strptime(params.online_end_date, "%Y-%m-%d").date()
-        online_time_filter = "AND p.online_time != '' AND DATE(p.online_time) <= '{online_end_date}'".format(
-            online_end_date=online_end_date
-        )
+        filters.add("online_end_date", bigquery.ScalarQueryParameter("online_end_date", "DATE", online_end_date))
+    if "custom_tag_search" in unresolved:
+        filters.add("custom_tag_search", bigquery.ScalarQueryParameter("custom_tag_search_regex", "STRING", tag_regex(params.custom_tag_search)))
 
-    site_id_filter = ""
-    if params.site_ids:
-        site_id_filter = "AND p.site_id IN UNNEST(@site_ids)"
+    return MAIN_QUERY.render(filters.active), filters.params
 
-    title_search_filter = ""
-    if params.title_search:
-        title_search_filter = "AND REGEXP_CONTAINS(p.title, CONCAT('(?i)', @title_search))"
+# 分页查询：只取一页
+def page_query(params: GetZeroSalesProductsParams, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params, search)
 
-    custom_tag_filter = ""
-    if params.custom_tag_search:
-        custom_tag_search_list = params.custom_tag_search.split(',')
-        custom_tag_search_regex = r'(?i)(' + '|'.join(custom_tag_search_list) + ')'
-        custom_tag_filter = "AND REGEXP_CONTAINS(gt.tag, '{custom_tag_search_regex}')".format(
-            custom_tag_search_regex=custom_tag_search_regex
-        )
-        # custom_tag_filter = "AND REGEXP_CONTAINS(gt.tag, CONCAT('(?i)', @custom_tag_search))"
+    # 带游标时从上一页最后一行之后继续，否则按页码偏移
+    seek, cursor_params = seek_clause(params.cursor, SORT_KEYS)
+    limit_clause, page_params = page_clause(params.cursor, params.page, params.limit)
 
-    tag_search_filter = ""
-    if params.tag_search:
-        tag_search_list = params.tag_search.split(',')
-        tag_search_regex = r'(?i)(' + '|'.join(tag_search_list) + ')'
-        tag_search_filter = "AND REGEXP_CONTAINS(p.tags, '{tag_search_regex}')".format(
-            tag_search_regex=tag_search_regex
-        )
+    query = main_query + f"""
+        SELECT 
+            main_query.*
+        FROM 
+            main_query
+        {seek}
+        {order_by_clause(SORT_KEYS)}
+        {limit_clause}
+    """
+    return query, query_params + cursor_params + page_params
 
-    query = base_query.format(
-        limit=params.limit,
-        offset=offset,
-        create_time_filter=create_time_filter,
-        site_id_filter=site_id_filter,
-        title_search_filter=title_search_filter,
-        tag_search_filter=tag_search_filter,
-        online_time_filter=online_time_filter,
-        custom_tag_filter=custom_tag_filter
-    )
+# 计数查询：同一组筛选条件的总数，与页码无关
+def count_query(params: GetZeroSalesProductsParams, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params, search)
+    return main_query + "SELECT COUNT(*) AS total_records FROM main_query", query_params
 
-    query_params = []
-    if params.site_ids:
-        site_ids = [int(id.strip()) for id in params.site_ids.split(',')]
-        query_params.append(bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
-    if params.title_search:
-        query_params.append(bigquery.ScalarQueryParameter("title_search", "STRING", params.title_search))
-    if params.tag_search:
-        query_params.append(bigquery.ScalarQueryParameter("tag_search", "STRING", params.tag_search))
-    if params.custom_tag_search:
-        query_params.append(bigquery.ScalarQueryParameter("custom_tag_search", "STRING", params.custom_tag_search))
+# 一次请求会执行的查询，供 dry run 预估
+def plan_get_zero_sales_products(params: GetZeroSalesProductsParams, client: bigquery.Client, search: Optional[SearchIndexStore] = None) -> Dict[str, Tuple[str, List[Any]]]:
+    return {"page": page_query(params, search), "count": count_query(params, search)}
 
+# 查询函数：只取一页
+def query_get_zero_sales_products(params: GetZeroSalesProductsParams, client: bigquery.Client, search: Optional[SearchIndexStore] = None) -> Dict[str, Any]:
+    job_config = query_job_config("get_zero_sales_products")
+    query, query_params = page_query(params, search)
     job_config.query_parameters = query_params
 
     # 执行查询
     query_job = client.query(query, job_config=job_config)
 
     # 处理查询结果
-    rows = [dict(row) for row in query_job]
+    rows = rows_from_columns(fetch_arrays(query_job), ZeroSalesProductRow)
+
+    return {
+        "result": rows,
+        "next_cursor": next_cursor(rows, SORT_KEYS, params.limit)
+    }
+
+# 计数函数
+def count_get_zero_sales_products(params: GetZeroSalesProductsParams, client: bigquery.Client, search: Optional[SearchIndexStore] = None) -> int:
+    job_config = query_job_config("get_zero_sales_products")
+    query, query_params = count_query(params, search)
+    job_config.query_parameters = query_params
+
+    rows = list(client.query(query, job_config=job_config).result())
+
+    return rows[0].total_records if rows else 0
+
+# 导出查询：按分页顺序返回全部结果，只提交不读取
+def start_get_zero_sales_products_export(params: GetZeroSalesProductsParams, client: bigquery.Client, search: Optional[SearchIndexStore] = None) -> bigquery.QueryJob:
+    job_config = query_job_config("get_zero_sales_products")
+    main_query, query_params = build_main_query(params, search)
+    job_config.query_parameters = query_params
 
-    if rows:
-        total_records = rows[0].get('total_records', 0)
-    else:
-        total_records = 0
+    query = main_query + f"""
+        SELECT 
+            main_query.*
+        FROM 
+            main_query
+        {order_by_clause(SORT_KEYS)}
+    """
+    return client.query(query, job_config=job_config)
+
+def _day(value: Optional[str]) -> Optional[date]:
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+# 一页商品的详情，只按主键读取这一页
+DETAILS_QUERY = """
+    SELECT p.p_id as product_id,p.title as product_title,p.online_time,p.create_time,p.main_image as product_img,p.tags,p.site_id
+    FROM `allwebi.tb_goods` p
+    WHERE p.p_id IN UNNEST(@product_ids)
+"""
+
+# 索引查询：筛选、排序、分页和总数都在本地位图上完成，BigQuery 只读取一页详情；
+# 搜索条件无法由倒排索引解析、或游标对应的商品不在当前快照中时返回 None
+def query_get_zero_sales_products_indexed(params: GetZeroSalesProductsParams, client: bigquery.Client, index: ZeroSalesIndex, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> Optional[Dict[str, Any]]:
+    searches = search_filters(params)
+    product_ids, unresolved = resolve_searches(search, searches)
+    if unresolved:
+        return None
+
+    positions = index.unsold_positions(
+        product_ids=product_ids,
+        site_ids=[int(id) for id in params.site_ids.split(',')] if params.site_ids else None,
+        create_range=(_day(params.start_date), _day(params.end_date)) if params.start_date or params.end_date else None,
+        online_range=(_day(params.online_start_date), _day(params.online_end_date)) if params.online_start_date or params.online_end_date else None,
+    )
+    after = decode_cursor(params.cursor, SORT_KEYS)[-1] if params.cursor else None
+    product_ids = index.page(positions, params.limit, offset=(params.page - 1) * params.limit, after=after)
+    if product_ids is None:
+        return None
+
+    rows = []
+    if product_ids:
+        job_config = query_job_config("get_zero_sales_products")
+        job_config.query_parameters = [bigquery.ArrayQueryParameter("product_ids", "STRING", product_ids)]
+        columns = fetch_arrays(client.query(DETAILS_QUERY, job_config=job_config))
+
+        dims = dimensions.get(client)
+        sites = [dims.site_fields(site_id) for site_id in to_list(columns.get("site_id", []))]
+        columns["site_name"] = [site["site_name"] for site in sites]
+        columns["department_name"] = [site["department_name"] for site in sites]
+        details = {row.product_id: row for row in rows_from_columns(columns, ZeroSalesProductRow)}
+        # 按索引的顺序输出；快照之后被删除的商品跳过
+        rows = [details[product_id] for product_id in product_ids if product_id in details]
 
     return {
-        "total": total_records,
-        "result": rows
+        "total": len(positions) if params.include_total else None,
+        "total_estimated": False,
+        "result": rows,
+        "next_cursor": next_cursor(rows, SORT_KEYS, params.limit),
     }
 
-@router.post("/get-zero-sales-products", response_model=GetZeroSalesProductsResponse)
-async def get_zero_sales_products(params: GetZeroSalesProductsParams):
+@router.post("/get-zero-sales-products", response_model=GetZeroSalesProductsResponse, response_class=FastJSONResponse)
+async def get_zero_sales_products(params: GetZeroSalesProductsParams, request: Request, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), zero_sales_index: Optional[ZeroSalesIndexStore] = Depends(get_zero_sales_index), dimensions: DimensionStore = Depends(get_dimension_store), search: Optional[SearchIndexStore] = Depends(get_search_index)):
     try:
-        response_data = query_get_zero_sales_products(params)
+        response_data = None
+        # 索引过旧（刷新一直失败）时与没有索引一样走 SQL
+        index = zero_sales_index.fresh(settings.zero_sales_index_max_age) if zero_sales_index is not None else None
+        # explain 需要 dry run，始终走 SQL
+        if index is not None and not params.explain:
+            response_data = await executor.run(query_get_zero_sales_products_indexed, params, client, index, dimensions, search)
+        if response_data is None:
+            response_data = await fetch_page_with_total(
+                "get_zero_sales_products", params,
+                functools.partial(query_get_zero_sales_products, search=search),
+                functools.partial(count_get_zero_sales_products, search=search),
+                cache, executor, client, plan=functools.partial(plan_get_zero_sales_products, search=search),
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return response_data
\ No newline at end of file
+    return report_response(request, response_data, ZeroSalesProductRow)
+
+# 以 NDJSON 或 CSV 流式导出全部结果，忽略 page、limit 和 cursor
+@router.post("/get-zero-sales-products/export")
+async def export_get_zero_sales_products(params: GetZeroSalesProductsParams, request: Request, format: str = "ndjson", client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), search: Optional[SearchIndexStore] = Depends(get_search_index)):
+    try:
+        return await export_response(
+            request, executor,
+            functools.partial(start_get_zero_sales_products_export, params, client, search),
+            format, "zero-sales-products",
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
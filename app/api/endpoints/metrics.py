@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.core.metrics import metrics_response
+
+router = APIRouter()
+
+# Prometheus scrape endpoint
+@router.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    return metrics_response()
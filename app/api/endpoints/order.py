@@ -1,34 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict
-from pydantic import BaseModel
-
-class Order(BaseModel):
-    id: int
-    item_name: str
-    item_price: float
-    quantity: int
-    total_price: float
-
-# 固定数据
-orders_db: List[Order] = [
-    Order(id=1, item_name="Item A", item_price=10.0, quantity=2, total_price=20.0),
-    Order(id=2, item_name="Item B", item_price=20.0, quantity=1, total_price=20.0)
-]
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from app.db.orders import Order, OrderRepository, check_bulk_size, get_order_repository
 
 router = APIRouter()
 
 @router.post("/orders/", response_model=Order)
-def create_order(order: Order):
-    orders_db.append(order)
-    return order
+def create_order(order: Order, orders: OrderRepository = Depends(get_order_repository)):
+    return orders.create(order)
+
+# 批量创建：整批校验，有重复 id 时整批拒绝
+@router.post("/orders/bulk", response_model=List[Order])
+def create_orders(batch: List[Order], orders: OrderRepository = Depends(get_order_repository)):
+    check_bulk_size(batch)
+    return orders.create_many(batch)
 
 @router.get("/orders/", response_model=List[Order])
-def read_orders(skip: int = 0, limit: int = 10):
-    return orders_db[skip: skip + limit]
+def read_orders(skip: int = 0, limit: int = 10, item_name: Optional[str] = None, orders: OrderRepository = Depends(get_order_repository)):
+    return orders.list(skip, limit, item_name)
 
 @router.get("/orders/{order_id}", response_model=Order)
-def read_order(order_id: int):
-    for order in orders_db:
-        if order.id == order_id:
-            return order
-    raise HTTPException(status_code=404, detail="Order not found")
\ No newline at end of file
+def read_order(order_id: int, orders: OrderRepository = Depends(get_order_repository)):
+    order = orders.get(order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
@@ -1,7 +1,23 @@
-from fastapi import APIRouter, HTTPException
+import functools
+from datetime import datetime, timezone
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
+from app.core.currency import round_half_away, to_float_array, to_optional_list
+from app.core.pagination import SortKey, next_cursor, order_by_clause, page_clause, seek_clause
+from app.core.cache import ResultCache, get_result_cache
+from app.core.responses import FastJSONResponse, report_response
+from app.core.rows import Row, row_model
+from app.core.totals import fetch_page_with_total
+from app.core.normalize import id_list_validator
+from app.db.bigquery import get_bigquery_client
+from app.db.dimensions import Dimensions, DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.query_builder import FilterSet, QueryTemplate
+from app.db.results import Column, column_count, fetch_arrays, rows_from_columns
 
 
 router = APIRouter()
@@ -20,55 +36,54 @@ class QueryParams(BaseModel):
     site_id: str = None
     online_time_start: str = None
     online_time_end: str = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传入时忽略 page
+    include_total: bool = True  # false 时不计算总数
+    estimate_total: bool = False  # true 时总数未缓存则先返回估计值
+    explain: bool = False  # true 时只返回预估扫描量和执行计划，不执行查询
+
+    _normalize_ids = id_list_validator("department_types", "site_id")
 
 # Response model
 class QueryResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_estimated: bool = False
     result: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    explain: Optional[Dict[str, Any]] = None
 
-# Query function
-def query_bigquery(params: QueryParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
-
-    try:
-        department_types = [int(dt.strip()) for dt in params.department_types.split(',') if dt.strip().isdigit()]
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid department_types parameter")
-
-    department_type_condition = ""
-    if department_types:
-        formatted_department_types = ','.join(map(str, department_types))
-        department_type_condition = f"AND bd.department_type IN ({formatted_department_types})"
-
-    brand_department_condition = ""
-    if params.brand_department_id:
-        brand_department_condition = f"AND s.brand_department_id = {params.brand_department_id}"
-
-    site_condition = ""
-    if params.site_id:
-        try:
-            site_ids = [int(id.strip()) for id in params.site_id.split(',') if id.strip().isdigit()]
-            if site_ids:
-                formatted_site_ids = ','.join(map(str, site_ids))
-                site_condition = f"AND oi.site_id IN ({formatted_site_ids})"
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid site_id parameter")
-
-    online_time_condition = ""
-    if params.online_time_start and params.online_time_end:
-        online_time_condition = f"AND oi.online_time BETWEEN '{params.online_time_start}' AND '{params.online_time_end}'"
-
-    date_today_condition = ""
-    if params.start_date_today and params.end_date_today:
-        date_today_condition = f"AND oi.order_created_at BETWEEN '{params.start_date_today}' AND '{params.end_date_today}'"
+# One result row: the results CTE without currency, plus rate_to_cny and
+# product_multiplier computed from the in-memory exchange rates
+@row_model
+class ProductAnalysisRow(Row):
+    spu: Optional[str]
+    product_title: Optional[str]
+    link: Optional[str]
+    online_time: Optional[str]
+    total_order_amount: Optional[float]
+    site_id: Optional[int]
+    total_purchase_quantity: Optional[int]
+    sales_growth_rate: Optional[int]
+    revenue_growth_rate: Optional[float]
+    site_name: Optional[str]
+    product_img: Optional[str]
+    department_name: Optional[str]
+    original_price: Optional[float]
+    purchase_price: Optional[float]
+    buyer: Optional[str]
+    sales_growth_rate_b: Optional[float]
+    rate_to_cny: Optional[float]
+    product_multiplier: Optional[str]
 
-    date_yesterday_condition = ""
-    if params.start_date_yesterday and params.end_date_yesterday:
-        date_yesterday_condition = f"AND oi.order_created_at BETWEEN '{params.start_date_yesterday}' AND '{params.end_date_yesterday}'"
+# Keyset ordering; spu + site_id identify a row
+SORT_KEYS = [
+    SortKey("total_purchase_quantity", "FLOAT64"),
+    SortKey("spu", "STRING"),
+    SortKey("site_id", "INT64"),
+]
 
-    # 定义 BigQuery 查询
-    query = f"""
+# today/yesterday/results CTEs shared by the page and count queries; the
+# date strings are STRING parameters, coerced like the former literals
+RESULTS_QUERY = QueryTemplate("product_analysis", """
         WITH today AS (
             SELECT 
                 oi.sku,
@@ -90,11 +105,7 @@ def query_bigquery(params: QueryParams) -> Dict[str, Any]:
             LEFT JOIN `allwebi.tb_sites` as s ON oi.site_id = s.site_id
             LEFT JOIN `allwebi.tb_brand_department` as bd ON s.brand_department_id = bd.id
             WHERE 1=1 
-            {date_today_condition}
-            {department_type_condition}
-            {brand_department_condition}
-            {site_condition}
-            {online_time_condition}
+            {today}
             GROUP BY oi.sku, oi.site_id
         ),
         yesterday AS (
@@ -105,9 +116,7 @@ def query_bigquery(params: QueryParams) -> Dict[str, Any]:
                 SUM(oi.quantity) AS total_purchase_quantity_yesterday
             FROM `allwebi.tb_order_items` as oi
             WHERE 1=1 
-            {date_yesterday_condition}
-            {site_condition}
-            {online_time_condition}
+            {yesterday}
             GROUP BY oi.sku, oi.site_id
         ),
         results AS (
@@ -127,52 +136,155 @@ def query_bigquery(params: QueryParams) -> Dict[str, Any]:
                 today.original_price,
                 today.purchase_price,
                 today.buyer,
-                CASE
-                    WHEN today.purchase_price = 0 or today.original_price = 0 THEN '-'
-                    ELSE CAST(ROUND(today.original_price * er.rate_to_cny / (today.purchase_price + 4.16), 2) AS STRING)
-                END AS product_multiplier,
+                today.currency,
                 CASE
                     WHEN yesterday.total_order_amount_yesterday IS NOT NULL AND yesterday.total_order_amount_yesterday != 0
                     THEN ROUND(((today.total_order_amount_today - yesterday.total_order_amount_yesterday) / yesterday.total_order_amount_yesterday) * 100, 2)
                     ELSE NULL
-                END AS sales_growth_rate_b,
-                er.rate_to_cny
+                END AS sales_growth_rate_b
             FROM today
             LEFT JOIN yesterday
             ON today.sku = yesterday.sku and today.site_id = yesterday.site_id
-            LEFT JOIN `allwebi.tb_exchange_rates` AS er
-            ON today.currency = er.currency_symbol AND FORMAT_TIMESTAMP('%Y-%m', CURRENT_TIMESTAMP()) = er.exchange_date
         )
-        SELECT 
-            *,
-            (SELECT COUNT(*) FROM results) AS total_count
+    """, {
+    "date_today": {"today": "AND oi.order_created_at BETWEEN @start_date_today AND @end_date_today"},
+    "department_types": {"today": "AND bd.department_type IN UNNEST(@department_types)"},
+    "brand_department_id": {"today": "AND s.brand_department_id = @brand_department_id"},
+    "site_ids": {
+        "today": "AND oi.site_id IN UNNEST(@site_ids)",
+        "yesterday": "AND oi.site_id IN UNNEST(@site_ids)",
+    },
+    "online_time": {
+        "today": "AND oi.online_time BETWEEN @online_time_start AND @online_time_end",
+        "yesterday": "AND oi.online_time BETWEEN @online_time_start AND @online_time_end",
+    },
+    "date_yesterday": {"yesterday": "AND oi.order_created_at BETWEEN @start_date_yesterday AND @end_date_yesterday"},
+})
+
+def build_results_query(params: QueryParams) -> Tuple[str, List[Any]]:
+    filters = FilterSet()
+    if params.start_date_today and params.end_date_today:
+        filters.add(
+            "date_today",
+            bigquery.ScalarQueryParameter("start_date_today", "STRING", params.start_date_today),
+            bigquery.ScalarQueryParameter("end_date_today", "STRING", params.end_date_today),
+        )
+
+    department_types = [int(dt.strip()) for dt in params.department_types.split(',') if dt.strip().isdigit()]
+    if department_types:
+        filters.add("department_types", bigquery.ArrayQueryParameter("department_types", "INT64", department_types))
+
+    if params.brand_department_id:
+        filters.add("brand_department_id", bigquery.ScalarQueryParameter("brand_department_id", "INT64", params.brand_department_id))
+
+    if params.site_id:
+        site_ids = [int(id.strip()) for id in params.site_id.split(',') if id.strip().isdigit()]
+        if site_ids:
+            filters.add("site_ids", bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+
+    if params.online_time_start and params.online_time_end:
+        filters.add(
+            "online_time",
+            bigquery.ScalarQueryParameter("online_time_start", "STRING", params.online_time_start),
+            bigquery.ScalarQueryParameter("online_time_end", "STRING", params.online_time_end),
+        )
+
+    if params.start_date_yesterday and params.end_date_yesterday:
+        filters.add(
+            "date_yesterday",
+            bigquery.ScalarQueryParameter("start_date_yesterday", "STRING", params.start_date_yesterday),
+            bigquery.ScalarQueryParameter("end_date_yesterday", "STRING", params.end_date_yesterday),
+        )
+
+    return RESULTS_QUERY.render(filters.active), filters.params
+
+# rate_to_cny (current month) and product_multiplier for the whole page,
+# from the in-memory exchange rates instead of a tb_exchange_rates join
+def add_multipliers(columns: Dict[str, Column], dims: Dimensions) -> None:
+    count = column_count(columns)
+    currencies = columns.pop("currency", [])
+    month = datetime.now(timezone.utc).strftime("%Y-%m")
+    rates = dims.exchange_rates.cny_rates(currencies, [month] * count)
+    original = to_float_array(columns.get("original_price", []))
+    purchase = to_float_array(columns.get("purchase_price", []))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        multipliers = round_half_away(original * rates / (purchase + 4.16))
+    # 与原 SQL 一致：任一价格为 0 时显示 '-'
+    dash = (original == 0) | (purchase == 0)
+
+    columns["rate_to_cny"] = to_optional_list(rates)
+    columns["product_multiplier"] = [
+        "-" if is_dash else (None if np.isnan(value) else str(float(value)))
+        for is_dash, value in zip(dash, multipliers)
+    ]
+
+# Page query: one page of rows in keyset order
+def page_query(params: QueryParams) -> Tuple[str, List[Any]]:
+    # 游标分页：从上一页最后一行之后继续，不再使用 OFFSET
+    results_query, query_params = build_results_query(params)
+    seek, cursor_params = seek_clause(params.cursor, SORT_KEYS)
+    limit_clause, page_params = page_clause(params.cursor, params.page, params.limit)
+
+    query = results_query + f"""
+        SELECT *
         FROM results
-        ORDER BY total_purchase_quantity DESC
-        LIMIT {params.limit} OFFSET {(params.page - 1) * params.limit}
+        {seek}
+        {order_by_clause(SORT_KEYS)}
+        {limit_clause}
     """
+    return query, query_params + cursor_params + page_params
+
+# Count query: total rows for the filter set, independent of the page
+def count_query(params: QueryParams) -> Tuple[str, List[Any]]:
+    results_query, query_params = build_results_query(params)
+    return results_query + "SELECT COUNT(*) AS total_count FROM results", query_params
+
+# Queries one request runs, for the dry-run preflight
+def plan_bigquery(params: QueryParams, client: bigquery.Client) -> Dict[str, Tuple[str, List[Any]]]:
+    return {"page": page_query(params), "count": count_query(params)}
+
+# Query function: one page of rows
+def query_bigquery(params: QueryParams, client: bigquery.Client, dimensions: DimensionStore) -> Dict[str, Any]:
+    job_config = query_job_config("product_analysis")
+    query, query_params = page_query(params)
+    job_config.query_parameters = query_params
 
     query_job = client.query(query, job_config=job_config)
 
     # 处理查询结果
-    rows = [dict(row) for row in query_job]
-
-    if rows:
-        total_count = rows[0].get('total_count', 0)
-    else:
-        total_count = 0
+    columns = fetch_arrays(query_job)
+    add_multipliers(columns, dimensions.get(client))
+    rows = rows_from_columns(columns, ProductAnalysisRow)
 
     return {
-        "total": total_count,
-        "result": rows
+        "result": rows,
+        "next_cursor": next_cursor(rows, SORT_KEYS, params.limit)
     }
 
-@router.post("/product-analysis", response_model=QueryResponse)
-async def index(params: QueryParams):
+# Count function
+def count_bigquery(params: QueryParams, client: bigquery.Client) -> int:
+    job_config = query_job_config("product_analysis")
+    query, query_params = count_query(params)
+    job_config.query_parameters = query_params
+
+    rows = list(client.query(query, job_config=job_config).result())
+
+    return rows[0].total_count if rows else 0
+
+@router.post("/product-analysis", response_model=QueryResponse, response_class=FastJSONResponse)
+async def index(params: QueryParams, request: Request, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), dimensions: DimensionStore = Depends(get_dimension_store)):
     # 执行查询
     try:
-        response_data = query_bigquery(params)
+        response_data = await fetch_page_with_total(
+            "product_analysis", params,
+            functools.partial(query_bigquery, dimensions=dimensions), count_bigquery,
+            cache, executor, client, plan=plan_bigquery,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-    return response_data
\ No newline at end of file
+    return report_response(request, response_data, ProductAnalysisRow)
\ No newline at end of file
@@ -1,7 +1,24 @@
-from fastapi import APIRouter, HTTPException, FastAPI
+import functools
+from fastapi import APIRouter, Depends, HTTPException, FastAPI, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from google.cloud import bigquery
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import settings
+from app.core.responses import FastJSONResponse, report_response
+from app.core.rows import Row, row_model
+from app.core.pagination import SortKey, next_cursor, order_by_clause, page_clause, seek_clause
+from app.core.snapshots import SnapshotStore, check_snapshot_size, get_snapshot_store
+from app.core.totals import fetch_page_with_total, resolve_estimated_total
+from app.db.bigquery import get_bigquery_client
+from app.core.currency import usd_amount_sql, usd_factor_join_sql, usd_factors_param
+from app.core.normalize import end_day_validator, id_list_validator, tag_list_validator
+from app.db.dimensions import Dimensions, DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.query_builder import FilterSet, QueryTemplate
+from app.db.results import Column, arrow_arrays, fetch_arrays, fetch_arrow, rows_from_columns, to_list
+from app.db.search_index import SearchIndexStore, get_search_index, resolve_searches
 from datetime import date, datetime
 
 router = APIRouter()
@@ -18,37 +35,67 @@ class DailyProductReportParams(BaseModel):
     title_search: Optional[str] = None  # 新增：模糊搜索标题
     tag_search: Optional[str] = None
     custom_tag_search: Optional[str] = None
+    cursor: Optional[str] = None  # 上一页返回的 next_cursor，传入时忽略 page
+    include_total: bool = True  # false 时不计算总数
+    estimate_total: bool = False  # true 时总数未缓存则先返回估计值
+    explain: bool = False  # true 时只返回预估扫描量和执行计划，不执行查询
+    snapshot: bool = False  # true 时一次性物化全部结果，返回 snapshot_id
+    snapshot_id: Optional[str] = None  # 传入时直接从快照中读取 page/limit 对应的行
+
+    _normalize_end_date = end_day_validator("end_date")
+    _normalize_site_ids = id_list_validator("site_ids")
+    _normalize_tags = tag_list_validator("tag_search")  # custom_tag_search 是整段正则，不拆分
 
 # 响应模型
 class DailyProductReportResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_estimated: bool = False
     result: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    snapshot_id: Optional[str] = None
+    explain: Optional[Dict[str, Any]] = None
 
-# 查询函数
-def query_product_sales_analysis_spu(params: DailyProductReportParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+# 结果行：main_query 的列加上维度表中的站点和部门名称，类型预先声明
+@row_model
+class ProductSalesAnalysisSpuRow(Row):
+    product_id: Optional[str]
+    site_id: Optional[int]
+    tags: Optional[str]
+    total_daily_purchase_quantity: Optional[int]
+    total_order_amount_usd: Optional[float]
+    total_order_amount: Optional[float]
+    product_title: Optional[str]
+    product_online_time: Optional[str]
+    product_img: Optional[str]
+    quantity_proportion: Optional[str]
+    sales_percentage: Optional[str]
+    site_name: Optional[str]
+    department_name: Optional[str]
 
-    # 计算偏移量
-    offset = (params.page - 1) * params.limit
+# 游标分页的排序键，后两列保证唯一
+SORT_KEYS = [
+    SortKey("total_daily_purchase_quantity", "FLOAT64"),
+    SortKey("product_id", "STRING"),
+    SortKey("site_id", "INT64"),
+]
 
-    # 基础查询
-    base_query = """
-        WITH total_sales AS (
+# 分页、计数和导出共用的 total_sales / main_query
+# 每行只换算一次美元金额，total_sales 与 main_query 共用
+MAIN_QUERY = QueryTemplate("product_sales_analysis_spu", """
+        WITH sales AS (
             SELECT 
-                SUM(CASE 
-                      WHEN s.currency = 'USD' THEN dps.total_order_amount 
-                      ELSE ROUND(dps.total_order_amount * er.rate_to_cny / er_usd.rate_to_cny, 2) 
-                    END) AS total_sales,
-                SUM(dps.daily_purchase_quantity) AS total_quantity
+                dps.*,
+                """ + usd_amount_sql("dps.total_order_amount") + """ AS total_order_amount_usd
             FROM 
                 `allwebi.mv_daily_product_sales` AS dps
-            LEFT JOIN 
-                `allwebi.tb_sites` AS s ON s.site_id = dps.site_id
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er ON s.currency = er.currency_symbol AND dps.order_month = er.exchange_date
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er_usd ON 'USD' = er_usd.currency_symbol AND dps.order_month = er_usd.exchange_date
+            """ + usd_factor_join_sql("dps.site_id", "dps.order_month") + """
+        ),
+        total_sales AS (
+            SELECT 
+                SUM(dps.total_order_amount_usd) AS total_sales,
+                SUM(dps.daily_purchase_quantity) AS total_quantity
+            FROM 
+                sales AS dps
             WHERE 
                 CAST(dps.order_date AS DATE) >= @start_date
                 AND CAST(dps.order_date AS DATE) <= @end_date
@@ -59,134 +106,217 @@ def query_product_sales_analysis_spu(params: DailyProductReportParams) -> Dict[s
                 dps.site_id,
                 MAX(g.tags) as tags,
                 SUM(dps.daily_purchase_quantity) AS total_daily_purchase_quantity,
-                SUM(CASE 
-                      WHEN s.currency = 'USD' THEN dps.total_order_amount 
-                      ELSE ROUND(dps.total_order_amount * er.rate_to_cny / er_usd.rate_to_cny, 2) 
-                    END) AS total_order_amount_usd,
+                SUM(dps.total_order_amount_usd) AS total_order_amount_usd,
                 SUM(dps.total_order_amount) as total_order_amount,
-                MAX(s.brand) AS site_name,
-                MAX(bd.department_name) AS department_name,
                 MAX(dps.title) AS product_title,
                 MAX(g.online_time) AS product_online_time,
                 MAX(g.main_image) AS product_img,
                 FORMAT('%.8f',SUM(dps.daily_purchase_quantity) / ts.total_quantity) AS quantity_proportion,
-                FORMAT('%.8f',SUM(CASE 
-                      WHEN s.currency = 'USD' THEN dps.total_order_amount 
-                      ELSE ROUND(dps.total_order_amount * er.rate_to_cny / er_usd.rate_to_cny, 2) 
-                    END) / ts.total_sales) AS sales_percentage
+                FORMAT('%.8f',SUM(dps.total_order_amount_usd) / ts.total_sales) AS sales_percentage
             FROM 
-                `allwebi.mv_daily_product_sales` AS dps
-            LEFT JOIN 
-                `allwebi.tb_goods` AS g ON g.p_id = dps.product_id
-            LEFT JOIN 
-                `allwebi.tb_sites` AS s ON s.site_id = dps.site_id
+                sales AS dps
             LEFT JOIN 
-                `allwebi.tb_goods_tag` AS gt ON gt.product_spu = g.p_id
-            LEFT JOIN 
-                `allwebi.tb_brand_department` AS bd ON s.brand_department_id = bd.id
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er ON s.currency = er.currency_symbol AND dps.order_month = er.exchange_date
-            LEFT JOIN 
-                `allwebi.tb_exchange_rates` AS er_usd ON 'USD' = er_usd.currency_symbol AND dps.order_month = er_usd.exchange_date,
+                `allwebi.tb_goods` AS g ON g.p_id = dps.product_id,
             total_sales AS ts 
-            {where_clause}
+            WHERE TRUE
+            {where}
             GROUP BY 
                 dps.product_id, dps.site_id, ts.total_sales, ts.total_quantity
         )
-        SELECT 
-            main_query.*,
-            (SELECT COUNT(*) FROM main_query) AS total_records
-        FROM 
-            main_query
-        ORDER BY 
-            total_daily_purchase_quantity DESC
-        LIMIT {limit} OFFSET {offset}
-    """
-
-    # 构建 WHERE 子句
-    where_conditions = []
-    if params.start_date:
-        where_conditions.append("CAST(dps.order_date AS DATE) >= @start_date")
-    if params.end_date:
-        where_conditions.append("CAST(dps.order_date AS DATE) <= @end_date")
-    if params.online_start_date:
-        where_conditions.append("""
-            (g.online_time != '' AND 
+    """, {
+    "start_date": {"where": "AND CAST(dps.order_date AS DATE) >= @start_date"},
+    "end_date": {"where": "AND CAST(dps.order_date AS DATE) <= @end_date"},
+    "online_start_date": {"where": """AND (g.online_time != '' AND 
              SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) IS NOT NULL AND 
-             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) >= @online_start_date)
-        """)
-    if params.online_end_date:
-        where_conditions.append("""
-            (g.online_time != '' AND 
+             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) >= @online_start_date)"""},
+    "online_end_date": {"where": """AND (g.online_time != '' AND 
              SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) IS NOT NULL AND 
-             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) <= @online_end_date)
-        """)
-    if params.site_ids:
-        where_conditions.append(f"dps.site_id IN UNNEST(@site_ids)")
-    if params.title_search:
-        where_conditions.append("REGEXP_CONTAINS(dps.title, CONCAT('(?i)', @title_search))")
+             SAFE.PARSE_TIMESTAMP('%Y-%m-%d %H:%M:%S', g.online_time) <= @online_end_date)"""},
+    "site_ids": {"where": "AND dps.site_id IN UNNEST(@site_ids)"},
+    "title_search": {"where": "AND REGEXP_CONTAINS(dps.title, CONCAT('(?i)', @title_search))"},
+    # 自定义标签用 EXISTS 过滤，不再按标签数放大聚合前的行数
+    "custom_tag_search": {"where": """AND EXISTS (
+                SELECT 1 FROM `allwebi.tb_goods_tag` AS gt
+                WHERE gt.product_spu = g.p_id AND REGEXP_CONTAINS(gt.tag, CONCAT('(?i)', @custom_tag_search)))"""},
+    "tag_search": {"where": "AND REGEXP_CONTAINS(g.tags, @tag_search_regex)"},
+    # 倒排索引解析出的搜索结果
+    "search_product_ids": {"where": "AND dps.product_id IN UNNEST(@search_product_ids)"},
+})
+
+# 搜索条件 -> (索引字段, 搜索词)；custom_tag_search 是整段正则，不拆分。
+# title_search 过滤的是 mv_daily_product_sales 每一行的 title，与索引中的
+# tb_goods.title 不是同一列，始终交给 BigQuery
+def search_filters(params: DailyProductReportParams) -> Dict[str, Tuple[str, List[str]]]:
+    searches = {}
     if params.custom_tag_search:
-        where_conditions.append("REGEXP_CONTAINS(gt.tag, CONCAT('(?i)', @custom_tag_search))")
-    # if params.tag_search:
-    #     where_conditions.append("REGEXP_CONTAINS(g.tags, CONCAT('(?i)', @tag_search))")
+        searches["custom_tag_search"] = ("tag", [params.custom_tag_search])
     if params.tag_search:
-        tag_search_list = params.tag_search.split(',')
-        tag_search_regex = r'(?i)(' + '|'.join(tag_search_list) + ')'
-        where_conditions.append(f"REGEXP_CONTAINS(g.tags, '{tag_search_regex}')")
-
-
-    where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        searches["tag_search"] = ("tags", params.tag_search.split(','))
+    return searches
 
-    # 格式化查询语句
-    query = base_query.format(
-        where_clause=where_clause,
-        limit=params.limit,
-        offset=offset
-    )
-
-    # 设置查询参数
-    query_params = []
+def build_main_query(params: DailyProductReportParams, dims: Dimensions, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    filters = FilterSet()
     if params.start_date:
-        query_params.append(bigquery.ScalarQueryParameter("start_date", "DATE", params.start_date))
+        filters.add("start_date", bigquery.ScalarQueryParameter("start_date", "DATE", params.start_date))
     if params.end_date:
-        query_params.append(bigquery.ScalarQueryParameter("end_date", "DATE", params.end_date))
+        filters.add("end_date", bigquery.ScalarQueryParameter("end_date", "DATE", params.end_date))
     if params.online_start_date:
-        query_params.append(bigquery.ScalarQueryParameter("online_start_date", "TIMESTAMP", params.online_start_date))
+        filters.add("online_start_date", bigquery.ScalarQueryParameter("online_start_date", "TIMESTAMP", params.online_start_date))
     if params.online_end_date:
-        query_params.append(bigquery.ScalarQueryParameter("online_end_date", "TIMESTAMP", params.online_end_date))
+        filters.add("online_end_date", bigquery.ScalarQueryParameter("online_end_date", "TIMESTAMP", params.online_end_date))
     if params.site_ids:
         site_ids = [int(id.strip()) for id in params.site_ids.split(',')]
-        query_params.append(bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+        filters.add("site_ids", bigquery.ArrayQueryParameter("site_ids", "INT64", site_ids))
+    # 能由倒排索引解析的搜索条件换成商品 ID 数组，其余仍按正则过滤
+    product_ids, unresolved = resolve_searches(search, search_filters(params))
+    if product_ids is not None:
+        filters.add("search_product_ids", bigquery.ArrayQueryParameter("search_product_ids", "STRING", product_ids))
     if params.title_search:
-        query_params.append(bigquery.ScalarQueryParameter("title_search", "STRING", params.title_search))
-    if params.tag_search:
-        query_params.append(bigquery.ScalarQueryParameter("tag_search", "STRING", params.tag_search))
-    if params.custom_tag_search:
-        query_params.append(bigquery.ScalarQueryParameter("custom_tag_search", "STRING", params.custom_tag_search))
+        filters.add("title_search", bigquery.ScalarQueryParameter("title_search", "STRING", params.title_search))
+    if "custom_tag_search" in unresolved:
+        filters.add("custom_tag_search", bigquery.ScalarQueryParameter("custom_tag_search", "STRING", params.custom_tag_search))
+    if "tag_search" in unresolved:
+        tag_search_regex = r'(?i)(' + '|'.join(params.tag_search.split(',')) + ')'
+        filters.add("tag_search", bigquery.ScalarQueryParameter("tag_search_regex", "STRING", tag_search_regex))
 
+    # 站点 × 月份的美元换算系数，来自内存中的维度表
+    query_params = filters.params + [usd_factors_param(dims.site_usd_factors(params.start_date, params.end_date))]
+
+    return MAIN_QUERY.render(filters.active), query_params
+
+# 站点名称和部门名称从内存中的维度表补全
+def enrich_columns(columns: Dict[str, Column], dims: Dimensions) -> None:
+    sites = [dims.site_fields(site_id) for site_id in to_list(columns.get("site_id", []))]
+    columns["site_name"] = [site["site_name"] for site in sites]
+    columns["department_name"] = [site["department_name"] for site in sites]
+
+# 分页查询：只取一页
+def page_query(params: DailyProductReportParams, dims: Dimensions, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params, dims, search)
+
+    # 带游标时从上一页最后一行之后继续，否则按页码偏移
+    seek, cursor_params = seek_clause(params.cursor, SORT_KEYS)
+    limit_clause, page_params = page_clause(params.cursor, params.page, params.limit)
+
+    query = main_query + f"""
+        SELECT 
+            main_query.*
+        FROM 
+            main_query
+        {seek}
+        {order_by_clause(SORT_KEYS)}
+        {limit_clause}
+    """
+    return query, query_params + cursor_params + page_params
+
+# 计数查询：同一组筛选条件的总数，与页码无关
+def count_query(params: DailyProductReportParams, dims: Dimensions, search: Optional[SearchIndexStore] = None) -> Tuple[str, List[Any]]:
+    main_query, query_params = build_main_query(params, dims, search)
+    return main_query + "SELECT COUNT(*) AS total_records FROM main_query", query_params
+
+# 一次请求会执行的查询，供 dry run 预估
+def plan_product_sales_analysis_spu(params: DailyProductReportParams, client: bigquery.Client, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> Dict[str, Tuple[str, List[Any]]]:
+    dims = dimensions.get(client)
+    return {"page": page_query(params, dims, search), "count": count_query(params, dims, search)}
+
+# 查询函数：只取一页
+def query_product_sales_analysis_spu(params: DailyProductReportParams, client: bigquery.Client, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> Dict[str, Any]:
+    job_config = query_job_config("product_sales_analysis_spu")
+    dims = dimensions.get(client)
+    query, query_params = page_query(params, dims, search)
     job_config.query_parameters = query_params
 
     # 执行查询
     query_job = client.query(query, job_config=job_config)
 
     # 处理查询结果
-    rows = [dict(row) for row in query_job]
+    columns = fetch_arrays(query_job)
+    enrich_columns(columns, dims)
+    rows = rows_from_columns(columns, ProductSalesAnalysisSpuRow)
+
+    return {
+        "result": rows,
+        "next_cursor": next_cursor(rows, SORT_KEYS, params.limit)
+    }
+
+# 计数函数
+def count_product_sales_analysis_spu(params: DailyProductReportParams, client: bigquery.Client, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> int:
+    job_config = query_job_config("product_sales_analysis_spu")
+    query, query_params = count_query(params, dimensions.get(client), search)
+    job_config.query_parameters = query_params
 
-    if rows:
-        total_records = rows[0].get('total_records', 0)
+    rows = list(client.query(query, job_config=job_config).result())
+
+    return rows[0].total_records if rows else 0
+
+# 快照函数：不分页地取出全部结果，按列保存
+def query_product_sales_analysis_spu_snapshot(params: DailyProductReportParams, client: bigquery.Client, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None, max_bytes: Optional[int] = None) -> Dict[str, Column]:
+    job_config = query_job_config("product_sales_analysis_spu")
+    dims = dimensions.get(client)
+    main_query, query_params = build_main_query(params, dims, search)
+    job_config.query_parameters = query_params
+
+    query = main_query + f"""
+        SELECT 
+            main_query.*
+        FROM 
+            main_query
+        {order_by_clause(SORT_KEYS)}
+    """
+
+    query_job = client.query(query, job_config=job_config)
+    table = fetch_arrow(query_job)
+    # Arrow 的大小是转换后大小的下限，超出上限时直接拒绝，不再转换
+    if max_bytes is not None:
+        check_snapshot_size(table.nbytes, max_bytes)
+    columns = arrow_arrays(table)
+    enrich_columns(columns, dims)
+    return columns
+
+async def fetch_snapshot_page(params: DailyProductReportParams, client: bigquery.Client, executor: QueryExecutor, snapshots: SnapshotStore, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> Dict[str, Any]:
+    if params.snapshot_id:
+        snapshot = snapshots.get(params.snapshot_id)
+        if snapshot is None:
+            raise HTTPException(status_code=410, detail="Snapshot expired or not found")
     else:
-        total_records = 0
+        columns = await executor.run(query_product_sales_analysis_spu_snapshot, params, client, dimensions, search, snapshots.max_bytes)
+        snapshot = snapshots.create(columns)
 
+    offset = (params.page - 1) * params.limit
     return {
-        "total": total_records,
-        "result": rows
+        "total": snapshot.row_count,
+        "total_estimated": False,
+        "result": snapshot.rows(offset, params.limit, ProductSalesAnalysisSpuRow),
+        "next_cursor": None,
+        "snapshot_id": snapshot.id
     }
 
-@router.post("/product-sales-analysis-spu", response_model=DailyProductReportResponse)
-async def product_sales_analysis_spu(params: DailyProductReportParams):
+# 接口返回的数据，单独接口和组合接口共用
+async def product_sales_analysis_spu_data(params: DailyProductReportParams, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache, snapshots: SnapshotStore, dimensions: DimensionStore, search: Optional[SearchIndexStore] = None) -> Dict[str, Any]:
+    if (params.snapshot or params.snapshot_id) and not params.explain:
+        return await fetch_snapshot_page(params, client, executor, snapshots, dimensions, search)
+
+    response_data = await cache.get_or_load(
+        "product_sales_analysis_spu", params, settings.cache_ttl_product_sales_analysis_spu,
+        lambda: fetch_page_with_total(
+            "product_sales_analysis_spu", params,
+            functools.partial(query_product_sales_analysis_spu, dimensions=dimensions, search=search),
+            functools.partial(count_product_sales_analysis_spu, dimensions=dimensions, search=search),
+            cache, executor, client, plan=functools.partial(plan_product_sales_analysis_spu, dimensions=dimensions, search=search),
+        ),
+        stale_ttl=settings.cache_stale_ttl_product_sales_analysis_spu,
+    )
+    # 缓存的整页里可能是估计总数，计数完成后换成准确值
+    response_data = await resolve_estimated_total("product_sales_analysis_spu", params, response_data, cache)
+    return {**response_data, "snapshot_id": None}
+
+@router.post("/product-sales-analysis-spu", response_model=DailyProductReportResponse, response_class=FastJSONResponse)
+async def product_sales_analysis_spu(params: DailyProductReportParams, request: Request, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), snapshots: SnapshotStore = Depends(get_snapshot_store), dimensions: DimensionStore = Depends(get_dimension_store), search: Optional[SearchIndexStore] = Depends(get_search_index)):
     try:
-        response_data = query_product_sales_analysis_spu(params)
+        response_data = await product_sales_analysis_spu_data(params, client, executor, cache, snapshots, dimensions, search)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return response_data
\ No newline at end of file
+    return report_response(request, response_data, ProductSalesAnalysisSpuRow)
\ No newline at end of file
@@ -1,7 +1,21 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from google.cloud import bigquery
+from datetime import date
+from app.core.batch import GROUP_PRODUCTS_CTE, check_groups, group_products_param
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.timeseries import day_range, load_daily_series, parse_day
+from app.db.bigquery import get_bigquery_client
+from app.core.currency import usd_amount_sql, usd_factor_join_sql, usd_factors_param
+from app.core.normalize import day_validator, id_array_validator, id_groups_validator
+from app.db.dimensions import DimensionStore, get_dimension_store
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.rollup import RollupStore, get_rollup_store
+from app.db.results import fetch_columns
 
 router = APIRouter()
 
@@ -11,6 +25,9 @@ class ProductSalesReportParams(BaseModel):
     start_date: str
     end_date: str
 
+    _normalize_product_ids = id_array_validator("product_ids")
+    _normalize_days = day_validator("start_date", "end_date")
+
 # Response model
 class ProductSalesReportResponse(BaseModel):
     total: int
@@ -22,31 +39,32 @@ class ResultData(BaseModel):
     qty_data: List[int]
     gmv_data: List[float]
 
-def query_product_sales_report(params: ProductSalesReportParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+# Batch request: one report per product group, in the same order
+class ProductSalesReportBatchParams(BaseModel):
+    groups: List[List[str]]
+    start_date: str
+    end_date: str
+
+    _normalize_groups = id_groups_validator("groups")
+    _normalize_days = day_validator("start_date", "end_date")
 
-    query = """
+class ProductSalesReportBatchResponse(BaseModel):
+    result: List[ProductSalesReportResponse]
+
+def query_product_sales_report(params: ProductSalesReportParams, client: bigquery.Client, dimensions: DimensionStore) -> Dict[str, Any]:
+    job_config = query_job_config("product_sales_report")
+
+    query = f"""
     SELECT 
         dd.item_date,
         COALESCE(SUM(dps.daily_purchase_quantity), 0) AS daily_purchase_quantity,
-        COALESCE(SUM(
-            CASE 
-                WHEN s.currency = 'USD' THEN dps.total_order_amount 
-                ELSE ROUND(dps.total_order_amount * er.rate_to_cny / er_usd.rate_to_cny, 2) 
-            END
-        ), 0) AS total_order_amount
+        COALESCE(SUM({usd_amount_sql('dps.total_order_amount')}), 0) AS total_order_amount
     FROM 
         `allwebi.tb_date_dimension` AS dd
     LEFT JOIN 
         `allwebi.mv_daily_product_sales` AS dps
         ON dd.item_date = dps.order_date AND dps.product_id IN UNNEST(@product_ids)
-    LEFT JOIN 
-        `allwebi.tb_sites` AS s ON s.site_id = dps.site_id
-    LEFT JOIN 
-        `allwebi.tb_exchange_rates` AS er ON s.currency = er.currency_symbol AND dps.order_month = er.exchange_date
-    LEFT JOIN 
-        `allwebi.tb_exchange_rates` AS er_usd ON 'USD' = er_usd.currency_symbol AND dps.order_month = er_usd.exchange_date
+    {usd_factor_join_sql('dps.site_id', 'dps.order_month')}
     WHERE 
         dd.type = 1 
         AND dd.item_date >= @start_date
@@ -60,27 +78,25 @@ def query_product_sales_report(params: ProductSalesReportParams) -> Dict[str, An
     query_params = [
         bigquery.ArrayQueryParameter("product_ids", "STRING", params.product_ids),
         bigquery.ScalarQueryParameter("start_date", "STRING", params.start_date),
-        bigquery.ScalarQueryParameter("end_date", "STRING", params.end_date)
+        bigquery.ScalarQueryParameter("end_date", "STRING", params.end_date),
+        # 站点 × 月份的美元换算系数，来自内存中的维度表
+        usd_factors_param(dimensions.get(client).site_usd_factors(
+            date.fromisoformat(params.start_date[:10]),
+            date.fromisoformat(params.end_date[:10])
+        ))
     ]
 
     job_config.query_parameters = query_params
 
     query_job = client.query(query, job_config=job_config)
-    rows = list(query_job.result())
-
-    item_dates = []
-    qty_data = []
-    gmv_data = []
-
-    for row in rows:
-        item_dates.append(row.item_date)
-        qty_data.append(row.daily_purchase_quantity)
-        gmv_data.append(row.total_order_amount)
+    columns = fetch_columns(query_job)
 
+    # 结果本身就是按列返回的
+    item_dates = columns.get("item_date", [])
     result = {
         "xAxis": item_dates,
-        "qty_data": qty_data,
-        "gmv_data": gmv_data
+        "qty_data": columns.get("daily_purchase_quantity", []),
+        "gmv_data": columns.get("total_order_amount", [])
     }
 
     total = len(item_dates)
@@ -90,20 +106,182 @@ def query_product_sales_report(params: ProductSalesReportParams) -> Dict[str, An
         "result": result
     }
 
-@router.post("/product-sales-report", response_model=ProductSalesReportResponse)
-async def product_sales_report(params: ProductSalesReportParams):
-    if not params.product_ids:
-        return {
-            "total": 0,
-            "result": {
-                "xAxis": [],
-                "qty_data": [],
-                "gmv_data": []
-            }
+# 单个日期段按天取数：在日期维度中的日期为 [qty, gmv]，其余为 []
+def query_product_sales_report_days(product_ids: List[str], start: date, end: date, client: bigquery.Client, dimensions: DimensionStore) -> Dict[date, List[Any]]:
+    params = ProductSalesReportParams(product_ids=product_ids, start_date=start.isoformat(), end_date=end.isoformat())
+    result = query_product_sales_report(params, client, dimensions)["result"]
+
+    values: Dict[date, List[Any]] = {day: [] for day in day_range(start, end)}
+    for item_date, qty, gmv in zip(result["xAxis"], result["qty_data"], result["gmv_data"]):
+        values[parse_day(item_date)] = [qty, gmv]
+    return values
+
+# 按天缓存：新的日期窗口只查询没有缓存过的日期
+async def load_product_sales_report(params: ProductSalesReportParams, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache, dimensions: DimensionStore) -> Dict[str, Any]:
+    start, end = parse_day(params.start_date), parse_day(params.end_date)
+    if start is None or end is None or start > end:
+        return await executor.run(query_product_sales_report, params, client, dimensions)
+
+    product_ids = sorted(set(params.product_ids))
+    days = await load_daily_series(
+        cache, "product_sales_report:day", product_ids, start, end,
+        lambda a, b: executor.run(query_product_sales_report_days, product_ids, a, b, client, dimensions),
+    )
+
+    item_dates, qty_data, gmv_data = [], [], []
+    for day, value in days:
+        if value:
+            item_dates.append(day)
+            qty_data.append(value[0])
+            gmv_data.append(value[1])
+
+    return {
+        "total": len(item_dates),
+        "result": {
+            "xAxis": item_dates,
+            "qty_data": qty_data,
+            "gmv_data": gmv_data
+        }
+    }
+
+# 没有商品时不查询，返回空数组（批量接口中的空分组也一样）
+def empty_report() -> Dict[str, Any]:
+    return {
+        "total": 0,
+        "result": {
+            "xAxis": [],
+            "qty_data": [],
+            "gmv_data": []
         }
+    }
+
+# 接口返回的数据，单独接口和组合接口共用
+async def product_sales_report_data(params: ProductSalesReportParams, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache, dimensions: DimensionStore, rollup: Optional[RollupStore]) -> Dict[str, Any]:
+    if not params.product_ids:
+        return empty_report()
+
+    # 本地汇总覆盖该日期范围时直接返回
+    if rollup is not None:
+        local = rollup.product_sales_report(params.product_ids, params.start_date, params.end_date)
+        if local is not None:
+            return local
+
+    return await cache.get_or_load(
+        "product_sales_report", params, settings.cache_ttl_product_sales_report,
+        lambda: load_product_sales_report(params, client, executor, cache, dimensions),
+    )
+
+@router.post("/product-sales-report", response_model=ProductSalesReportResponse, response_class=FastJSONResponse)
+async def product_sales_report(params: ProductSalesReportParams, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), dimensions: DimensionStore = Depends(get_dimension_store), rollup: Optional[RollupStore] = Depends(get_rollup_store)):
     try:
-        response_data = query_product_sales_report(params)
+        response_data = await product_sales_report_data(params, client, executor, cache, dimensions, rollup)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return FastJSONResponse(response_data)
+
+# All groups in one job: sales are grouped by (group, date) and laid out on
+# the shared date dimension
+def query_product_sales_report_batch(params: ProductSalesReportBatchParams, client: bigquery.Client, dimensions: DimensionStore) -> Dict[str, Any]:
+    job_config = query_job_config("product_sales_report")
+
+    query = f"""
+    WITH {GROUP_PRODUCTS_CTE},
+    sales AS (
+        SELECT
+            gp.group_index,
+            dps.order_date,
+            SUM(dps.daily_purchase_quantity) AS daily_purchase_quantity,
+            SUM({usd_amount_sql('dps.total_order_amount')}) AS total_order_amount
+        FROM
+            `allwebi.mv_daily_product_sales` AS dps
+        JOIN
+            group_products AS gp ON gp.product_id = dps.product_id
+        {usd_factor_join_sql('dps.site_id', 'dps.order_month')}
+        WHERE
+            dps.order_date >= @start_date
+            AND dps.order_date <= @end_date
+        GROUP BY
+            gp.group_index, dps.order_date
+    )
+    SELECT 
+        dd.item_date,
+        s.group_index,
+        s.daily_purchase_quantity,
+        s.total_order_amount
+    FROM 
+        `allwebi.tb_date_dimension` AS dd
+    LEFT JOIN 
+        sales AS s ON s.order_date = dd.item_date
+    WHERE 
+        dd.type = 1 
+        AND dd.item_date >= @start_date
+        AND dd.item_date <= @end_date
+    ORDER BY 
+        dd.item_date
+    """
+
+    job_config.query_parameters = [
+        group_products_param(params.groups),
+        bigquery.ScalarQueryParameter("start_date", "STRING", params.start_date),
+        bigquery.ScalarQueryParameter("end_date", "STRING", params.end_date),
+        usd_factors_param(dimensions.get(client).site_usd_factors(
+            date.fromisoformat(params.start_date[:10]),
+            date.fromisoformat(params.end_date[:10])
+        ))
+    ]
+
+    columns = fetch_columns(client.query(query, job_config=job_config))
+
+    # 每个日期至少一行；没有销量的 (分组, 日期) 按 0 填充，与单独接口的 COALESCE 一致
+    item_dates = []
+    date_index: Dict[Any, int] = {}
+    for item_date in columns.get("item_date", []):
+        if item_date not in date_index:
+            date_index[item_date] = len(item_dates)
+            item_dates.append(item_date)
+
+    qty_data = [[0] * len(item_dates) for _ in params.groups]
+    gmv_data = [[0.0] * len(item_dates) for _ in params.groups]
+    for item_date, index, qty, gmv in zip(columns.get("item_date", []), columns.get("group_index", []), columns.get("daily_purchase_quantity", []), columns.get("total_order_amount", [])):
+        if index is None:
+            continue
+        qty_data[index][date_index[item_date]] = qty or 0
+        gmv_data[index][date_index[item_date]] = gmv or 0.0
+
+    return {
+        "result": [
+            {
+                "total": len(item_dates),
+                "result": {
+                    "xAxis": item_dates,
+                    "qty_data": qty_data[i],
+                    "gmv_data": gmv_data[i]
+                }
+            } if group else empty_report()
+            for i, group in enumerate(params.groups)
+        ]
+    }
+
+@router.post("/product-sales-report/batch", response_model=ProductSalesReportBatchResponse, response_class=FastJSONResponse)
+async def product_sales_report_batch(params: ProductSalesReportBatchParams, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), dimensions: DimensionStore = Depends(get_dimension_store), rollup: Optional[RollupStore] = Depends(get_rollup_store)):
+    check_groups(params.groups)
+    try:
+        # 本地汇总覆盖该日期范围时逐组直接计算
+        if rollup is not None:
+            local = [rollup.product_sales_report(group, params.start_date, params.end_date) if group else empty_report() for group in params.groups]
+            if all(part is not None for part in local):
+                return FastJSONResponse({"result": local})
+
+        response_data = await cache.get_or_load(
+            "product_sales_report_batch", params, settings.cache_ttl_product_sales_report,
+            lambda: executor.run(query_product_sales_report_batch, params, client, dimensions),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return response_data
\ No newline at end of file
+    return FastJSONResponse(response_data)
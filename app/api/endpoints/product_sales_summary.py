@@ -1,7 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from google.cloud import bigquery
+from app.core.batch import GROUP_PRODUCTS_CTE, check_groups, group_products_param
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.normalize import day_validator, end_day_validator, id_array_validator, id_groups_validator
+from app.db.bigquery import get_bigquery_client
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.results import fetch_columns
+from app.db.rollup import RollupStore, get_rollup_store
 
 router = APIRouter()
 
@@ -11,13 +21,30 @@ class ProductSalesSummaryParams(BaseModel):
     start_date: str
     end_date: str
 
+    # 汇总不返回日期轴，结束日期可以截到今天
+    _normalize_product_ids = id_array_validator("product_ids")
+    _normalize_start_date = day_validator("start_date")
+    _normalize_end_date = end_day_validator("end_date")
+
 # Response model
 class ProductSalesSummaryResponse(BaseModel):
     result: Dict[str, Any]  # Contains total_quantity and percentage
 
-def query_product_sales_summary(params: ProductSalesSummaryParams) -> Dict[str, Any]:
-    client = bigquery.Client()
-    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+# Batch request: one result per product group, in the same order
+class ProductSalesSummaryBatchParams(BaseModel):
+    groups: List[List[str]]
+    start_date: str
+    end_date: str
+
+    _normalize_groups = id_groups_validator("groups")
+    _normalize_start_date = day_validator("start_date")
+    _normalize_end_date = end_day_validator("end_date")
+
+class ProductSalesSummaryBatchResponse(BaseModel):
+    result: List[Dict[str, Any]]
+
+def query_product_sales_summary(params: ProductSalesSummaryParams, client: bigquery.Client) -> Dict[str, Any]:
+    job_config = query_job_config("product_sales_summary")
 
     query = """
     WITH product_sales AS (
@@ -80,11 +107,103 @@ def query_product_sales_summary(params: ProductSalesSummaryParams) -> Dict[str,
         "result": result
     }
 
-@router.post("/product-sales-summary", response_model=ProductSalesSummaryResponse)
-async def product_sales_summary(params: ProductSalesSummaryParams):
+# Response data, shared by the endpoint and the dashboard endpoint
+async def product_sales_summary_data(params: ProductSalesSummaryParams, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache, rollup: Optional[RollupStore]) -> Dict[str, Any]:
+    # 本地汇总覆盖该日期范围时直接返回
+    if rollup is not None:
+        local = rollup.product_sales_summary(params.product_ids, params.start_date, params.end_date)
+        if local is not None:
+            return local
+
+    return await cache.get_or_load(
+        "product_sales_summary", params, settings.cache_ttl_product_sales_summary,
+        lambda: executor.run(query_product_sales_summary, params, client),
+    )
+
+@router.post("/product-sales-summary", response_model=ProductSalesSummaryResponse, response_class=FastJSONResponse)
+async def product_sales_summary(params: ProductSalesSummaryParams, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), rollup: Optional[RollupStore] = Depends(get_rollup_store)):
+    try:
+        response_data = await product_sales_summary_data(params, client, executor, cache, rollup)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return FastJSONResponse(response_data)
+
+# All groups in one job; the total over the date range is computed once
+def query_product_sales_summary_batch(params: ProductSalesSummaryBatchParams, client: bigquery.Client) -> Dict[str, Any]:
+    job_config = query_job_config("product_sales_summary")
+
+    query = f"""
+    WITH {GROUP_PRODUCTS_CTE},
+    product_sales AS (
+        SELECT
+            gp.group_index,
+            SUM(dps.daily_purchase_quantity) AS total_quantity
+        FROM
+            `allwebi.mv_daily_product_sales` AS dps
+        JOIN
+            group_products AS gp ON gp.product_id = dps.product_id
+        WHERE
+            dps.order_date BETWEEN @start_date AND @end_date
+        GROUP BY
+            gp.group_index
+    ),
+    total_sales AS (
+        SELECT
+            SUM(daily_purchase_quantity) AS total_quantity
+        FROM
+            `allwebi.mv_daily_product_sales`
+        WHERE
+            order_date BETWEEN @start_date AND @end_date
+    )
+    SELECT
+        p.group_index,
+        p.total_quantity,
+        CASE 
+            WHEN t.total_quantity = 0 THEN 0 
+            ELSE ROUND(p.total_quantity / t.total_quantity, 6) 
+        END AS percentage
+    FROM
+        product_sales p
+    CROSS JOIN total_sales t
+    """
+
+    job_config.query_parameters = [
+        group_products_param(params.groups),
+        bigquery.ScalarQueryParameter("start_date", "STRING", params.start_date),
+        bigquery.ScalarQueryParameter("end_date", "STRING", params.end_date)
+    ]
+
+    columns = fetch_columns(client.query(query, job_config=job_config))
+
+    # 没有销量的分组不会出现在结果中，按 0 返回
+    result = [{"total_quantity": 0, "percentage": 0} for _ in params.groups]
+    for index, total_quantity, percentage in zip(columns.get("group_index", []), columns.get("total_quantity", []), columns.get("percentage", [])):
+        result[index] = {"total_quantity": total_quantity or 0, "percentage": percentage or 0}
+
+    return {
+        "result": result
+    }
+
+@router.post("/product-sales-summary/batch", response_model=ProductSalesSummaryBatchResponse, response_class=FastJSONResponse)
+async def product_sales_summary_batch(params: ProductSalesSummaryBatchParams, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), rollup: Optional[RollupStore] = Depends(get_rollup_store)):
+    check_groups(params.groups)
     try:
-        response_data = query_product_sales_summary(params)
+        # 本地汇总覆盖该日期范围时逐组直接计算
+        if rollup is not None:
+            local = [rollup.product_sales_summary(group, params.start_date, params.end_date) for group in params.groups]
+            if all(part is not None for part in local):
+                return FastJSONResponse({"result": [part["result"] for part in local]})
+
+        response_data = await cache.get_or_load(
+            "product_sales_summary_batch", params, settings.cache_ttl_product_sales_summary,
+            lambda: executor.run(query_product_sales_summary_batch, params, client),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    return response_data
\ No newline at end of file
+    return FastJSONResponse(response_data)
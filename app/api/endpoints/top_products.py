@@ -1,29 +1,38 @@
-from fastapi import APIRouter, HTTPException, Request
+import json
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import date
 from google.cloud import bigquery
-from collections import defaultdict
+from app.core.cache import ResultCache, get_result_cache
+from app.core.config import settings
+from app.core.responses import FastJSONResponse, matrix_response
+from app.core.timeseries import day_range, load_daily_series, parse_day
+from app.core.normalize import day_validator, id_sort_key
+from app.db.bigquery import get_bigquery_client
+from app.db.executor import QueryExecutor, get_query_executor
+from app.db.guardrails import query_job_config
+from app.db.rollup import RollupStore, get_rollup_store
+from app.db.results import fetch_arrow, fetch_columns
 
 router = APIRouter()
 
-# Initialize the BigQuery client
-client = bigquery.Client()
-job_config = bigquery.QueryJobConfig(use_query_cache=True)
-
 # Request model
 class TopProductsRequest(BaseModel):
     start_date: str
     end_date: str
     limit: int = 100
 
+    _normalize_days = day_validator("start_date", "end_date")
+
 # Response model
 class TopProductsResponse(BaseModel):
     dates: List[str]
     data: Dict[int, List[int]]
 
-# Query function
-def get_top_products(start_date: str, end_date: str, limit: int) -> Dict[str, Any]:
-    query = f"""
+# Fallback query: dates and limit are parameters, so the text never changes
+TOP_PRODUCTS_QUERY = """
     WITH FilteredProducts AS (
       SELECT 
         product_id,
@@ -31,12 +40,12 @@ def get_top_products(start_date: str, end_date: str, limit: int) -> Dict[str, An
       FROM 
         `allwebi.mv_daily_product_sales`
       WHERE 
-        order_date BETWEEN '{start_date}' AND '{end_date}'
+        order_date BETWEEN @start_date AND @end_date
       GROUP BY 
         product_id
       ORDER BY 
         total_purchase_quantity DESC
-      LIMIT {limit}
+      LIMIT @limit
     )
     SELECT
       dd.item_date,
@@ -52,34 +61,127 @@ def get_top_products(start_date: str, end_date: str, limit: int) -> Dict[str, An
       dd.item_date = dps.order_date
       AND fp.product_id = dps.product_id
     WHERE
-      dd.item_date BETWEEN '{start_date}' AND '{end_date}'
+      dd.item_date BETWEEN @start_date AND @end_date
       AND dd.type = 1  # Add the condition here
     GROUP BY
       dd.item_date, fp.product_id
     ORDER BY
       dd.item_date, fp.product_id
     """
-    query_job = client.query(query, job_config=job_config)
-    results = list(query_job.result())  # Convert the result iterator to a list
 
-    dates = sorted({row['item_date'] for row in results})
-    data = defaultdict(lambda: [0] * len(dates))
+# Query function
+def get_top_products(start_date: str, end_date: str, limit: int, client: bigquery.Client) -> Dict[str, Any]:
+    job_config = query_job_config("top_products")
+    job_config.query_parameters = [
+        bigquery.ScalarQueryParameter("start_date", "DATE", date.fromisoformat(start_date)),
+        bigquery.ScalarQueryParameter("end_date", "DATE", date.fromisoformat(end_date)),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    query_job = client.query(TOP_PRODUCTS_QUERY, job_config=job_config)
+    table = fetch_arrow(query_job)
+    if table.num_rows == 0:
+        return {"dates": [], "data": {}}
+
+    # Fill the product x date matrix straight from the Arrow columns
+    item_dates = table.column("item_date").to_numpy()
+    dates, date_index = np.unique(item_dates, return_inverse=True)
+    product_ids, product_index = np.unique(table.column("product_id").to_numpy(zero_copy_only=False), return_inverse=True)
+
+    matrix = np.zeros((len(product_ids), len(dates)), dtype=np.int64)
+    matrix[product_index, date_index] = table.column("total_quantity").to_numpy(zero_copy_only=False)
+
+    data = {product_id: quantities for product_id, quantities in zip(product_ids.tolist(), matrix.tolist())}
+    return {"dates": dates.tolist(), "data": data}
+
+DAILY_PRODUCTS_QUERY = """
+    SELECT
+      order_date,
+      product_id,
+      SUM(daily_purchase_quantity) AS total_quantity
+    FROM
+      `allwebi.mv_daily_product_sales`
+    WHERE
+      order_date BETWEEN @start_date AND @end_date
+    GROUP BY
+      order_date, product_id
+"""
+
+CALENDAR_QUERY = """
+    SELECT item_date
+    FROM `allwebi.tb_date_dimension`
+    WHERE item_date BETWEEN @start_date AND @end_date AND type = 1
+"""
+
+# Product ids as dict keys the way the cache's JSON stores them, so fresh
+# and cached days merge under the same keys
+def product_key(product_id: Any) -> str:
+    return product_id if isinstance(product_id, str) else json.dumps(product_id)
+
+# Per-day product quantities for one date range; every day gets an entry
+# {"calendar": whether it is a report date, "products": {product_id: qty}}
+def get_top_products_days(start: date, end: date, client: bigquery.Client) -> Dict[date, Dict[str, Any]]:
+    range_config = query_job_config("top_products")
+    range_config.query_parameters = [
+        bigquery.ScalarQueryParameter("start_date", "DATE", start),
+        bigquery.ScalarQueryParameter("end_date", "DATE", end),
+    ]
+    sales_job = client.query(DAILY_PRODUCTS_QUERY, job_config=range_config)
+    calendar_job = client.query(CALENDAR_QUERY, job_config=range_config)
 
-    date_index = {date: idx for idx, date in enumerate(dates)}
+    values = {day: {"calendar": False, "products": {}} for day in day_range(start, end)}
+    for item_date in fetch_columns(calendar_job).get("item_date", []):
+        values[parse_day(item_date)]["calendar"] = True
+    sales = fetch_columns(sales_job)
+    for order_date, product_id, quantity in zip(sales.get("order_date", []), sales.get("product_id", []), sales.get("total_quantity", [])):
+        values[parse_day(order_date)]["products"][product_key(product_id)] = quantity
+    return values
 
-    for row in results:
-        item_date = row['item_date']
-        product_id = row['product_id']
-        total_quantity = row['total_quantity']
+# Top products from the day-partitioned cache: ranks over every day in the
+# window, then lays the quantities out on the report dates
+async def load_top_products(request: TopProductsRequest, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache) -> Dict[str, Any]:
+    start, end = parse_day(request.start_date), parse_day(request.end_date)
+    if start is None or end is None or start > end:
+        return await executor.run(get_top_products, request.start_date, request.end_date, request.limit, client)
 
-        data[product_id][date_index[item_date]] = total_quantity
+    days = await load_daily_series(
+        cache, "top_products:day", None, start, end,
+        lambda a, b: executor.run(get_top_products_days, a, b, client),
+    )
+
+    totals: Dict[str, int] = {}
+    for _, value in days:
+        for product_id, quantity in value["products"].items():
+            totals[product_id] = totals.get(product_id, 0) + (quantity or 0)
+    # 数字 ID 按数值排序，与 SQL 的顺序一致
+    top = sorted(sorted(totals, key=lambda p: (-totals[p], id_sort_key(p)))[:max(request.limit, 0)], key=id_sort_key)
+
+    calendar = [(day, value["products"]) for day, value in days if value["calendar"]]
+    if not top or not calendar:
+        return {"dates": [], "data": {}}
+    return {
+        "dates": [day for day, _ in calendar],
+        "data": {product_id: [products.get(product_id) or 0 for _, products in calendar] for product_id in top},
+    }
 
-    return {"dates": dates, "data": dict(data)}
+# Response data, shared by the endpoint and the dashboard endpoint
+async def top_products_data(request: TopProductsRequest, client: bigquery.Client, executor: QueryExecutor, cache: ResultCache, rollup: Optional[RollupStore]) -> Dict[str, Any]:
+    # 本地汇总覆盖该日期范围时直接返回
+    if rollup is not None:
+        local = rollup.top_products(request.start_date, request.end_date, request.limit)
+        if local is not None:
+            return local
+
+    return await cache.get_or_load(
+        "top_products", request, settings.cache_ttl_top_products,
+        lambda: load_top_products(request, client, executor, cache),
+    )
 
-@router.post("/top-products", response_model=TopProductsResponse)
-async def top_products(request: TopProductsRequest):
+@router.post("/top-products", response_model=TopProductsResponse, response_class=FastJSONResponse)
+async def top_products(request: TopProductsRequest, http_request: Request, client: bigquery.Client = Depends(get_bigquery_client), executor: QueryExecutor = Depends(get_query_executor), cache: ResultCache = Depends(get_result_cache), rollup: Optional[RollupStore] = Depends(get_rollup_store)):
     try:
-        response_data = get_top_products(request.start_date, request.end_date, request.limit)
-        return response_data
+        response_data = await top_products_data(request, client, executor, cache, rollup)
+        return matrix_response(http_request, response_data)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import order, top_products, product_analysis, daily_product_report, product_sales_analysis_spu, product_sales_report, product_sales_summary, get_zero_sales_products
+from app.api.endpoints import order, top_products, product_analysis, daily_product_report, product_sales_analysis_spu, product_sales_report, product_sales_summary, get_zero_sales_products, cache, dashboard, metrics
 
 api_router = APIRouter()
 api_router.include_router(order.router, prefix="/api", tags=["orders"])
@@ -9,4 +9,7 @@ api_router.include_router(daily_product_report.router, prefix="/api", tags=["dai
 api_router.include_router(product_sales_analysis_spu.router, prefix="/api", tags=["product_sales_analysis_spu"])
 api_router.include_router(product_sales_report.router, prefix="/api", tags=["product_sales_report"])
 api_router.include_router(product_sales_summary.router, prefix="/api", tags=["product_sales_summary"])
-api_router.include_router(get_zero_sales_products.router, prefix="/api", tags=["get_zero_sales_products"])
\ No newline at end of file
+api_router.include_router(get_zero_sales_products.router, prefix="/api", tags=["get_zero_sales_products"])
+api_router.include_router(cache.router, prefix="/api", tags=["cache"])
+api_router.include_router(dashboard.router, prefix="/api", tags=["dashboard"])
+api_router.include_router(metrics.router, tags=["metrics"])
@@ -0,0 +1,42 @@
+from typing import List
+
+from fastapi import HTTPException
+from google.cloud import bigquery
+
+from app.core.config import settings
+
+
+# Batch endpoints take several product groups at once and answer them with
+# one grouped query; groups travel as a flat (group_index, product_id) array.
+def check_groups(groups: List[List[str]]) -> None:
+    if len(groups) > settings.batch_max_groups:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_groups} groups per request")
+
+
+def group_products_param(groups: List[List[str]]) -> bigquery.ArrayQueryParameter:
+    struct_type = bigquery.StructQueryParameterType(
+        bigquery.ScalarQueryParameterType("INT64", name="group_index"),
+        bigquery.ScalarQueryParameterType("STRING", name="product_id"),
+    )
+    return bigquery.ArrayQueryParameter(
+        "group_products",
+        struct_type,
+        [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter("group_index", "INT64", index),
+                bigquery.ScalarQueryParameter("product_id", "STRING", product_id),
+            )
+            for index, product_ids in enumerate(groups)
+            for product_id in sorted(set(product_ids))
+        ],
+    )
+
+
+# DISTINCT so a product listed twice in one group is only counted once
+GROUP_PRODUCTS_CTE = """
+    group_products AS (
+        SELECT DISTINCT gp.group_index, gp.product_id
+        FROM UNNEST(@group_products) AS gp
+    )
+"""
@@ -0,0 +1,360 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.rows import Row
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is only needed for CACHE_BACKEND=redis
+    aioredis = None
+
+
+def hash_key(namespace: str, value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+
+def make_cache_key(namespace: str, params: BaseModel, exclude: Optional[Set[str]] = None) -> str:
+    return hash_key(namespace, params.model_dump(exclude=exclude))
+
+
+# Serialization: tagged JSON (so date/datetime/Decimal/bytes round-trip
+# unchanged) compressed with zlib, behind a fixed header holding the
+# fresh/stale deadlines as unix timestamps.
+_HEADER = struct.Struct("!dd")
+
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    if isinstance(value, bytes):
+        return {"$b": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, Row):
+        # 行模型按普通 dict 缓存，读出后仍按同样的 JSON 输出
+        return value.as_dict()
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def _decode_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        if "$d" in obj:
+            return date.fromisoformat(obj["$d"])
+        if "$dec" in obj:
+            return Decimal(obj["$dec"])
+        if "$b" in obj:
+            return base64.b64decode(obj["$b"])
+    return obj
+
+
+def encode_entry(value: Any, fresh_until: float, stale_until: float) -> bytes:
+    payload = json.dumps(value, default=_encode_default, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(fresh_until, stale_until) + zlib.compress(payload, 6)
+
+
+def decode_entry(data: bytes) -> Tuple[Any, float, float]:
+    fresh_until, stale_until = _HEADER.unpack_from(data)
+    payload = zlib.decompress(data[_HEADER.size:])
+    return json.loads(payload, object_hook=_decode_hook), fresh_until, stale_until
+
+
+# Backend interface: stores opaque blobs with an expiry in seconds.
+class CacheBackend:
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    # Deletes every key starting with ``prefix``, returns how many
+    async def delete_prefix(self, prefix: str) -> int:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+# Per-process LRU bounded by the total size of the stored blobs
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._size = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return data
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        if len(data) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, data)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        _, data = self._entries.pop(key)
+        self._size -= len(data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Shared across workers; works with Redis or any server speaking its protocol
+class RedisCacheBackend(CacheBackend):
+    def __init__(self, url: str, prefix: str = "bia:"):
+        if aioredis is None:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(self.prefix + key)
+
+    async def set(self, key: str, data: bytes, ttl: float) -> None:
+        await self._redis.set(self.prefix + key, data, px=max(int(ttl * 1000), 1))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def delete_prefix(self, prefix: str) -> int:
+        # 用 SCAN 而不是 KEYS，避免阻塞服务端；前缀中的通配符转义后按字面匹配
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in self.prefix + prefix) + "*"
+        deleted = 0
+        batch = []
+        async for key in self._redis.scan_iter(match=pattern, count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += await self._redis.delete(*batch)
+                batch = []
+        if batch:
+            deleted += await self._redis.delete(*batch)
+        return deleted
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+# Report result cache: TTL per endpoint, optional stale-while-revalidate
+# window refreshed in the background, and singleflight so that concurrent
+# identical requests in this process share one query.
+class ResultCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        params: BaseModel,
+        ttl: float,
+        loader: Callable[[], Awaitable[Any]],
+        stale_ttl: float = 0,
+        exclude: Optional[Set[str]] = None,
+    ) -> Any:
+        key = make_cache_key(namespace, params, exclude)
+
+        data = await self.backend.get(key)
+        if data is not None:
+            value, fresh_until, stale_until = decode_entry(data)
+            now = time.time()
+            if now < fresh_until:
+                self.hits += 1
+                return value
+            if now < stale_until:
+                # 先返回旧结果，后台刷新
+                self.stale_hits += 1
+                self._schedule_refresh(key, ttl, stale_ttl, loader)
+                return value
+
+        # 相同请求正在查询中，等待同一个结果
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        return await asyncio.shield(self._start(key, ttl, stale_ttl, loader))
+
+    # Returns a cached value (fresh or stale) without ever querying
+    async def peek(self, namespace: str, params: BaseModel, exclude: Optional[Set[str]] = None) -> Optional[Any]:
+        data = await self.backend.get(make_cache_key(namespace, params, exclude))
+        if data is None:
+            return None
+        value, _, stale_until = decode_entry(data)
+        return value if time.time() < stale_until else None
+
+    # Plain keyed access for callers that manage their own keys and loading
+    async def get_fresh(self, key: str) -> Optional[Any]:
+        data = await self.backend.get(key)
+        if data is None:
+            return None
+        value, fresh_until, _ = decode_entry(data)
+        return value if time.time() < fresh_until else None
+
+    async def put(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        await self.backend.set(key, encode_entry(value, now + ttl, now + ttl), ttl)
+
+    # Loads a value in the background unless it is already being loaded
+    def prefetch(
+        self,
+        namespace: str,
+        params: BaseModel,
+        ttl: float,
+        loader: Callable[[], Awaitable[Any]],
+        stale_ttl: float = 0,
+        exclude: Optional[Set[str]] = None,
+    ) -> None:
+        self._schedule_refresh(make_cache_key(namespace, params, exclude), ttl, stale_ttl, loader)
+
+    def _schedule_refresh(
+        self,
+        key: str,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> None:
+        if key in self._inflight:
+            return
+        self.refreshes += 1
+        self._start(key, ttl, stale_ttl, loader).add_done_callback(self._count_refresh_error)
+
+    # Every load runs in a task owned by the cache. Callers only await it
+    # through asyncio.shield, so a cancelled caller (client disconnect) stops
+    # its own wait without cancelling the load the other callers share.
+    def _start(
+        self,
+        key: str,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> asyncio.Task:
+        task = asyncio.create_task(self._load(key, ttl, stale_ttl, loader))
+        self._inflight[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._finish)
+        return task
+
+    def _finish(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # 没有等待者时避免出现 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
+
+    def _count_refresh_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_errors += 1
+
+    async def _load(
+        self,
+        key: str,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        try:
+            value = await loader()
+            now = time.time()
+            await self.backend.set(key, encode_entry(value, now + ttl, now + ttl + stale_ttl), ttl + stale_ttl)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    # Drops every entry of a namespace (its pages, per-day entries and
+    # totals all use keys starting with "<namespace>:"), e.g. after the
+    # underlying tables were reloaded
+    async def invalidate(self, namespace: str) -> int:
+        return await self.backend.delete_prefix(namespace + ":")
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+        stats.update(self.backend.stats())
+        return stats
+
+
+def create_result_cache() -> ResultCache:
+    if settings.cache_backend == "redis":
+        backend = RedisCacheBackend(settings.cache_redis_url)
+    elif settings.cache_backend == "memory":
+        backend = MemoryCacheBackend(max_bytes=settings.cache_max_bytes)
+    else:
+        raise ValueError(f"Unknown cache backend: {settings.cache_backend}")
+    return ResultCache(backend)
+
+
+# Dependency
+def get_result_cache(request: Request) -> ResultCache:
+    return request.app.state.result_cache
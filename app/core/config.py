@@ -0,0 +1,101 @@
+import os
+from typing import Dict
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_int_map(name: str) -> Dict[str, int]:
+    # "a=1,b=2" -> {"a": 1, "b": 2}
+    result = {}
+    for item in (os.getenv(name) or "").split(","):
+        key, _, value = item.partition("=")
+        if key.strip() and value.strip():
+            result[key.strip()] = int(value)
+    return result
+
+
+class Settings:
+    def __init__(self):
+        # BigQuery 客户端；BIGQUERY_BACKEND=memory 使用本地内存替身（测试用）
+        self.bigquery_backend = os.getenv("BIGQUERY_BACKEND", "bigquery")
+        self.bigquery_project = os.getenv("BIGQUERY_PROJECT") or None
+        self.bigquery_pool_connections = _env_int("BIGQUERY_POOL_CONNECTIONS", 10)
+        self.bigquery_pool_maxsize = _env_int("BIGQUERY_POOL_MAXSIZE", 32)
+        self.bigquery_max_retries = _env_int("BIGQUERY_MAX_RETRIES", 3)
+        # 结果行数达到该值时改用 Storage Read API 拉取（0 表示不使用）
+        self.bigquery_storage_min_rows = _env_int("BIGQUERY_STORAGE_MIN_ROWS", 100000)
+
+        # 查询线程池与背压
+        self.query_max_workers = _env_int("QUERY_MAX_WORKERS", 8)
+        self.query_max_pending = _env_int("QUERY_MAX_PENDING", 16)
+        self.query_retry_after = _env_int("QUERY_RETRY_AFTER", 2)
+
+        # 查询成本护栏：单个查询最多计费字节数、作业超时（毫秒），0 表示不限；
+        # 按接口覆盖，例如 QUERY_MAX_BYTES_BILLED_OVERRIDES="product_analysis=200000000000"
+        self.query_max_bytes_billed = _env_int("QUERY_MAX_BYTES_BILLED", 0)
+        self.query_max_bytes_billed_overrides = _env_int_map("QUERY_MAX_BYTES_BILLED_OVERRIDES")
+        self.query_timeout_ms = _env_int("QUERY_TIMEOUT_MS", 0)
+        self.query_timeout_ms_overrides = _env_int_map("QUERY_TIMEOUT_MS_OVERRIDES")
+
+        # 报表结果缓存（秒）
+        self.cache_backend = os.getenv("CACHE_BACKEND", "memory")
+        self.cache_redis_url = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+        self.cache_max_bytes = _env_int("CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        self.cache_ttl_top_products = _env_int("CACHE_TTL_TOP_PRODUCTS", 300)
+        self.cache_ttl_product_sales_report = _env_int("CACHE_TTL_PRODUCT_SALES_REPORT", 300)
+        self.cache_ttl_product_sales_summary = _env_int("CACHE_TTL_PRODUCT_SALES_SUMMARY", 300)
+        self.cache_ttl_product_sales_analysis_spu = _env_int("CACHE_TTL_PRODUCT_SALES_ANALYSIS_SPU", 600)
+        self.cache_stale_ttl_product_sales_analysis_spu = _env_int("CACHE_STALE_TTL_PRODUCT_SALES_ANALYSIS_SPU", 3600)
+        self.cache_ttl_report_totals = _env_int("CACHE_TTL_REPORT_TOTALS", 600)
+        # 按天缓存的时间序列：已结束的日期长期缓存，今天及以后短期缓存
+        self.cache_ttl_closed_day = _env_int("CACHE_TTL_CLOSED_DAY", 86400)
+        self.cache_ttl_open_day = _env_int("CACHE_TTL_OPEN_DAY", 300)
+
+        # 报表导出：每次从结果中读取的行数
+        self.export_page_size = _env_int("EXPORT_PAGE_SIZE", 10000)
+
+        # 批量接口每次最多的商品分组数
+        self.batch_max_groups = _env_int("BATCH_MAX_GROUPS", 50)
+        # 组合接口每次最多的子报表数
+        self.dashboard_max_parts = _env_int("DASHBOARD_MAX_PARTS", 20)
+        # 订单批量创建每次最多的条数
+        self.orders_bulk_max = _env_int("ORDERS_BULK_MAX", 1000)
+
+        # 订单存储：sqlite（WAL 模式，重启后保留）或 memory；读连接池大小、每次合并提交的最多请求数
+        self.orders_backend = os.getenv("ORDERS_BACKEND", "sqlite")
+        self.orders_sqlite_path = os.getenv("ORDERS_SQLITE_PATH", "/var/tmp/bia-orders.sqlite3")
+        self.orders_pool_size = _env_int("ORDERS_POOL_SIZE", 4)
+        self.orders_commit_max_batch = _env_int("ORDERS_COMMIT_MAX_BATCH", 256)
+
+        # 维度表（站点、部门、汇率）刷新间隔（秒）
+        self.dimension_refresh_interval = _env_int("DIMENSION_REFRESH_INTERVAL", 600)
+
+        # 本地销量汇总（ROLLUP_ENABLED=1 开启）：保留天数、每次重新同步的天数、同步间隔（秒）
+        self.rollup_enabled = bool(_env_int("ROLLUP_ENABLED", 0))
+        self.rollup_dir = os.getenv("ROLLUP_DIR", "/var/tmp/bia-rollup")
+        self.rollup_history_days = _env_int("ROLLUP_HISTORY_DAYS", 400)
+        self.rollup_resync_days = _env_int("ROLLUP_RESYNC_DAYS", 3)
+        self.rollup_sync_interval = _env_int("ROLLUP_SYNC_INTERVAL", 900)
+
+        # 零销量商品位图索引（ZERO_SALES_INDEX_ENABLED=1 开启）：刷新间隔（秒）；
+        # 超过最长使用时间仍未刷新成功时（例如刷新一直失败）回退到 BigQuery
+        self.zero_sales_index_enabled = bool(_env_int("ZERO_SALES_INDEX_ENABLED", 0))
+        self.zero_sales_index_refresh_interval = _env_int("ZERO_SALES_INDEX_REFRESH_INTERVAL", 900)
+        self.zero_sales_index_max_age = _env_int("ZERO_SALES_INDEX_MAX_AGE", 3 * self.zero_sales_index_refresh_interval)
+
+        # 标题 / 标签搜索的本地倒排索引（SEARCH_INDEX_ENABLED=1 开启）：增量刷新间隔、全量重建间隔（秒），
+        # 命中商品数超过上限时仍由 BigQuery 按正则过滤
+        self.search_index_enabled = bool(_env_int("SEARCH_INDEX_ENABLED", 0))
+        self.search_index_refresh_interval = _env_int("SEARCH_INDEX_REFRESH_INTERVAL", 300)
+        self.search_index_rebuild_interval = _env_int("SEARCH_INDEX_REBUILD_INTERVAL", 86400)
+        self.search_index_max_ids = _env_int("SEARCH_INDEX_MAX_IDS", 20000)
+
+        # 报表快照（秒 / 字节），保存在创建它的 worker 进程内存中
+        self.snapshot_ttl = _env_int("SNAPSHOT_TTL", 900)
+        self.snapshot_max_bytes = _env_int("SNAPSHOT_MAX_BYTES", 256 * 1024 * 1024)
+
+
+settings = Settings()
@@ -0,0 +1,116 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from google.cloud import bigquery
+
+# Everything that turns an order amount into USD goes through this module,
+# either locally (ExchangeRateMatrix) or in SQL (usd_amount_sql and
+# usd_factor_join_sql over the usd_factors parameter), so every endpoint
+# applies the same rule: USD passes through, other currencies go
+# amount * rate_to_cny / usd_rate_to_cny, rounded to cents, and a missing
+# rate for the month yields NULL.
+
+
+def round_half_away(values: np.ndarray, decimals: int = 2) -> np.ndarray:
+    # BigQuery ROUND rounds halves away from zero; np.round would not
+    scale = 10.0 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def to_optional_list(values: np.ndarray) -> List[Optional[float]]:
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result.tolist()
+
+
+def to_float_array(values: Sequence[Any]) -> np.ndarray:
+    # 没有 NULL 的数值列直接转换；含 None / Decimal 的 object 列逐个转换
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return values.astype(np.float64)
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+
+# (currency, month) -> rate matrices held as NumPy arrays, so a whole
+# result column is converted with one fancy-indexing pass.
+class ExchangeRateMatrix:
+    def __init__(self, rates: Dict[Tuple[str, str], float]):
+        self.currencies = sorted({currency for currency, _ in rates if currency})
+        self.months = sorted({month for _, month in rates if month})
+        self._currency_index = {currency: i for i, currency in enumerate(self.currencies)}
+        self._month_index = {month: j for j, month in enumerate(self.months)}
+
+        # 多留一行一列作为“未知币种 / 月份”，值为 NaN
+        self.cny = np.full((len(self.currencies) + 1, len(self.months) + 1), np.nan)
+        for (currency, month), rate in rates.items():
+            if currency in self._currency_index and month in self._month_index and rate is not None:
+                self.cny[self._currency_index[currency], self._month_index[month]] = rate
+
+        usd_row = self.cny[self._currency_index["USD"]] if "USD" in self._currency_index else np.full(self.cny.shape[1], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.usd = self.cny / usd_row
+        self.usd[~np.isfinite(self.usd)] = np.nan
+
+    def _indexes(self, currencies: Sequence[Optional[str]], months: Sequence[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        unknown_currency = len(self.currencies)
+        unknown_month = len(self.months)
+        rows = np.fromiter((self._currency_index.get(c, unknown_currency) for c in currencies), dtype=np.intp, count=len(currencies))
+        cols = np.fromiter((self._month_index.get(m, unknown_month) for m in months), dtype=np.intp, count=len(months))
+        return rows, cols
+
+    def cny_rates(self, currencies: Sequence[Optional[str]], months: Sequence[Optional[str]]) -> np.ndarray:
+        rows, cols = self._indexes(currencies, months)
+        return self.cny[rows, cols]
+
+    def usd_factors(self, currencies: Sequence[Optional[str]], months: Sequence[Optional[str]]) -> np.ndarray:
+        rows, cols = self._indexes(currencies, months)
+        factors = self.usd[rows, cols]
+        is_usd = np.fromiter((c == "USD" for c in currencies), dtype=bool, count=len(currencies))
+        factors[is_usd] = 1.0
+        return factors
+
+    def convert_to_usd(
+        self,
+        amounts: Sequence[Any],
+        currencies: Sequence[Optional[str]],
+        months: Sequence[Optional[str]],
+    ) -> np.ndarray:
+        # USD 原样返回，只对换算出的金额四舍五入
+        values = to_float_array(amounts)
+        is_usd = np.fromiter((c == "USD" for c in currencies), dtype=bool, count=len(currencies))
+        return np.where(is_usd, values, round_half_away(values * self.usd_factors(currencies, months)))
+
+
+# SQL side: the same conversion against the @usd_factors array parameter
+def usd_factor_join_sql(site_column: str, month_column: str, alias: str = "fx") -> str:
+    return (
+        f"LEFT JOIN UNNEST(@usd_factors) AS {alias} "
+        f"ON {alias}.site_id = {site_column} AND {alias}.order_month = {month_column}"
+    )
+
+
+def usd_amount_sql(amount_column: str, alias: str = "fx") -> str:
+    return f"IF({alias}.is_usd, {amount_column}, ROUND({amount_column} * {alias}.usd_factor, 2))"
+
+
+def usd_factors_param(factors: Sequence[Tuple[int, str, float, bool]]) -> bigquery.ArrayQueryParameter:
+    # 显式给出 STRUCT 类型，空数组时也能构造参数
+    struct_type = bigquery.StructQueryParameterType(
+        bigquery.ScalarQueryParameterType("INT64", name="site_id"),
+        bigquery.ScalarQueryParameterType("STRING", name="order_month"),
+        bigquery.ScalarQueryParameterType("FLOAT64", name="usd_factor"),
+        bigquery.ScalarQueryParameterType("BOOL", name="is_usd"),
+    )
+    return bigquery.ArrayQueryParameter(
+        "usd_factors",
+        struct_type,
+        [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter("site_id", "INT64", site_id),
+                bigquery.ScalarQueryParameter("order_month", "STRING", month),
+                bigquery.ScalarQueryParameter("usd_factor", "FLOAT64", factor),
+                bigquery.ScalarQueryParameter("is_usd", "BOOL", is_usd),
+            )
+            for site_id, month, factor, is_usd in factors
+        ],
+    )
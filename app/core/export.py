@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.responses import decimal_value
+from app.db.executor import QueryExecutor
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+# Full-report export: the query result is read one Arrow record batch at a
+# time (each fetch runs on the query executor), encoded and sent right away,
+# so memory stays at one page no matter how many rows the report has.
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return decimal_value(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    raise TypeError(f"Cannot export value of type {type(value).__name__}")
+
+
+def _encode_ndjson(columns: Dict[str, List[Any]], write_header: bool) -> str:
+    names = list(columns)
+    return "".join(
+        json.dumps(dict(zip(names, values)), default=_json_default, ensure_ascii=False) + "\n"
+        for values in zip(*columns.values())
+    )
+
+
+def _encode_csv(columns: Dict[str, List[Any]], write_header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if write_header:
+        writer.writerow(list(columns))
+    writer.writerows(zip(*columns.values()))
+    return buffer.getvalue()
+
+
+_ENCODERS = {"ndjson": _encode_ndjson, "csv": _encode_csv}
+
+
+def _open_batches(query_job, page_size: int):
+    result = query_job.result(page_size=page_size)
+    return iter(result.to_arrow_iterable())
+
+
+def _next_batch(batches) -> Optional[Dict[str, List[Any]]]:
+    batch = next(batches, None)
+    if batch is None:
+        return None
+    columns = batch.to_pydict()
+    # NUMERIC 列与 JSON 接口保持一致（int / float），CSV 也按同样的值输出
+    for name, values in columns.items():
+        if any(isinstance(value, Decimal) for value in values):
+            columns[name] = [decimal_value(value) if isinstance(value, Decimal) else value for value in values]
+    return columns
+
+
+async def _stream_rows(
+    executor: QueryExecutor,
+    batches,
+    export_format: str,
+    use_gzip: bool,
+    transform: Optional[Callable[[Dict[str, List[Any]]], None]],
+) -> AsyncIterator[bytes]:
+    encode = _ENCODERS[export_format]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+    first = True
+    try:
+        while True:
+            # 导出开始时已通过准入检查，后续批次不再因繁忙被拒绝而中途截断
+            columns = await executor.run_admitted(_next_batch, batches)
+            if columns is None:
+                break
+            if transform is not None:
+                transform(columns)
+            data = encode(columns, first).encode("utf-8")
+            first = False
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    except Exception:
+        # 响应头已经发出，只能中断输出
+        logger.exception("Report export failed")
+        raise
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _accepts_gzip(request: Request) -> bool:
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+# Starts the query and waits for it to finish before any byte is sent, so
+# query errors and executor back-pressure still become normal HTTP errors.
+async def export_response(
+    request: Request,
+    executor: QueryExecutor,
+    start_query: Callable[[], Any],
+    export_format: str,
+    filename: str,
+    transform: Optional[Callable[[Dict[str, List[Any]]], None]] = None,
+) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {export_format}")
+
+    query_job = await executor.run(start_query)
+    batches = await executor.run(_open_batches, query_job, settings.export_page_size)
+
+    use_gzip = _accepts_gzip(request)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(
+        _stream_rows(executor, batches, export_format, use_gzip, transform),
+        media_type=EXPORT_FORMATS[export_format],
+        headers=headers,
+    )
@@ -0,0 +1,169 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# Request instrumentation: phases (queue wait, job submit, execution, result
+# download, row conversion, serialization) are collected per request and
+# flushed into per-route histograms when the response is ready, together
+# with a Server-Timing header. Work the request started that runs on after
+# the flush (streamed export batches, stale-while-revalidate refreshes,
+# count prefetches) is observed directly under the request's route. Work
+# outside a request (dimension refresh, rollup sync) is recorded under
+# route="background".
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BACKGROUND_ROUTE = "background"
+
+REQUEST_SECONDS = Histogram(
+    "bia_request_duration_seconds", "HTTP request latency",
+    ["route", "method", "status"], buckets=PHASE_BUCKETS,
+)
+PHASE_SECONDS = Histogram(
+    "bia_request_phase_seconds", "Time spent in each phase of a request",
+    ["route", "phase"], buckets=PHASE_BUCKETS,
+)
+RESULT_ROWS = Histogram(
+    "bia_result_rows", "Rows returned per query result",
+    ["route"], buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000),
+)
+BIGQUERY_JOBS = Counter("bia_bigquery_jobs_total", "Finished BigQuery jobs", ["route", "cache_hit"])
+BIGQUERY_BYTES = Counter("bia_bigquery_bytes_processed_total", "Bytes processed by BigQuery jobs", ["route"])
+BIGQUERY_SLOT_MS = Counter("bia_bigquery_slot_milliseconds_total", "Slot time used by BigQuery jobs", ["route"])
+
+
+class RequestTimings:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.rows: list = []
+        self.jobs: list = []
+        # flush 之后设置；之后的记录直接写入该路由的直方图
+        self.route: Optional[str] = None
+        # 查询在线程池中执行，多个线程会同时写入
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            route = self.route
+            if route is None:
+                self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+                return
+        PHASE_SECONDS.labels(route, phase).observe(seconds)
+
+    def add_rows(self, count: int) -> None:
+        with self._lock:
+            route = self.route
+            if route is None:
+                self.rows.append(count)
+                return
+        RESULT_ROWS.labels(route).observe(count)
+
+    def add_job(self, stats: Tuple[bool, int, int]) -> None:
+        with self._lock:
+            route = self.route
+            if route is None:
+                self.jobs.append(stats)
+                return
+        _observe_job(route, *stats)
+
+    def flush(self, route: str) -> None:
+        with self._lock:
+            self.route = route
+            phases, rows, jobs = self.phases, self.rows, self.jobs
+        for phase, seconds in phases.items():
+            PHASE_SECONDS.labels(route, phase).observe(seconds)
+        for count in rows:
+            RESULT_ROWS.labels(route).observe(count)
+        for stats in jobs:
+            _observe_job(route, *stats)
+
+    def server_timing(self, total: float) -> str:
+        parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in self.phases.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is None:
+        PHASE_SECONDS.labels(BACKGROUND_ROUTE, phase).observe(seconds)
+    else:
+        timings.add(phase, seconds)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - started)
+
+
+def record_rows(count: int) -> None:
+    timings = _timings.get()
+    if timings is None:
+        RESULT_ROWS.labels(BACKGROUND_ROUTE).observe(count)
+    else:
+        timings.add_rows(count)
+
+
+def record_job(job: Any) -> None:
+    stats = (
+        bool(getattr(job, "cache_hit", False)),
+        getattr(job, "total_bytes_processed", None) or 0,
+        getattr(job, "slot_millis", None) or 0,
+    )
+    timings = _timings.get()
+    if timings is None:
+        _observe_job(BACKGROUND_ROUTE, *stats)
+    else:
+        timings.add_job(stats)
+
+
+def _observe_job(route: str, cache_hit: bool, bytes_processed: int, slot_ms: int) -> None:
+    BIGQUERY_JOBS.labels(route, "true" if cache_hit else "false").inc()
+    BIGQUERY_BYTES.labels(route).inc(bytes_processed)
+    BIGQUERY_SLOT_MS.labels(route).inc(slot_ms)
+
+
+def _route_label(request: Request) -> str:
+    # 用路由模板而不是实际路径，避免标签无限增长
+    template = getattr(request.scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    # 较新的 FastAPI 不再复制被 include 的路由，scope 中是原路由，
+    # include_router 的前缀记在 scope["fastapi"]["included_router"] 上
+    included = (request.scope.get("fastapi") or {}).get("included_router")
+    return getattr(getattr(included, "include_context", None), "prefix", "") + template
+
+
+# HTTP middleware
+async def instrument_request(request: Request, call_next) -> Response:
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        _timings.reset(token)
+        elapsed = time.perf_counter() - started
+        route = _route_label(request)
+        REQUEST_SECONDS.labels(route, request.method, str(status)).observe(elapsed)
+        timings.flush(route)
+
+    response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
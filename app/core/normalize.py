@@ -0,0 +1,94 @@
+import re
+from datetime import date, datetime
+from typing import Any, List, Optional
+
+from pydantic import field_validator
+
+
+# Request canonicalization: equivalent requests ("3,1" vs "1, 3", shuffled
+# product ids, end dates past today) are rewritten to one form while the
+# model is parsed, so they share result-cache keys and produce identical
+# BigQuery parameters.
+def id_sort_key(value: str) -> Any:
+    # 数字 ID 按数值排序，其余按字符串
+    return (0, int(value), "") if value.isdigit() else (1, 0, value)
+
+
+def canonical_ids(values: List[str]) -> List[str]:
+    return sorted({str(value).strip() for value in values if str(value).strip()}, key=id_sort_key)
+
+
+def canonical_id_string(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    return ",".join(canonical_ids(str(value).split(",")))
+
+
+def canonical_tag_string(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    # 标签按不区分大小写匹配，统一小写；含转义的正则片段保持原样
+    tags = {tag.strip() if "\\" in tag else tag.strip().lower() for tag in value.split(",")}
+    tags.discard("")
+    return ",".join(sorted(tags))
+
+
+def canonical_day(value: Any) -> Any:
+    if value is None or isinstance(value, date):
+        return value
+    text = re.split(r"[ T]", str(value).strip(), maxsplit=1)[0]
+    if not text:
+        return None
+    return datetime.strptime(text, "%Y-%m-%d").date().isoformat()
+
+
+def clamp_to_today(value: Any) -> Any:
+    # 未来日期没有数据，截到今天
+    if value is None:
+        return value
+    today = date.today()
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return min(value, today)
+    return min(value, today.isoformat())
+
+
+# Reusable validators for the request models. They run before type
+# validation (mode="before"), so they see the raw request values; anything
+# of an unexpected type is passed through for pydantic to reject.
+def _before(fields, normalize):
+    return field_validator(*fields, mode="before")(lambda cls, value: normalize(value))
+
+
+def _id_array(value: Any) -> Any:
+    return canonical_ids(value) if isinstance(value, list) else value
+
+
+def _id_groups(value: Any) -> Any:
+    # 组的顺序决定结果顺序，只整理组内的 ID
+    return [_id_array(group) for group in value] if isinstance(value, list) else value
+
+
+def id_list_validator(*fields: str):
+    return _before(fields, canonical_id_string)
+
+
+def id_array_validator(*fields: str):
+    return _before(fields, _id_array)
+
+
+def id_groups_validator(*fields: str):
+    return _before(fields, _id_groups)
+
+
+def tag_list_validator(*fields: str):
+    return _before(fields, canonical_tag_string)
+
+
+def day_validator(*fields: str):
+    return _before(fields, canonical_day)
+
+
+def end_day_validator(*fields: str):
+    return _before(fields, lambda value: clamp_to_today(canonical_day(value)))
@@ -0,0 +1,105 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from google.cloud import bigquery
+
+
+# One column of a keyset ordering. ``column`` is an output column of the
+# paged CTE; the full list of keys must identify a row uniquely.
+class SortKey:
+    def __init__(self, column: str, param_type: str, descending: bool = True):
+        self.column = column
+        self.param_type = param_type
+        self.descending = descending
+
+
+def order_by_clause(keys: Sequence[SortKey]) -> str:
+    return "ORDER BY " + ", ".join(
+        f"{key.column} {'DESC' if key.descending else 'ASC'}" for key in keys
+    )
+
+
+def encode_cursor(row: Dict[str, Any], keys: Sequence[SortKey]) -> str:
+    values = [row.get(key.column) for key in keys]
+    payload = json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def _parse_value(value: Any, param_type: str) -> Any:
+    if value is None:
+        return None
+    if param_type == "DATE":
+        return date.fromisoformat(str(value)[:10])
+    if param_type in ("TIMESTAMP", "DATETIME"):
+        return datetime.fromisoformat(str(value))
+    if param_type == "FLOAT64":
+        return float(value)
+    if param_type == "INT64":
+        return int(value)
+    return str(value)
+
+
+def decode_cursor(cursor: str, keys: Sequence[SortKey]) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError
+        return [_parse_value(value, key.param_type) for value, key in zip(values, keys)]
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+# Builds "WHERE (k1, k2, ...) after cursor" for the outer paged SELECT.
+# NULL sort values are compared through IS NULL so that rows after a NULL
+# key are not lost (BigQuery sorts NULLs last for DESC, first for ASC).
+def seek_clause(
+    cursor: Optional[str], keys: Sequence[SortKey]
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    if not cursor:
+        return "", []
+
+    values = decode_cursor(cursor, keys)
+    query_params = []
+    alternatives = []
+    equalities: List[str] = []
+    for index, (key, value) in enumerate(zip(keys, values)):
+        name = f"cursor_{index}"
+        if value is None:
+            # DESC: NULLs come last, only other NULLs can follow
+            after = None if key.descending else f"{key.column} IS NOT NULL"
+            equal = f"{key.column} IS NULL"
+        else:
+            query_params.append(bigquery.ScalarQueryParameter(name, key.param_type, value))
+            op = "<" if key.descending else ">"
+            after = f"{key.column} {op} @{name}"
+            if key.descending:
+                after = f"({after} OR {key.column} IS NULL)"
+            equal = f"{key.column} = @{name}"
+        if after is not None:
+            alternatives.append("(" + " AND ".join(equalities + [after]) + ")")
+        equalities.append(equal)
+
+    if not alternatives:
+        return "WHERE FALSE", query_params
+    return "WHERE " + " OR ".join(alternatives), query_params
+
+
+def next_cursor(rows: List[Dict[str, Any]], keys: Sequence[SortKey], limit: int) -> Optional[str]:
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1], keys)
+
+
+# LIMIT/OFFSET as parameters so every page shares one SQL text; cursor
+# requests seek instead and only need the limit
+def page_clause(
+    cursor: Optional[str], page: int, limit: int
+) -> Tuple[str, List[bigquery.ScalarQueryParameter]]:
+    query_params = [bigquery.ScalarQueryParameter("limit", "INT64", limit)]
+    if cursor:
+        return "LIMIT @limit", query_params
+    query_params.append(bigquery.ScalarQueryParameter("offset", "INT64", (page - 1) * limit))
+    return "LIMIT @limit OFFSET @offset", query_params
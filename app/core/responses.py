@@ -0,0 +1,156 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.core.metrics import timed
+from app.core.rows import Row, arrow_types
+
+try:
+    import orjson
+except ImportError:  # falls back to the standard json module
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:  # pyarrow is needed for Arrow responses
+    pyarrow = None
+
+
+# Report rows are typed Row dataclasses (or plain dicts) straight from
+# BigQuery. Returning this response from an endpoint skips FastAPI's
+# response_model validation and the jsonable_encoder walk over every row;
+# the response_model stays on the route for the OpenAPI schema only.
+def decimal_value(value: Decimal) -> Any:
+    # 与 jsonable_encoder 一致：整数用 int，其余用 float
+    return int(value) if value.as_tuple().exponent >= 0 else float(value)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return decimal_value(value)
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Row):
+        # orjson 直接序列化 dataclass，这里只给标准库 json 用
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            return self._dumps(content)
+
+    @staticmethod
+    def _dumps(content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(
+                content,
+                default=_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            )
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+# Opt-in encodings chosen with the Accept header. Columnar JSON sends each
+# column once as an array instead of repeating the names in every row;
+# Arrow IPC sends the same columns as one record batch (the other response
+# fields go into the schema metadata as JSON).
+COLUMNAR_MEDIA_TYPE = "application/vnd.bia.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_ARROW = "arrow"
+_MEDIA_FORMATS = {COLUMNAR_MEDIA_TYPE: FORMAT_COLUMNAR, ARROW_MEDIA_TYPE: FORMAT_ARROW}
+
+
+def response_format(request: Request) -> str:
+    # 取 Accept 中第一个支持的类型，不处理 q 值；其余情况仍返回普通 JSON
+    for media_type in request.headers.get("accept", "").split(","):
+        media_type = media_type.split(";")[0].strip().lower()
+        if media_type in _MEDIA_FORMATS:
+            return _MEDIA_FORMATS[media_type]
+    return FORMAT_JSON
+
+
+class ColumnarJSONResponse(FastJSONResponse):
+    media_type = COLUMNAR_MEDIA_TYPE
+
+
+class ArrowResponse(Response):
+    media_type = ARROW_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        with timed("serialize"):
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_stream(sink, content.schema) as writer:
+                writer.write_table(content)
+            return sink.getvalue().to_pybytes()
+
+
+def columns_from_rows(rows: List[Any], model: Optional[type] = None) -> Dict[str, List[Any]]:
+    # 有 Row 模型时按声明的列输出，空页也有完整的列
+    names = list(model.column_names) if model is not None else (list(rows[0].keys()) if rows else [])
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def _arrow_column(values: List[Any], arrow_type: Optional["pyarrow.DataType"]) -> "pyarrow.Array":
+    if arrow_type is not None:
+        try:
+            return pyarrow.array(values, type=arrow_type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            # 实际类型与声明不符（例如 NUMERIC 列），退回推断
+            pass
+    return pyarrow.array(values)
+
+
+def _arrow_table(columns: Dict[str, List[Any]], fields: Dict[str, Any], model: Optional[type] = None) -> "pyarrow.Table":
+    if pyarrow is None:
+        raise HTTPException(status_code=406, detail="Arrow responses require the 'pyarrow' package")
+    types = arrow_types(model) if model is not None else {}
+    metadata = {name: FastJSONResponse._dumps(value) for name, value in fields.items()}
+    arrays = [_arrow_column(values, types.get(name)) for name, values in columns.items()]
+    return pyarrow.Table.from_arrays(arrays, names=list(columns)).replace_schema_metadata(metadata)
+
+
+# Paged reports: ``result`` is a list of rows of ``model`` (the endpoint's
+# Row class; cached responses come back as dicts)
+def report_response(request: Request, data: Dict[str, Any], model: Optional[type] = None) -> Response:
+    headers = {"Vary": "Accept"}
+    output = response_format(request)
+    if output == FORMAT_JSON:
+        return FastJSONResponse(data, headers=headers)
+    columns = columns_from_rows(data["result"], model)
+    if output == FORMAT_COLUMNAR:
+        return ColumnarJSONResponse({**data, "result": columns}, headers=headers)
+    fields = {name: value for name, value in data.items() if name != "result"}
+    return ArrowResponse(_arrow_table(columns, fields, model), headers=headers)
+
+
+# Top products: {"dates": [...], "data": {product_id: [quantity per date]}}.
+# Columnar JSON lists the product ids and the quantity rows side by side;
+# Arrow has a "date" column and one quantity column per product.
+def matrix_response(request: Request, data: Dict[str, Any]) -> Response:
+    headers = {"Vary": "Accept"}
+    output = response_format(request)
+    if output == FORMAT_JSON:
+        return FastJSONResponse(data, headers=headers)
+    if output == FORMAT_COLUMNAR:
+        return ColumnarJSONResponse({
+            "dates": data["dates"],
+            "product_ids": list(data["data"]),
+            "quantities": list(data["data"].values()),
+        }, headers=headers)
+    columns = {"date": data["dates"]}
+    columns.update((str(product_id), quantities) for product_id, quantities in data["data"].items())
+    return ArrowResponse(_arrow_table(columns, {}), headers=headers)
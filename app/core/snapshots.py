@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import Request
+
+from app.core.config import settings
+from app.db.results import Column, rows_from_columns
+
+
+# A fully materialized report held column by column (NumPy arrays or
+# lists); reading a page only converts the requested slice of each column.
+class Snapshot:
+    def __init__(self, snapshot_id: str, columns: Dict[str, Column], expires_at: float):
+        self.id = snapshot_id
+        self.columns = columns
+        self.expires_at = expires_at
+        self.row_count = len(next(iter(columns.values()))) if columns else 0
+        self.size_bytes = _estimate_size(columns)
+
+    def rows(self, offset: int, limit: int, model: Optional[type] = None) -> List[Any]:
+        return rows_from_columns({name: values[offset:offset + limit] for name, values in self.columns.items()}, model)
+
+
+def _estimate_size(columns: Dict[str, Column]) -> int:
+    size = 0
+    for values in columns.values():
+        if isinstance(values, np.ndarray):
+            size += values.nbytes
+            if values.dtype != object:
+                continue
+        else:
+            size += sys.getsizeof(values)
+        size += sum(sys.getsizeof(value) for value in values)
+    return size
+
+
+def check_snapshot_size(size_bytes: int, max_bytes: int) -> None:
+    if size_bytes > max_bytes:
+        raise ValueError("Result is too large to snapshot, narrow the filters")
+
+
+# Keeps snapshots for SNAPSHOT_TTL seconds and at most SNAPSHOT_MAX_BYTES
+# in total, dropping the oldest snapshots first. Snapshots live in the
+# memory of the worker that created them: with several workers, requests
+# carrying a snapshot_id must reach the same worker (sticky routing, or a
+# single worker for this endpoint), otherwise they get 410 like an
+# expired snapshot.
+class SnapshotStore:
+    def __init__(self, ttl: float = 900, max_bytes: int = 256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._snapshots: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def create(self, columns: Dict[str, Column]) -> Snapshot:
+        snapshot = Snapshot(uuid.uuid4().hex, columns, time.monotonic() + self.ttl)
+        check_snapshot_size(snapshot.size_bytes, self.max_bytes)
+
+        with self._lock:
+            self._expire()
+            self._snapshots[snapshot.id] = snapshot
+            self._size += snapshot.size_bytes
+            while self._size > self.max_bytes:
+                _, oldest = self._snapshots.popitem(last=False)
+                self._size -= oldest.size_bytes
+        return snapshot
+
+    def get(self, snapshot_id: str) -> Optional[Snapshot]:
+        with self._lock:
+            self._expire()
+            return self._snapshots.get(snapshot_id)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, snapshot in self._snapshots.items() if snapshot.expires_at <= now]
+        for key in expired:
+            self._size -= self._snapshots.pop(key).size_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"snapshots": len(self._snapshots), "size_bytes": self._size, "max_bytes": self.max_bytes}
+
+
+def create_snapshot_store() -> SnapshotStore:
+    return SnapshotStore(ttl=settings.snapshot_ttl, max_bytes=settings.snapshot_max_bytes)
+
+
+# Dependency
+def get_snapshot_store(request: Request) -> SnapshotStore:
+    return request.app.state.snapshots
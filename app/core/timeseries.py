@@ -0,0 +1,74 @@
+import asyncio
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.cache import ResultCache, hash_key
+from app.core.config import settings
+
+
+# Date-partitioned caching for the time-series reports: every day of a
+# window is cached on its own, keyed by (namespace, identity, day), so a
+# shifted or widened window only queries the days it has not seen yet.
+def parse_day(value: Any) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def day_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _missing_ranges(days: List[date], cached: List[Optional[Any]]) -> List[Tuple[date, date]]:
+    ranges: List[Tuple[date, date]] = []
+    for day, value in zip(days, cached):
+        if value is not None:
+            continue
+        if ranges and ranges[-1][1] == day - timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def _day_ttl(day: date, today: date) -> float:
+    # 已结束的日期不再变化，今天的数据还在增长
+    return settings.cache_ttl_closed_day if day < today else settings.cache_ttl_open_day
+
+
+async def load_daily_series(
+    cache: ResultCache,
+    namespace: str,
+    identity: Any,
+    start: date,
+    end: date,
+    load_range: Callable[[date, date], Awaitable[Dict[date, Any]]],
+) -> List[Tuple[date, Any]]:
+    # ``load_range(a, b)`` must return a value for every day from a to b.
+    # Fresh and cached days are merged as is, so values must come back from
+    # the cache unchanged: dict keys have to be strings already.
+    days = day_range(start, end)
+    prefix = hash_key(namespace, identity)
+    keys = [f"{prefix}:{day.isoformat()}" for day in days]
+    cached = list(await asyncio.gather(*(cache.get_fresh(key) for key in keys)))
+
+    missing = _missing_ranges(days, cached)
+    if missing:
+        # 缺失的连续日期段并发查询
+        loaded = await asyncio.gather(*(load_range(a, b) for a, b in missing))
+        fresh: Dict[date, Any] = {}
+        for values in loaded:
+            fresh.update(values)
+
+        today = date.today()
+        writes = []
+        for i, day in enumerate(days):
+            if cached[i] is None:
+                cached[i] = fresh[day]
+                writes.append(cache.put(keys[i], fresh[day], _day_ttl(day, today)))
+        await asyncio.gather(*writes)
+
+    return list(zip(days, cached))
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from pydantic import BaseModel
+
+from app.core.cache import ResultCache
+from app.core.config import settings
+from app.db.executor import QueryExecutor
+from app.db.guardrails import PLAN_WITHOUT_TOTAL, check_plan, preflight, query_budget
+
+# Fields that select a page rather than the filtered set; the total is
+# shared by every page of the same filters.
+PAGING_FIELDS = {"page", "limit", "cursor", "include_total", "estimate_total", "explain"}
+
+
+def _lower_bound(params: BaseModel, page: Dict[str, Any]) -> Optional[int]:
+    if getattr(params, "cursor", None):
+        return None
+    rows = len(page["result"])
+    total = (params.page - 1) * params.limit + rows
+    # 本页已满，说明后面至少还有一行
+    return total + 1 if rows >= params.limit else total
+
+
+# Runs the page query and the COUNT query side by side. The count is cached
+# per filter set; with estimate_total a missing count is computed in the
+# background and a lower bound derived from the page is returned meanwhile.
+# With ``plan`` the queries are dry-run first (when the endpoint has a byte
+# budget or explain=true) and the estimate decides whether they run at all.
+async def fetch_page_with_total(
+    namespace: str,
+    params: BaseModel,
+    fetch_page: Callable[..., Dict[str, Any]],
+    count: Callable[..., int],
+    cache: ResultCache,
+    executor: QueryExecutor,
+    client: Any,
+    plan: Optional[Callable[..., Any]] = None,
+) -> Dict[str, Any]:
+    include_total = params.include_total
+    explain = getattr(params, "explain", False)
+    if plan is not None and (explain or query_budget(namespace).max_bytes_billed):
+        # 预估结果与页码无关，按筛选条件缓存
+        estimate = await cache.get_or_load(
+            f"{namespace}:estimate", params, settings.cache_ttl_report_totals,
+            lambda: preflight(namespace, params, plan, executor, client),
+            exclude=PAGING_FIELDS,
+        )
+        if explain:
+            return {"total": None, "total_estimated": False, "result": [], "next_cursor": None, "explain": estimate}
+        check_plan(estimate)
+        if estimate["plan"] == PLAN_WITHOUT_TOTAL:
+            include_total = False
+
+    page_task = executor.run(fetch_page, params, client)
+    total = None
+    estimated = False
+
+    if not include_total:
+        page = await page_task
+    else:
+        total_namespace = f"{namespace}:total"
+        ttl = settings.cache_ttl_report_totals
+        loader = lambda: executor.run(count, params, client)
+
+        if params.estimate_total:
+            total = await cache.peek(total_namespace, params, exclude=PAGING_FIELDS)
+            page = await page_task
+            if total is None:
+                cache.prefetch(total_namespace, params, ttl, loader, exclude=PAGING_FIELDS)
+                total = _lower_bound(params, page)
+                estimated = True
+        else:
+            page, total = await asyncio.gather(
+                page_task,
+                cache.get_or_load(total_namespace, params, ttl, loader, exclude=PAGING_FIELDS),
+            )
+
+    page["total"] = total
+    page["total_estimated"] = estimated
+    return page
+
+
+# For callers that cache whole pages: a page cached with an estimated total
+# picks up the exact count once the background COUNT has finished.
+async def resolve_estimated_total(namespace: str, params: BaseModel, page: Dict[str, Any], cache: ResultCache) -> Dict[str, Any]:
+    if not page.get("total_estimated"):
+        return page
+    total = await cache.peek(f"{namespace}:total", params, exclude=PAGING_FIELDS)
+    if total is None:
+        return page
+    return {**page, "total": total, "total_estimated": False}
@@ -0,0 +1,246 @@
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import google.auth
+from fastapi import Request
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from google.cloud.bigquery.table import Row
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.core.metrics import record_job, timed
+
+try:
+    import pyarrow
+except ImportError:  # pyarrow is only needed for the memory backend
+    pyarrow = None
+
+_SCOPES = [
+    "https://www.googleapis.com/auth/bigquery",
+    "https://www.googleapis.com/auth/cloud-platform",
+]
+
+
+# Backend interface: anything that can hand out a client exposing
+# ``client.query(sql, job_config=...)`` like bigquery.Client does.
+class QueryBackend:
+    def create_client(self):
+        raise NotImplementedError
+
+    def close_client(self, client) -> None:
+        close = getattr(client, "close", None)
+        if close is not None:
+            close()
+
+
+class BigQueryBackend(QueryBackend):
+    def __init__(
+        self,
+        project: Optional[str] = None,
+        pool_connections: int = 10,
+        pool_maxsize: int = 32,
+        max_retries: int = 3,
+    ):
+        self.project = project
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+
+    def create_client(self) -> bigquery.Client:
+        credentials, default_project = google.auth.default(scopes=_SCOPES)
+
+        # 一个共享的 HTTP session，连接池大小可调
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self.max_retries,
+        )
+        session.mount("https://", adapter)
+
+        return bigquery.Client(
+            project=self.project or default_project,
+            credentials=credentials,
+            _http=session,
+        )
+
+
+# Wraps the shared client so every job records its submit and execution
+# time and, once finished, its statistics; everything else is delegated.
+class InstrumentedClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    def query(self, query: str, *args, **kwargs):
+        job_config = kwargs.get("job_config")
+        dry_run = bool(job_config is not None and job_config.dry_run)
+        with timed("dry_run" if dry_run else "submit"):
+            job = self._client.query(query, *args, **kwargs)
+        return job if dry_run else InstrumentedJob(job)
+
+
+class InstrumentedJob:
+    def __init__(self, job):
+        self._job = job
+        self._recorded = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._job, name)
+
+    def result(self, *args, **kwargs):
+        with timed("execute"):
+            result = self._job.result(*args, **kwargs)
+        if not self._recorded:
+            self._recorded = True
+            record_job(self._job)
+        return result
+
+
+# Local stand-in for BigQuery: each query is answered by the first handler
+# whose pattern occurs in the SQL (rows as dicts or a pyarrow.Table, or a
+# callable building them from the SQL and the query parameters); anything
+# else returns no rows. Every query is recorded in ``queries``.
+class MemoryBackend(QueryBackend):
+    def __init__(self):
+        self.handlers: List[Tuple[str, Any, int]] = []
+        self.queries: List[Tuple[str, Any]] = []
+
+    def add(self, pattern: str, rows: Any, bytes_processed: int = 0) -> None:
+        self.handlers.append((pattern, rows, bytes_processed))
+
+    def create_client(self) -> "MemoryClient":
+        return MemoryClient(self)
+
+    def close_client(self, client) -> None:
+        pass
+
+
+class MemoryClient:
+    def __init__(self, backend: MemoryBackend):
+        self.backend = backend
+
+    def query(self, query: str, job_config: Optional[bigquery.QueryJobConfig] = None) -> "MemoryJob":
+        self.backend.queries.append((query, job_config))
+        query_params = _query_params(job_config) if job_config is not None else []
+        for pattern, rows, bytes_processed in self.backend.handlers:
+            if pattern in query:
+                if callable(rows):
+                    rows = rows(query, query_params)
+                return MemoryJob(rows, bytes_processed)
+        return MemoryJob([], 0)
+
+
+def _query_params(job_config: bigquery.QueryJobConfig) -> List[Any]:
+    # QueryJobConfig.query_parameters 无法从 API 表示还原空的 STRUCT 数组，
+    # 这里逐个解析，空数组按声明的类型重建
+    query_params = []
+    for resource in job_config.to_api_repr().get("query", {}).get("queryParameters", []):
+        kind = resource["parameterType"]
+        if "arrayType" in kind:
+            if resource["parameterValue"].get("arrayValues"):
+                query_params.append(bigquery.ArrayQueryParameter.from_api_repr(resource))
+                continue
+            item = kind["arrayType"]
+            if "structTypes" in item:
+                item = bigquery.StructQueryParameterType(*(
+                    bigquery.ScalarQueryParameterType(field["type"]["type"], name=field["name"])
+                    for field in item["structTypes"]
+                ))
+            else:
+                item = item["type"]
+            query_params.append(bigquery.ArrayQueryParameter(resource["name"], item, []))
+        elif "structTypes" in kind:
+            query_params.append(bigquery.StructQueryParameter.from_api_repr(resource))
+        else:
+            query_params.append(bigquery.ScalarQueryParameter.from_api_repr(resource))
+    return query_params
+
+
+class MemoryJob:
+    cache_hit = False
+    slot_millis = 0
+
+    def __init__(self, rows: Any, bytes_processed: int):
+        self.table = rows if isinstance(rows, pyarrow.Table) else pyarrow.Table.from_pylist(list(rows))
+        self.total_bytes_processed = bytes_processed
+
+    def result(self, page_size: Optional[int] = None, **kwargs) -> "MemoryResult":
+        return MemoryResult(self.table, page_size)
+
+
+class MemoryResult:
+    def __init__(self, table: "pyarrow.Table", page_size: Optional[int] = None):
+        self.table = table
+        self.total_rows = table.num_rows
+        self.page_size = page_size
+
+    def __iter__(self) -> Iterator[Row]:
+        names = {name: i for i, name in enumerate(self.table.column_names)}
+        for values in self.table.to_pylist():
+            yield Row(tuple(values.values()), names)
+
+    def to_arrow(self, create_bqstorage_client: bool = False) -> "pyarrow.Table":
+        return self.table
+
+    def to_arrow_iterable(self) -> Iterator["pyarrow.RecordBatch"]:
+        return iter(self.table.to_batches(max_chunksize=self.page_size))
+
+
+def _default_bigquery_backend() -> QueryBackend:
+    return BigQueryBackend(
+        project=settings.bigquery_project,
+        pool_connections=settings.bigquery_pool_connections,
+        pool_maxsize=settings.bigquery_pool_maxsize,
+        max_retries=settings.bigquery_max_retries,
+    )
+
+
+_backends: Dict[str, Callable[[], QueryBackend]] = {
+    "bigquery": _default_bigquery_backend,
+    "memory": MemoryBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], QueryBackend]) -> None:
+    _backends[name] = factory
+
+
+# App-scoped registry holding the single shared client
+class ClientRegistry:
+    def __init__(self, backend: QueryBackend):
+        self.backend = backend
+        self._client = None
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        with self._lock:
+            if self._client is None:
+                self._client = InstrumentedClient(self.backend.create_client())
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.open()
+        return self._client
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self.backend.close_client(self._client._client)
+                self._client = None
+
+
+def create_registry(backend_name: Optional[str] = None) -> ClientRegistry:
+    name = backend_name or settings.bigquery_backend
+    if name not in _backends:
+        raise ValueError(f"Unknown BigQuery backend: {name}")
+    return ClientRegistry(_backends[name]())
+
+
+# Dependency
+def get_bigquery_client(request: Request):
+    return request.app.state.bigquery.client
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+from google.cloud import bigquery
+
+from app.core.currency import ExchangeRateMatrix
+
+logger = logging.getLogger(__name__)
+
+SITES_QUERY = """
+    SELECT site_id, brand, site_type, currency, brand_department_id
+    FROM `allwebi.tb_sites`
+"""
+
+DEPARTMENTS_QUERY = """
+    SELECT id, department_name, department_type
+    FROM `allwebi.tb_brand_department`
+"""
+
+EXCHANGE_RATES_QUERY = """
+    SELECT currency_symbol, exchange_date, rate_to_cny
+    FROM `allwebi.tb_exchange_rates`
+"""
+
+
+def _months_between(start: date, end: date) -> List[str]:
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+# Immutable copy of the small dimension tables; a refresh builds a new one
+# and swaps it in, so readers never see a half-loaded state.
+class Dimensions:
+    def __init__(
+        self,
+        version: int,
+        sites: Dict[int, Dict[str, Any]],
+        departments: Dict[int, Dict[str, Any]],
+        rates: Dict[Tuple[str, str], float],
+    ):
+        self.version = version
+        self.loaded_at = time.time()
+        self.sites = sites
+        self.departments = departments
+        self.exchange_rates = ExchangeRateMatrix(rates)
+
+    def site_fields(self, site_id: Optional[int]) -> Dict[str, Any]:
+        site = self.sites.get(site_id)
+        if site is None:
+            return {"site_name": None, "site_type": None, "currency": None, "department_name": None}
+        department = self.departments.get(site["brand_department_id"]) or {}
+        return {
+            "site_name": site["brand"],
+            "site_type": site["site_type"],
+            "currency": site["currency"],
+            "department_name": department.get("department_name"),
+        }
+
+    def site_currencies(self, site_ids: List[Optional[int]]) -> List[Optional[str]]:
+        return [(self.sites.get(site_id) or {}).get("currency") for site_id in site_ids]
+
+    # (site_id, month, usd_factor, is_usd) for every site with a known rate in range
+    def site_usd_factors(
+        self, start_date: Optional[date] = None, end_date: Optional[date] = None
+    ) -> List[Tuple[int, str, float, bool]]:
+        if start_date and end_date:
+            months = _months_between(start_date, end_date)
+        else:
+            months = self.exchange_rates.months
+            if start_date:
+                months = [m for m in months if m >= start_date.strftime("%Y-%m")]
+            if end_date:
+                months = [m for m in months if m <= end_date.strftime("%Y-%m")]
+
+        pairs = [(site_id, month) for site_id in self.sites for month in months]
+        if not pairs:
+            return []
+        site_ids = [site_id for site_id, _ in pairs]
+        currencies = self.site_currencies(site_ids)
+        factors = self.exchange_rates.usd_factors(currencies, [month for _, month in pairs])
+        return [
+            (site_id, month, float(factor), currency == "USD")
+            for (site_id, month), factor, currency in zip(pairs, factors, currencies)
+            if not np.isnan(factor)
+        ]
+
+
+# Holds the current Dimensions, loaded at startup and refreshed on an interval
+class DimensionStore:
+    def __init__(self):
+        self._current: Optional[Dimensions] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[Dimensions]:
+        return self._current
+
+    def load(self, client: bigquery.Client) -> Dimensions:
+        job_config = bigquery.QueryJobConfig(use_query_cache=True)
+        sites_job = client.query(SITES_QUERY, job_config=job_config)
+        departments_job = client.query(DEPARTMENTS_QUERY, job_config=job_config)
+        rates_job = client.query(EXCHANGE_RATES_QUERY, job_config=job_config)
+
+        sites = {row.site_id: dict(row) for row in sites_job.result()}
+        departments = {row.id: dict(row) for row in departments_job.result()}
+        rates = {
+            (row.currency_symbol, row.exchange_date): row.rate_to_cny
+            for row in rates_job.result()
+            if row.rate_to_cny is not None
+        }
+
+        with self._lock:
+            self._version += 1
+            self._current = Dimensions(self._version, sites, departments, rates)
+            return self._current
+
+    def get(self, client: bigquery.Client) -> Dimensions:
+        current = self._current
+        if current is None:
+            current = self.load(client)
+        return current
+
+    async def refresh_periodically(self, registry, executor, interval: float) -> None:
+        while True:
+            try:
+                await executor.run(self.load, registry.client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to refresh dimension tables")
+            await asyncio.sleep(interval)
+
+
+# Dependency
+def get_dimension_store(request: Request) -> DimensionStore:
+    return request.app.state.dimensions
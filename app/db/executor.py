@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request
+
+from app.core.config import settings
+from app.core.metrics import record_phase
+
+
+# Runs blocking BigQuery calls on a bounded thread pool so the event loop
+# stays free; requests beyond workers + pending are rejected with 503.
+class QueryExecutor:
+    def __init__(self, max_workers: int = 8, max_pending: int = 16, retry_after: int = 2):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bigquery")
+        # 只在事件循环线程中修改，无需加锁
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def admit(self) -> None:
+        if self._in_flight >= self.max_workers + self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent queries, please retry later",
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self.admit()
+        return await self.run_admitted(fn, *args, **kwargs)
+
+    # Skips admission control, for work that was admitted earlier and must
+    # not fail half way (the batches of an export whose headers are sent)
+    async def run_admitted(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # 线程中沿用请求的上下文，用于按请求记录各阶段耗时
+            context = contextvars.copy_context()
+            call = functools.partial(self._call, time.perf_counter(), fn, *args, **kwargs)
+            return await loop.run_in_executor(self._pool, context.run, call)
+        finally:
+            self._in_flight -= 1
+
+    @staticmethod
+    def _call(submitted: float, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        record_phase("queue", time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def create_executor() -> QueryExecutor:
+    return QueryExecutor(
+        max_workers=settings.query_max_workers,
+        max_pending=settings.query_max_pending,
+        retry_after=settings.query_retry_after,
+    )
+
+
+# Dependency
+def get_query_executor(request: Request) -> QueryExecutor:
+    return request.app.state.query_executor
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+from fastapi import HTTPException
+from google.cloud import bigquery
+
+from app.core.config import settings
+from app.db.executor import QueryExecutor
+
+# Cost guardrails: every report query carries its endpoint's
+# maximum_bytes_billed and job timeout, and paged reports can be dry-run
+# first to reject oversized requests, drop the COUNT query when only the
+# page fits the budget, or explain the plan instead of running it.
+PLAN_FULL = "full"
+PLAN_WITHOUT_TOTAL = "without_total"
+PLAN_REJECTED = "rejected"
+
+# name -> (sql, query parameters); the page query is always named "page"
+QueryPlan = Dict[str, Tuple[str, List[Any]]]
+
+
+class QueryBudget:
+    def __init__(self, max_bytes_billed: int = 0, timeout_ms: int = 0):
+        self.max_bytes_billed = max_bytes_billed
+        self.timeout_ms = timeout_ms
+
+
+def query_budget(endpoint: str) -> QueryBudget:
+    return QueryBudget(
+        max_bytes_billed=settings.query_max_bytes_billed_overrides.get(endpoint, settings.query_max_bytes_billed),
+        timeout_ms=settings.query_timeout_ms_overrides.get(endpoint, settings.query_timeout_ms),
+    )
+
+
+def query_job_config(endpoint: str) -> bigquery.QueryJobConfig:
+    budget = query_budget(endpoint)
+    job_config = bigquery.QueryJobConfig(use_query_cache=True)
+    if budget.max_bytes_billed:
+        job_config.maximum_bytes_billed = budget.max_bytes_billed
+    if budget.timeout_ms:
+        job_config.job_timeout_ms = budget.timeout_ms
+    return job_config
+
+
+def dry_run_bytes(client: bigquery.Client, query: str, query_params: List[Any]) -> int:
+    # 不走缓存，得到实际需要扫描的字节数
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False, query_parameters=query_params)
+    return client.query(query, job_config=job_config).total_bytes_processed or 0
+
+
+def choose_plan(budget: QueryBudget, estimates: Dict[str, int]) -> str:
+    limit = budget.max_bytes_billed
+    if not limit or all(size <= limit for size in estimates.values()):
+        return PLAN_FULL
+    if estimates["page"] <= limit:
+        return PLAN_WITHOUT_TOTAL
+    return PLAN_REJECTED
+
+
+async def preflight(endpoint: str, params: Any, plan: Callable[..., QueryPlan], executor: QueryExecutor, client: bigquery.Client) -> Dict[str, Any]:
+    queries = await executor.run(plan, params, client)
+    # 各查询的 dry run 并发执行
+    sizes = await asyncio.gather(*(
+        executor.run(dry_run_bytes, client, query, query_params)
+        for query, query_params in queries.values()
+    ))
+    estimates = dict(zip(queries, sizes))
+    budget = query_budget(endpoint)
+    return {
+        "plan": choose_plan(budget, estimates),
+        "max_bytes_billed": budget.max_bytes_billed or None,
+        "timeout_ms": budget.timeout_ms or None,
+        "total_bytes_processed": sum(sizes),
+        "queries": [
+            {"name": name, "total_bytes_processed": estimates[name], "query": query}
+            for name, (query, _) in queries.items()
+        ],
+    }
+
+
+def check_plan(estimate: Dict[str, Any]) -> None:
+    if estimate["plan"] == PLAN_REJECTED:
+        page_bytes = next(query["total_bytes_processed"] for query in estimate["queries"] if query["name"] == "page")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query would process {page_bytes} bytes, above the limit of {estimate['max_bytes_billed']}; narrow the filters",
+        )
@@ -0,0 +1,307 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+
+class Order(BaseModel):
+    id: int
+    item_name: str
+    item_price: float
+    quantity: int
+    total_price: float
+
+
+# Compact in-memory form of an order; the API model is rebuilt on read
+class OrderRecord:
+    __slots__ = ("id", "item_name", "item_price", "quantity", "total_price")
+
+    def __init__(self, id: int, item_name: str, item_price: float, quantity: int, total_price: float):
+        self.id = id
+        self.item_name = item_name
+        self.item_price = item_price
+        self.quantity = quantity
+        self.total_price = total_price
+
+    @classmethod
+    def from_order(cls, order: Order) -> "OrderRecord":
+        return cls(order.id, order.item_name, order.item_price, order.quantity, order.total_price)
+
+    def to_order(self) -> Order:
+        # 写入时已校验，读取时不再重复校验
+        return Order.model_construct(
+            id=self.id,
+            item_name=self.item_name,
+            item_price=self.item_price,
+            quantity=self.quantity,
+            total_price=self.total_price,
+        )
+
+
+def _check_new_ids(orders: List[Order], existing) -> None:
+    seen = set()
+    duplicates = []
+    for order in orders:
+        if order.id in seen or order.id in existing:
+            duplicates.append(order.id)
+        seen.add(order.id)
+    if duplicates:
+        raise HTTPException(status_code=409, detail=f"Order ids already exist: {sorted(set(duplicates))}")
+
+
+# Repository interface shared by the order backends
+class OrderRepository:
+    def get(self, order_id: int) -> Optional[Order]:
+        raise NotImplementedError
+
+    def list(self, skip: int = 0, limit: int = 10, item_name: Optional[str] = None) -> List[Order]:
+        raise NotImplementedError
+
+    def create(self, order: Order) -> Order:
+        return self.create_many([order])[0]
+
+    def create_many(self, orders: List[Order]) -> List[Order]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+# Orders indexed by id (hash lookup) and by item_name; insertion order is
+# kept in a separate id list for paging. Writes take a lock, reads run on
+# consistent snapshots of the indexes. Nothing survives a restart.
+class MemoryOrderRepository(OrderRepository):
+    def __init__(self, orders: Iterable[Order] = ()):
+        self._by_id: Dict[int, OrderRecord] = {}
+        self._by_item_name: Dict[str, List[int]] = {}
+        self._ids: List[int] = []
+        self._lock = threading.Lock()
+        self.create_many(list(orders))
+
+    def get(self, order_id: int) -> Optional[Order]:
+        record = self._by_id.get(order_id)
+        return record.to_order() if record is not None else None
+
+    def list(self, skip: int = 0, limit: int = 10, item_name: Optional[str] = None) -> List[Order]:
+        ids = self._by_item_name.get(item_name, []) if item_name is not None else self._ids
+        return [self._by_id[order_id].to_order() for order_id in ids[skip: skip + limit]]
+
+    def create_many(self, orders: List[Order]) -> List[Order]:
+        # 整批校验通过后才写入，要么全部成功要么全部不写
+        records = [OrderRecord.from_order(order) for order in orders]
+        with self._lock:
+            _check_new_ids(orders, self._by_id)
+            for record in records:
+                self._by_id[record.id] = record
+                self._by_item_name.setdefault(record.item_name, []).append(record.id)
+                self._ids.append(record.id)
+        return orders
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# SQLite 表结构：id 不作为 rowid，rowid 保持插入顺序用于分页
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER NOT NULL UNIQUE,
+        item_name TEXT NOT NULL,
+        item_price REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        total_price REAL NOT NULL
+    )
+    """,
+    # 二级索引的条目本身按 rowid 排序，按商品名分页无需额外排序
+    "CREATE INDEX IF NOT EXISTS orders_item_name ON orders (item_name)",
+]
+_COLUMNS = "id, item_name, item_price, quantity, total_price"
+_SELECT_BY_ID = f"SELECT {_COLUMNS} FROM orders WHERE id = ?"
+_SELECT_PAGE = f"SELECT {_COLUMNS} FROM orders ORDER BY rowid LIMIT ? OFFSET ?"
+_SELECT_PAGE_BY_ITEM_NAME = f"SELECT {_COLUMNS} FROM orders WHERE item_name = ? ORDER BY rowid LIMIT ? OFFSET ?"
+_INSERT = f"INSERT INTO orders ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)"
+_INSERT_OR_IGNORE = f"INSERT OR IGNORE INTO orders ({_COLUMNS}) VALUES (?, ?, ?, ?, ?)"
+_COUNT = "SELECT COUNT(*) FROM orders"
+# 低于 SQLite 默认的绑定变量上限
+_ID_CHUNK = 500
+
+
+def _order_from_row(row: Tuple) -> Order:
+    return OrderRecord(*row).to_order()
+
+
+def _row_from_order(order: Order) -> Tuple:
+    return (order.id, order.item_name, order.item_price, order.quantity, order.total_price)
+
+
+# Durable orders in SQLite (WAL mode). Reads use a small pool of
+# connections and are served straight from the table, so startup does not
+# load anything. Inserts go through a single writer thread that commits
+# every request queued while the previous commit ran in one transaction
+# (group commit); each request is still accepted or rejected as a whole.
+class SQLiteOrderRepository(OrderRepository):
+    def __init__(self, path: str, pool_size: int = 4, max_batch: int = 256):
+        self.path = path
+        self.max_batch = max_batch
+
+        writer = self._connect()
+        for statement in _SCHEMA:
+            writer.execute(statement)
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        self._pending: "queue.Queue[Optional[Tuple[List[Order], Future]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), name="orders-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None：事务由写线程显式控制；语句按 SQL 文本缓存预编译
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def get(self, order_id: int) -> Optional[Order]:
+        with self._connection() as conn:
+            row = conn.execute(_SELECT_BY_ID, (order_id,)).fetchone()
+        return _order_from_row(row) if row is not None else None
+
+    def list(self, skip: int = 0, limit: int = 10, item_name: Optional[str] = None) -> List[Order]:
+        with self._connection() as conn:
+            if item_name is not None:
+                rows = conn.execute(_SELECT_PAGE_BY_ITEM_NAME, (item_name, limit, skip)).fetchall()
+            else:
+                rows = conn.execute(_SELECT_PAGE, (limit, skip)).fetchall()
+        return [_order_from_row(row) for row in rows]
+
+    def create_many(self, orders: List[Order]) -> List[Order]:
+        if not orders:
+            return orders
+        future: Future = Future()
+        self._pending.put((orders, future))
+        return future.result()
+
+    def __len__(self) -> int:
+        with self._connection() as conn:
+            return conn.execute(_COUNT).fetchone()[0]
+
+    def _write_loop(self, conn: sqlite3.Connection) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            # 上一次提交期间排队的请求合并成一个事务
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple[List[Order], Future]]) -> None:
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for orders, future in batch:
+                # 单写线程 + IMMEDIATE 事务，先查后写不会有竞争
+                try:
+                    _check_new_ids(orders, self._existing_ids(conn, [order.id for order in orders]))
+                except HTTPException as e:
+                    outcomes.append((future, None, e))
+                    continue
+                conn.executemany(_INSERT, [_row_from_order(order) for order in orders])
+                outcomes.append((future, orders, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, orders, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(orders)
+
+    @staticmethod
+    def _existing_ids(conn: sqlite3.Connection, ids: List[int]) -> set:
+        existing = set()
+        for start in range(0, len(ids), _ID_CHUNK):
+            chunk = ids[start: start + _ID_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            existing.update(row[0] for row in conn.execute(f"SELECT id FROM orders WHERE id IN ({placeholders})", chunk))
+        return existing
+
+    def seed(self, orders: List[Order]) -> None:
+        # 固定数据：多个 worker 同时启动时都会执行，已存在的 id 直接跳过
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(_INSERT_OR_IGNORE, [_row_from_order(order) for order in orders])
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        self._pending.put(None)
+        self._writer.join()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def create_order_repository() -> OrderRepository:
+    # 固定数据
+    fixtures = [
+        Order(id=1, item_name="Item A", item_price=10.0, quantity=2, total_price=20.0),
+        Order(id=2, item_name="Item B", item_price=20.0, quantity=1, total_price=20.0),
+    ]
+    if settings.orders_backend == "sqlite":
+        repository = SQLiteOrderRepository(
+            settings.orders_sqlite_path,
+            pool_size=settings.orders_pool_size,
+            max_batch=settings.orders_commit_max_batch,
+        )
+        repository.seed(fixtures)
+        return repository
+    if settings.orders_backend == "memory":
+        return MemoryOrderRepository(fixtures)
+    raise ValueError(f"Unknown orders backend: {settings.orders_backend}")
+
+
+def check_bulk_size(orders: List[Order]) -> None:
+    if len(orders) > settings.orders_bulk_max:
+        raise HTTPException(status_code=400, detail=f"At most {settings.orders_bulk_max} orders per request")
+
+
+# Dependency
+def get_order_repository(request: Request) -> OrderRepository:
+    return request.app.state.orders
@@ -0,0 +1,62 @@
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+# Query templates: every value goes in as a query parameter and optional
+# filters are fixed SQL fragments, so the SQL text only depends on which
+# filters are active. Each combination is rendered once and reused, and
+# identical text keeps BigQuery's own result cache effective.
+_templates: List["QueryTemplate"] = []
+
+
+class QueryTemplate:
+    # ``filters`` maps a filter name to {slot: fragment}; active fragments are
+    # joined into their ``{slot}`` placeholders in declaration order, so one
+    # filter can constrain several CTEs.
+    def __init__(self, name: str, sql: str, filters: Optional[Dict[str, Dict[str, str]]] = None):
+        self.name = name
+        self.sql = sql
+        self.filters = filters or {}
+        self.slots = sorted({slot for fragments in self.filters.values() for slot in fragments})
+        self._compiled: Dict[FrozenSet[str], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        _templates.append(self)
+
+    def render(self, active: Iterable[str] = ()) -> str:
+        key = frozenset(active)
+        sql = self._compiled.get(key)
+        if sql is not None:
+            self.hits += 1
+            return sql
+
+        unknown = key - self.filters.keys()
+        if unknown:
+            raise KeyError(f"Unknown filters for {self.name}: {', '.join(sorted(unknown))}")
+        fragments: Dict[str, List[str]] = {slot: [] for slot in self.slots}
+        for name, parts in self.filters.items():
+            if name in key:
+                for slot, fragment in parts.items():
+                    fragments[slot].append(fragment)
+        sql = self.sql.format(**{slot: "\n            ".join(parts) for slot, parts in fragments.items()})
+
+        with self._lock:
+            self._compiled[key] = sql
+        return sql
+
+
+# Collects the active filters of one request together with their parameters
+class FilterSet:
+    def __init__(self):
+        self.active: List[str] = []
+        self.params: List[Any] = []
+
+    def add(self, name: str, *params: Any) -> None:
+        self.active.append(name)
+        self.params.extend(params)
+
+
+def template_stats() -> Dict[str, Any]:
+    return {
+        template.name: {"compiled": len(template._compiled), "hits": template.hits}
+        for template in _templates
+    }
@@ -0,0 +1,97 @@
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.metrics import record_rows, timed
+
+try:
+    import pyarrow
+except ImportError:  # pyarrow is needed for columnar fetching
+    pyarrow = None
+
+
+# Result fetching: pulls a finished query as Arrow record batches instead of
+# building one Row object per row, and hands endpoints NumPy columns
+# (name -> array) to post-process before turning them into rows once, at
+# the very end. Python objects are only created at that boundary.
+Column = Union[np.ndarray, Sequence[Any]]
+def _use_storage_api(result) -> bool:
+    # BigQuery Storage Read API 只在结果较大时才值得多建一个连接
+    min_rows = settings.bigquery_storage_min_rows
+    total_rows = getattr(result, "total_rows", None)
+    return bool(min_rows) and total_rows is not None and total_rows >= min_rows
+
+
+def fetch_arrow(query_job, use_storage: Optional[bool] = None) -> "pyarrow.Table":
+    if pyarrow is None:
+        raise RuntimeError("Columnar fetching requires the 'pyarrow' package")
+    result = query_job.result()
+    if use_storage is None:
+        use_storage = _use_storage_api(result)
+    # 没有安装 google-cloud-bigquery-storage 时，客户端库会自动退回 REST 分页
+    with timed("download"):
+        table = result.to_arrow(create_bqstorage_client=use_storage)
+    record_rows(table.num_rows)
+    return table
+
+
+def _column_array(column) -> np.ndarray:
+    kind = column.type
+    if pyarrow.types.is_timestamp(kind) and kind.tz is not None:
+        # datetime64 没有时区，带时区的时间戳按原样转换
+        values = column.to_pylist()
+    elif column.null_count and (pyarrow.types.is_integer(kind) or pyarrow.types.is_floating(kind) or pyarrow.types.is_boolean(kind)):
+        # 含 NULL 的数值列：NumPy 会转成 float/NaN，这里保留 None 与原类型
+        valid = column.is_valid().to_numpy(zero_copy_only=False)
+        values = column.fill_null(False if pyarrow.types.is_boolean(kind) else 0).to_numpy(zero_copy_only=False).astype(object)
+        values[~valid] = None
+        return values
+    elif pyarrow.types.is_primitive(kind) or pyarrow.types.is_string(kind) or pyarrow.types.is_large_string(kind) or pyarrow.types.is_binary(kind) or pyarrow.types.is_decimal(kind):
+        return column.to_numpy(zero_copy_only=False)
+    else:
+        values = column.to_pylist()
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def fetch_arrays(query_job, use_storage: Optional[bool] = None) -> Dict[str, np.ndarray]:
+    return arrow_arrays(fetch_arrow(query_job, use_storage))
+
+
+def arrow_arrays(table: "pyarrow.Table") -> Dict[str, np.ndarray]:
+    # 逐列转换（C 层完成），不逐个单元格创建 Arrow 标量
+    with timed("convert"):
+        return {name: _column_array(column) for name, column in zip(table.column_names, table.columns)}
+
+
+def to_list(values: Column) -> List[Any]:
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == "M":
+            # DATE 列：datetime64[D] -> datetime.date
+            values = values.astype(object)
+        return values.tolist()
+    return list(values)
+
+
+def fetch_columns(query_job, use_storage: Optional[bool] = None) -> Dict[str, List[Any]]:
+    arrays = fetch_arrays(query_job, use_storage)
+    with timed("convert"):
+        return {name: to_list(values) for name, values in arrays.items()}
+
+
+def column_count(columns: Dict[str, Column]) -> int:
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def rows_from_columns(columns: Dict[str, Column], model: Optional[type] = None) -> List[Any]:
+    # model：endpoint 的 Row 类，按声明的列顺序逐行构造；None 时返回 dict
+    with timed("convert"):
+        if model is None:
+            names = list(columns)
+            values = [to_list(column) for column in columns.values()]
+            return [dict(zip(names, row)) for row in zip(*values)]
+        if not column_count(columns):
+            return []
+        return list(map(model, *(to_list(columns[name]) for name in model.column_names)))
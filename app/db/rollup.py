@@ -0,0 +1,359 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import Request
+from google.cloud import bigquery
+
+from app.core.config import settings
+from app.core.currency import usd_amount_sql, usd_factor_join_sql, usd_factors_param
+from app.core.timeseries import parse_day
+from app.db.results import fetch_columns
+
+logger = logging.getLogger(__name__)
+
+SALES_QUERY = f"""
+    SELECT
+        dps.order_date,
+        dps.product_id,
+        dps.site_id,
+        SUM(dps.daily_purchase_quantity) AS qty,
+        SUM({usd_amount_sql('dps.total_order_amount')}) AS amount_usd
+    FROM `allwebi.mv_daily_product_sales` AS dps
+    {usd_factor_join_sql('dps.site_id', 'dps.order_month')}
+    WHERE dps.order_date >= @since
+    GROUP BY dps.order_date, dps.product_id, dps.site_id
+"""
+
+CALENDAR_QUERY = """
+    SELECT item_date
+    FROM `allwebi.tb_date_dimension`
+    WHERE type = 1
+    ORDER BY item_date
+"""
+
+# 列名 -> 类型；日期用 date.toordinal()，商品用 products 列表中的下标
+COLUMNS = {
+    "day": np.int32,
+    "product": np.int32,
+    "site": np.int32,
+    "qty": np.int64,
+    "amount_usd": np.float64,
+    # 按商品排序的行号，以及每个商品在其中的起止位置
+    "by_product": np.int64,
+    "product_offsets": np.int64,
+}
+
+
+# One generation of the rollup: (day, product, site) -> qty, amount_usd,
+# sorted by (day, product) with a secondary product index, read through
+# memory-mapped .npy files. Never modified after it is built.
+class RollupTable:
+    def __init__(self, path: str, columns: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.path = path
+        self.day = columns["day"]
+        self.product = columns["product"]
+        self.site = columns["site"]
+        self.qty = columns["qty"]
+        self.amount_usd = columns["amount_usd"]
+        self.by_product = columns["by_product"]
+        self.product_offsets = columns["product_offsets"]
+        self.products: List[str] = meta["products"]
+        self.product_codes = {product_id: code for code, product_id in enumerate(self.products)}
+        self.calendar = np.array([date.fromisoformat(d).toordinal() for d in meta["calendar"]], dtype=np.int32)
+        self.start = date.fromisoformat(meta["start"])
+        self.synced_on = date.fromisoformat(meta["synced_on"])
+        # 同步时取到了 synced_on 当天为止的数据，之后的日期不在表中
+        self.end = self.synced_on
+
+    @classmethod
+    def load(cls, path: str) -> "RollupTable":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+        return cls(path, columns, meta)
+
+    @classmethod
+    def write(cls, path: str, columns: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "RollupTable":
+        os.makedirs(path)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(columns[name], dtype=dtype))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return cls.load(path)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.day)
+
+    # Dates outside the synced history (before the horizon, or after the
+    # last loaded day) are answered by BigQuery instead
+    def covers(self, start: Optional[date], end: Optional[date]) -> bool:
+        return start is not None and end is not None and self.start <= start <= end <= self.end
+
+    def _day_range(self, start: date, end: date) -> slice:
+        lo = np.searchsorted(self.day, start.toordinal(), side="left")
+        hi = np.searchsorted(self.day, end.toordinal(), side="right")
+        return slice(int(lo), int(hi))
+
+    def _calendar(self, start: date, end: date) -> np.ndarray:
+        lo = np.searchsorted(self.calendar, start.toordinal(), side="left")
+        hi = np.searchsorted(self.calendar, end.toordinal(), side="right")
+        return self.calendar[lo:hi]
+
+    # Index of each value in the sorted array ``keys``, -1 where absent
+    @staticmethod
+    def _positions(keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+        positions = np.searchsorted(keys, values)
+        found = positions < len(keys)
+        found[found] = keys[positions[found]] == values[found]
+        return np.where(found, positions, -1)
+
+    def _product_rows(self, product_ids: Sequence[str], start: date, end: date) -> np.ndarray:
+        codes = sorted({self.product_codes[p] for p in product_ids if p in self.product_codes})
+        if not codes:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate([self.by_product[self.product_offsets[c]:self.product_offsets[c + 1]] for c in codes])
+        days = self.day[rows]
+        return rows[(days >= start.toordinal()) & (days <= end.toordinal())]
+
+    def top_products(self, start: date, end: date, limit: int) -> Dict[str, Any]:
+        calendar = self._calendar(start, end)
+        days = self._day_range(start, end)
+        codes = np.asarray(self.product[days])
+        if len(calendar) == 0 or len(codes) == 0:
+            return {"dates": [], "data": {}}
+
+        # 区间内销量前 limit 的商品；同销量按 product_id 排序
+        present = np.flatnonzero(np.bincount(codes, minlength=len(self.products)))
+        totals = np.bincount(codes, weights=self.qty[days], minlength=len(self.products))
+        top = np.sort(present[np.argsort(-totals[present], kind="stable")][:max(limit, 0)])
+        if len(top) == 0:
+            return {"dates": [], "data": {}}
+
+        matrix = np.zeros((len(top), len(calendar)), dtype=np.int64)
+        date_pos = self._positions(calendar, np.asarray(self.day[days]))
+        product_pos = self._positions(top, codes)
+        valid = (date_pos >= 0) & (product_pos >= 0)
+        np.add.at(matrix, (product_pos[valid], date_pos[valid]), np.asarray(self.qty[days])[valid])
+
+        return {
+            "dates": [date.fromordinal(int(d)) for d in calendar],
+            "data": {self.products[code]: quantities for code, quantities in zip(top.tolist(), matrix.tolist())},
+        }
+
+    def product_sales_report(self, product_ids: Sequence[str], start: date, end: date) -> Dict[str, Any]:
+        calendar = self._calendar(start, end)
+        rows = self._product_rows(product_ids, start, end)
+
+        date_pos = self._positions(calendar, self.day[rows])
+        valid = date_pos >= 0
+        qty = np.bincount(date_pos[valid], weights=self.qty[rows][valid], minlength=len(calendar))
+        amount = np.bincount(date_pos[valid], weights=self.amount_usd[rows][valid], minlength=len(calendar))
+
+        return {
+            "total": len(calendar),
+            "result": {
+                "xAxis": [date.fromordinal(int(d)) for d in calendar],
+                "qty_data": qty.astype(np.int64).tolist(),
+                "gmv_data": np.round(amount, 2).tolist(),
+            },
+        }
+
+    def product_sales_summary(self, product_ids: Sequence[str], start: date, end: date) -> Dict[str, Any]:
+        total_quantity = int(self.qty[self._day_range(start, end)].sum())
+        product_quantity = int(self.qty[self._product_rows(product_ids, start, end)].sum())
+        percentage = round(product_quantity / total_quantity, 6) if total_quantity else 0
+        return {"result": {"total_quantity": product_quantity, "percentage": percentage}}
+
+
+def _merge(
+    current: Optional[RollupTable], fresh: Dict[str, List[Any]], horizon: date, since: date
+) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    keep = np.empty(0, dtype=np.int64)
+    old_products: List[str] = []
+    if current is not None:
+        keep = np.flatnonzero((current.day >= horizon.toordinal()) & (current.day < since.toordinal()))
+        old_products = current.products
+
+    fresh_rows = [i for i, product_id in enumerate(fresh.get("product_id", [])) if product_id is not None]
+    fresh_products = [fresh["product_id"][i] for i in fresh_rows]
+
+    kept_codes = np.unique(current.product[keep]) if current is not None else np.empty(0, dtype=np.int32)
+    products = sorted({old_products[c] for c in kept_codes.tolist()} | set(fresh_products))
+    code_of = {product_id: code for code, product_id in enumerate(products)}
+    remap = np.array([code_of.get(p, -1) for p in old_products], dtype=np.int32)
+
+    def fresh_column(name: str, convert) -> np.ndarray:
+        values = fresh.get(name, [])
+        return np.array([convert(values[i]) for i in fresh_rows])
+
+    day = np.concatenate([
+        np.asarray(current.day[keep]) if current is not None else np.empty(0, dtype=np.int32),
+        fresh_column("order_date", lambda d: d.toordinal()).astype(np.int32),
+    ])
+    product = np.concatenate([
+        remap[current.product[keep]] if current is not None else np.empty(0, dtype=np.int32),
+        np.array([code_of[p] for p in fresh_products], dtype=np.int32),
+    ])
+    site = np.concatenate([
+        np.asarray(current.site[keep]) if current is not None else np.empty(0, dtype=np.int32),
+        fresh_column("site_id", lambda s: -1 if s is None else s).astype(np.int32),
+    ])
+    qty = np.concatenate([
+        np.asarray(current.qty[keep]) if current is not None else np.empty(0, dtype=np.int64),
+        fresh_column("qty", lambda q: q or 0).astype(np.int64),
+    ])
+    amount_usd = np.concatenate([
+        np.asarray(current.amount_usd[keep]) if current is not None else np.empty(0, dtype=np.float64),
+        fresh_column("amount_usd", lambda a: a or 0.0).astype(np.float64),
+    ])
+
+    order = np.lexsort((product, day))
+    columns = {
+        "day": day[order],
+        "product": product[order],
+        "site": site[order],
+        "qty": qty[order],
+        "amount_usd": amount_usd[order],
+    }
+    columns["by_product"] = np.argsort(columns["product"], kind="stable")
+    columns["product_offsets"] = np.concatenate([[0], np.cumsum(np.bincount(columns["product"], minlength=len(products)))])
+    return columns, products
+
+
+# Local copy of mv_daily_product_sales summed by (date, product, site).
+# Each sync re-reads the last ROLLUP_RESYNC_DAYS of order dates, merges them
+# into a new generation directory and swaps it in; readers keep using the
+# generation they started with.
+class RollupStore:
+    def __init__(self, directory: str, history_days: int = 400, resync_days: int = 3):
+        self.directory = directory
+        self.history_days = history_days
+        self.resync_days = resync_days
+        self._current: Optional[RollupTable] = None
+        self._lock = threading.Lock()
+        self.syncs = 0
+
+    @property
+    def current(self) -> Optional[RollupTable]:
+        return self._current
+
+    def open(self) -> None:
+        # 重启后沿用磁盘上的最新一代，只需增量同步
+        pointer = os.path.join(self.directory, "CURRENT")
+        if not os.path.exists(pointer):
+            return
+        try:
+            with open(pointer) as f:
+                self._current = RollupTable.load(os.path.join(self.directory, f.read().strip()))
+        except Exception:
+            logger.exception("Failed to open the local rollup, it will be rebuilt")
+
+    def sync(self, client: bigquery.Client, dimensions) -> RollupTable:
+        with self._lock:
+            current = self._current
+            today = date.today()
+            horizon = today - timedelta(days=self.history_days)
+            since = horizon
+            if current is not None:
+                since = max(horizon, current.synced_on - timedelta(days=self.resync_days))
+
+            dims = dimensions.get(client)
+            job_config = bigquery.QueryJobConfig(use_query_cache=True)
+            job_config.query_parameters = [
+                bigquery.ScalarQueryParameter("since", "DATE", since),
+                usd_factors_param(dims.site_usd_factors(since, today)),
+            ]
+            sales_job = client.query(SALES_QUERY, job_config=job_config)
+            calendar_job = client.query(CALENDAR_QUERY, job_config=bigquery.QueryJobConfig(use_query_cache=True))
+
+            columns, products = _merge(current, fetch_columns(sales_job), horizon, since)
+            meta = {
+                "products": products,
+                "calendar": [d.isoformat() for d in fetch_columns(calendar_job).get("item_date", [])],
+                "start": horizon.isoformat(),
+                "synced_on": today.isoformat(),
+            }
+
+            os.makedirs(self.directory, exist_ok=True)
+            name = f"gen-{int(time.time() * 1000)}"
+            table = RollupTable.write(os.path.join(self.directory, name), columns, meta)
+            pointer = os.path.join(self.directory, "CURRENT")
+            with open(pointer + ".tmp", "w") as f:
+                f.write(name)
+            os.replace(pointer + ".tmp", pointer)
+
+            self._current = table
+            self.syncs += 1
+            self._remove_old_generations(name)
+            return table
+
+    def _remove_old_generations(self, keep: str) -> None:
+        # 已映射的旧文件在 Linux 上删除后仍可读，正在进行的请求不受影响
+        for entry in os.listdir(self.directory):
+            if entry.startswith("gen-") and entry != keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    async def sync_periodically(self, registry, executor, dimensions, interval: float) -> None:
+        while True:
+            try:
+                await executor.run(self.sync, registry.client, dimensions)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to sync the local rollup")
+            await asyncio.sleep(interval)
+
+    # Endpoint entry points: None means "not covered locally, ask BigQuery"
+    def top_products(self, start_date: str, end_date: str, limit: int) -> Optional[Dict[str, Any]]:
+        table, start, end = self._covering(start_date, end_date)
+        return table.top_products(start, end, limit) if table else None
+
+    def product_sales_report(self, product_ids: List[str], start_date: str, end_date: str) -> Optional[Dict[str, Any]]:
+        table, start, end = self._covering(start_date, end_date)
+        return table.product_sales_report(product_ids, start, end) if table else None
+
+    def product_sales_summary(self, product_ids: List[str], start_date: str, end_date: str) -> Optional[Dict[str, Any]]:
+        table, start, end = self._covering(start_date, end_date)
+        return table.product_sales_summary(product_ids, start, end) if table else None
+
+    def _covering(self, start_date: str, end_date: str):
+        table = self._current
+        start, end = parse_day(start_date), parse_day(end_date)
+        if table is None or not table.covers(start, end):
+            return None, None, None
+        return table, start, end
+
+    def stats(self) -> Dict[str, Any]:
+        table = self._current
+        return {
+            "syncs": self.syncs,
+            "rows": table.row_count if table else 0,
+            "start": table.start.isoformat() if table else None,
+            "synced_on": table.synced_on.isoformat() if table else None,
+        }
+
+
+def create_rollup_store() -> Optional[RollupStore]:
+    if not settings.rollup_enabled:
+        return None
+    store = RollupStore(
+        settings.rollup_dir,
+        history_days=settings.rollup_history_days,
+        resync_days=settings.rollup_resync_days,
+    )
+    store.open()
+    return store
+
+
+# Dependency; None when ROLLUP_ENABLED is off
+def get_rollup_store(request: Request) -> Optional[RollupStore]:
+    return request.app.state.rollup
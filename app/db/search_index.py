@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from fastapi import Request
+from google.cloud import bigquery
+
+from app.core.config import settings
+from app.db.results import fetch_columns
+
+logger = logging.getLogger(__name__)
+
+# Product text for the search filters: tb_goods titles and tag strings, and
+# the custom tags in tb_goods_tag. ``{where}`` restricts an incremental
+# update to products created since the last load.
+GOODS_QUERY = """
+    SELECT p.p_id AS product_id, p.title, p.tags, CAST(p.create_time AS STRING) AS created
+    FROM `allwebi.tb_goods` AS p
+    {where}
+"""
+TAGS_QUERY = """
+    SELECT gt.product_spu AS product_id, gt.tag
+    FROM `allwebi.tb_goods_tag` AS gt
+    {where}
+"""
+NEW_GOODS_WHERE = "WHERE CAST(p.create_time AS STRING) >= @since"
+NEW_TAGS_WHERE = """WHERE gt.product_spu IN (
+        SELECT p_id FROM `allwebi.tb_goods` WHERE CAST(create_time AS STRING) >= @since
+    )"""
+
+# 索引字段：标题、tb_goods.tags、tb_goods_tag.tag
+FIELDS = ("title", "tags", "tag")
+# 正则元字符；含这些字符的搜索词交给 BigQuery 按正则处理
+_REGEX_CHARS = set(".^$*+?{}[]\\|()")
+_MEMO_SIZE = 1024
+
+
+def literal_terms(patterns: List[str]) -> Optional[List[str]]:
+    if any(_REGEX_CHARS & set(pattern) for pattern in patterns):
+        return None
+    return [pattern.lower() for pattern in patterns]
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i: i + 3] for i in range(len(text) - 2)}
+
+
+# Substring index over lowercased texts. Each text is split into trigrams
+# with a posting list of text ids; a term's candidates are the intersection
+# of its trigrams' postings, confirmed with a plain substring test, so the
+# result equals REGEXP_CONTAINS(text, '(?i)' + term) for literal terms.
+class TrigramIndex:
+    def __init__(self):
+        self.texts: List[str] = []
+        self.products = array("i")
+        self.postings: Dict[str, array] = {}
+
+    def add(self, product: int, text: Optional[str]) -> None:
+        if not text:
+            return
+        text = text.lower()
+        doc = len(self.texts)
+        self.texts.append(text)
+        self.products.append(product)
+        for gram in _trigrams(text):
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array("i")
+            postings.append(doc)
+
+    def search(self, term: str) -> Set[int]:
+        grams = _trigrams(term)
+        if grams:
+            lists = [self.postings.get(gram) for gram in grams]
+            if any(postings is None for postings in lists):
+                return set()
+            # 从最短的倒排表开始求交集
+            lists.sort(key=len)
+            candidates = np.frombuffer(lists[0], dtype=np.int32)
+            for postings in lists[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, np.frombuffer(postings, dtype=np.int32), assume_unique=True)
+            docs = candidates.tolist()
+        else:
+            # 少于三个字符的词没有三元组，逐条比较
+            docs = range(len(self.texts))
+        return {self.products[doc] for doc in docs if term in self.texts[doc]}
+
+
+# Trigram indexes for every field plus the product id dictionary. A full
+# load builds a new SearchIndex; incremental updates append to the current
+# one under its lock.
+class SearchIndex:
+    def __init__(self, version: int):
+        self.version = version
+        self.loaded_at = time.time()
+        self.updated_at = self.loaded_at
+        # 增量更新的起点：已加载商品中最大的 create_time
+        self.watermark: Optional[str] = None
+        self.product_ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.fields = {field: TrigramIndex() for field in FIELDS}
+        self._memo: Dict[Tuple[str, str], Set[int]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, goods: Dict[str, List], tags: Dict[str, List]) -> int:
+        with self._lock:
+            added = set()
+            for product_id, title, product_tags, created in zip(*(goods.get(column, []) for column in ("product_id", "title", "tags", "created"))):
+                # 增量查询按 >= watermark 取数，已索引的商品跳过
+                if product_id is None or product_id in self.positions:
+                    continue
+                position = len(self.product_ids)
+                self.product_ids.append(product_id)
+                self.positions[product_id] = position
+                added.add(position)
+                self.fields["title"].add(position, title)
+                self.fields["tags"].add(position, product_tags)
+                if created is not None and (self.watermark is None or created > self.watermark):
+                    self.watermark = created
+            for product_id, tag in zip(tags.get("product_id", []), tags.get("tag", [])):
+                position = self.positions.get(product_id)
+                if position in added:
+                    self.fields["tag"].add(position, tag)
+            if added:
+                self._memo.clear()
+            self.updated_at = time.time()
+            return len(added)
+
+    def search(self, field: str, terms: List[str]) -> Set[str]:
+        # 任一词命中即可，与 '(?i)(a|b)' 的语义一致
+        with self._lock:
+            positions: Set[int] = set()
+            for term in terms:
+                key = (field, term)
+                matched = self._memo.get(key)
+                if matched is None:
+                    matched = self.fields[field].search(term)
+                    if len(self._memo) >= _MEMO_SIZE:
+                        self._memo.clear()
+                    self._memo[key] = matched
+                positions |= matched
+            return {self.product_ids[position] for position in positions}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "products": len(self.product_ids),
+                **{f"{field}_texts": len(index.texts) for field, index in self.fields.items()},
+                **{f"{field}_trigrams": len(index.postings) for field, index in self.fields.items()},
+            }
+
+
+# Holds the current index: rebuilt in full on SEARCH_INDEX_REBUILD_INTERVAL
+# (picks up edited titles and tags, deleted products), otherwise updated
+# with newly created products on every refresh
+class SearchIndexStore:
+    def __init__(self):
+        self._current: Optional[SearchIndex] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[SearchIndex]:
+        return self._current
+
+    def _fetch(self, client: bigquery.Client, since: Optional[str]) -> Tuple[Dict[str, List], Dict[str, List]]:
+        job_config = bigquery.QueryJobConfig(use_query_cache=True)
+        if since is not None:
+            job_config.query_parameters = [bigquery.ScalarQueryParameter("since", "STRING", since)]
+        goods_job = client.query(GOODS_QUERY.format(where=NEW_GOODS_WHERE if since is not None else ""), job_config=job_config)
+        tags_job = client.query(TAGS_QUERY.format(where=NEW_TAGS_WHERE if since is not None else ""), job_config=job_config)
+        return fetch_columns(goods_job), fetch_columns(tags_job)
+
+    def load(self, client: bigquery.Client) -> SearchIndex:
+        goods, tags = self._fetch(client, None)
+        with self._lock:
+            self._version += 1
+            index = SearchIndex(self._version)
+            index.add(goods, tags)
+            self._current = index
+            return index
+
+    def update(self, client: bigquery.Client) -> int:
+        index = self._current
+        if index is None or index.watermark is None:
+            self.load(client)
+            return 0
+        goods, tags = self._fetch(client, index.watermark)
+        return index.add(goods, tags)
+
+    async def refresh_periodically(self, registry, executor, interval: float, rebuild_interval: float) -> None:
+        while True:
+            try:
+                index = self._current
+                if index is None or time.time() - index.loaded_at >= rebuild_interval:
+                    await executor.run(self.load, registry.client)
+                else:
+                    await executor.run(self.update, registry.client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to refresh the search index")
+            await asyncio.sleep(interval)
+
+
+# Resolves the search filters of one request. ``searches`` maps a filter
+# name to (index field, patterns); a product must match every filter and
+# any pattern of a filter. Returns the sorted matching product ids (None
+# when no filter could be resolved) and the filters left to BigQuery:
+# regex patterns, and everything when the index is not loaded or the
+# result is too large to pass as a query parameter.
+def resolve_searches(store: Optional["SearchIndexStore"], searches: Dict[str, Tuple[str, List[str]]]) -> Tuple[Optional[List[str]], List[str]]:
+    index = store.current if store is not None else None
+    if index is None or not searches:
+        return None, list(searches)
+
+    matched: Optional[Set[str]] = None
+    unresolved = []
+    for name, (field, patterns) in searches.items():
+        terms = literal_terms(patterns)
+        if terms is None:
+            unresolved.append(name)
+            continue
+        products = index.search(field, terms)
+        matched = products if matched is None else matched & products
+
+    if matched is not None and len(matched) > settings.search_index_max_ids:
+        return None, list(searches)
+    return (sorted(matched) if matched is not None else None), unresolved
+
+
+def create_search_index() -> Optional[SearchIndexStore]:
+    if not settings.search_index_enabled:
+        return None
+    return SearchIndexStore()
+
+
+# Dependency; None when SEARCH_INDEX_ENABLED is off
+def get_search_index(request: Request) -> Optional[SearchIndexStore]:
+    return request.app.state.search_index
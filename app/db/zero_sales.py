@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+from google.cloud import bigquery
+
+from app.core.config import settings
+from app.db.results import fetch_columns
+
+logger = logging.getLogger(__name__)
+
+# One row per catalog product with everything the zero-sales filters need;
+# the sold flag replaces the per-request anti-join against mv_sold_products
+CATALOG_QUERY = """
+    SELECT
+        p.p_id AS product_id,
+        p.site_id,
+        UNIX_DATE(DATE(p.create_time)) AS create_day,
+        UNIX_DATE(SAFE.DATE(NULLIF(p.online_time, ''))) AS online_day,
+        p.online_time,
+        sp.product_id IS NOT NULL AS sold
+    FROM `allwebi.tb_goods` AS p
+    LEFT JOIN (SELECT DISTINCT product_id FROM `allwebi.mv_sold_products`) AS sp
+        ON sp.product_id = p.p_id
+"""
+
+# 缺失的日期 / 站点用哨兵值表示，任何范围条件都不会命中
+_NO_DAY = np.iinfo(np.int32).min
+_NO_SITE = np.iinfo(np.int64).min
+
+
+def unix_day(value: date) -> int:
+    return (value - date(1970, 1, 1)).days
+
+
+# Packed bitmaps over catalog positions (8 products per byte). Products get
+# dense positions at load time, so the sold set, each site and each day
+# range are bitmaps that combine with a few vectorized AND/OR operations.
+class Bitmap:
+    def __init__(self, bits: np.ndarray, size: int):
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "Bitmap":
+        return cls(np.packbits(mask), len(mask))
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(np.bitwise_and(self.bits, other.bits), self.size)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap(np.bitwise_or(self.bits, other.bits), self.size)
+
+    def to_mask(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.size).astype(bool)
+
+    def count(self) -> int:
+        return int(np.unpackbits(self.bits, count=self.size).sum())
+
+
+# Immutable snapshot of the catalog; a refresh builds a new one and swaps it in
+class ZeroSalesIndex:
+    def __init__(self, version: int, columns: Dict[str, List]):
+        self.version = version
+        self.loaded_at = time.time()
+        self.product_ids = columns["product_id"]
+        self.size = len(self.product_ids)
+        self.positions = {product_id: i for i, product_id in enumerate(self.product_ids)}
+
+        site_ids = np.array([_NO_SITE if v is None else v for v in columns["site_id"]], dtype=np.int64)
+        self.create_days = np.array([_NO_DAY if v is None else v for v in columns["create_day"]], dtype=np.int32)
+        self.online_days = np.array([_NO_DAY if v is None else v for v in columns["online_day"]], dtype=np.int32)
+        sold = np.array([bool(v) for v in columns["sold"]], dtype=bool)
+
+        self.unsold = Bitmap.from_mask(~sold)
+        self.sites = {int(site_id): Bitmap.from_mask(site_ids == site_id) for site_id in np.unique(site_ids)}
+
+        # 与 SQL 的 ORDER BY online_time DESC, product_id DESC 一致（DESC 时 NULL 在最后）
+        online_times = columns["online_time"]
+        self.order = np.array(
+            sorted(
+                range(self.size),
+                key=lambda i: (online_times[i] is not None, online_times[i] or "", self.product_ids[i]),
+                reverse=True,
+            ),
+            dtype=np.int64,
+        )
+        self.rank = np.empty(self.size, dtype=np.int64)
+        self.rank[self.order] = np.arange(self.size)
+
+    def _day_range(self, days: np.ndarray, start: Optional[date], end: Optional[date]) -> Bitmap:
+        mask = days != _NO_DAY
+        if start is not None:
+            mask &= days >= unix_day(start)
+        if end is not None:
+            mask &= days <= unix_day(end)
+        return Bitmap.from_mask(mask)
+
+    def unsold_positions(
+        self,
+        product_ids: Optional[List[str]] = None,
+        site_ids: Optional[List[int]] = None,
+        create_range: Optional[Tuple[Optional[date], Optional[date]]] = None,
+        online_range: Optional[Tuple[Optional[date], Optional[date]]] = None,
+    ) -> np.ndarray:
+        # 未售出商品在排序后的位置
+        bitmap = self.unsold
+        if product_ids is not None:
+            products = np.zeros(self.size, dtype=bool)
+            products[[self.positions[p] for p in product_ids if p in self.positions]] = True
+            bitmap = bitmap & Bitmap.from_mask(products)
+        if site_ids is not None:
+            sites = Bitmap.from_mask(np.zeros(self.size, dtype=bool))
+            for site_id in site_ids:
+                if site_id in self.sites:
+                    sites = sites | self.sites[site_id]
+            bitmap = bitmap & sites
+        if create_range is not None:
+            bitmap = bitmap & self._day_range(self.create_days, *create_range)
+        if online_range is not None:
+            bitmap = bitmap & self._day_range(self.online_days, *online_range)
+        mask = bitmap.to_mask()
+        return self.order[mask[self.order]]
+
+    def page(self, positions: np.ndarray, limit: int, offset: int = 0, after: Optional[str] = None) -> Optional[List[str]]:
+        # after：游标对应的商品，快照中没有时返回 None 由调用方回退到 SQL
+        start = offset
+        if after is not None:
+            position = self.positions.get(after)
+            if position is None:
+                return None
+            start = int(np.searchsorted(self.rank[positions], self.rank[position], side="right"))
+        return [self.product_ids[i] for i in positions[start: start + limit]]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "version": self.version,
+            "products": self.size,
+            "unsold": self.unsold.count(),
+            "sites": len(self.sites),
+            "bitmap_bytes": self.unsold.bits.nbytes * (1 + len(self.sites)),
+        }
+
+
+# Holds the current index, loaded at startup and refreshed on an interval
+class ZeroSalesIndexStore:
+    def __init__(self):
+        self._current: Optional[ZeroSalesIndex] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[ZeroSalesIndex]:
+        return self._current
+
+    # The current index unless it is older than max_age seconds
+    def fresh(self, max_age: float) -> Optional[ZeroSalesIndex]:
+        index = self._current
+        if index is None or time.time() - index.loaded_at > max_age:
+            return None
+        return index
+
+    def load(self, client: bigquery.Client) -> ZeroSalesIndex:
+        job_config = bigquery.QueryJobConfig(use_query_cache=True)
+        columns = fetch_columns(client.query(CATALOG_QUERY, job_config=job_config))
+        with self._lock:
+            self._version += 1
+            self._current = ZeroSalesIndex(self._version, columns)
+            return self._current
+
+    async def refresh_periodically(self, registry, executor, interval: float) -> None:
+        while True:
+            try:
+                await executor.run(self.load, registry.client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to refresh the zero-sales index")
+            await asyncio.sleep(interval)
+
+
+def create_zero_sales_index() -> Optional[ZeroSalesIndexStore]:
+    if not settings.zero_sales_index_enabled:
+        return None
+    return ZeroSalesIndexStore()
+
+
+# Dependency; None when ZERO_SALES_INDEX_ENABLED is off
+def get_zero_sales_index(request: Request) -> Optional[ZeroSalesIndexStore]:
+    return request.app.state.zero_sales_index
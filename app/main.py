@@ -1,10 +1,92 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from app.api.routes import api_router
+from app.core.cache import create_result_cache
+from app.core.config import settings
+from app.core.metrics import instrument_request
+from app.core.snapshots import create_snapshot_store
+from app.db.bigquery import create_registry
+from app.db.dimensions import DimensionStore
+from app.db.executor import create_executor
+from app.db.orders import create_order_repository
+from app.db.rollup import create_rollup_store
+from app.db.search_index import create_search_index
+from app.db.zero_sales import create_zero_sales_index
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 整个应用共用一个 BigQuery 客户端
+    app.state.bigquery = create_registry()
+    app.state.bigquery.open()
+    app.state.query_executor = create_executor()
+    app.state.result_cache = create_result_cache()
+    app.state.snapshots = create_snapshot_store()
+    app.state.orders = create_order_repository()
+
+    # 站点 / 部门 / 汇率维度表常驻内存，定时刷新
+    app.state.dimensions = DimensionStore()
+    dimension_refresher = asyncio.create_task(
+        app.state.dimensions.refresh_periodically(
+            app.state.bigquery, app.state.query_executor, settings.dimension_refresh_interval
+        )
+    )
+
+    # 可选的本地销量汇总，后台增量同步
+    app.state.rollup = create_rollup_store()
+    rollup_syncer = None
+    if app.state.rollup is not None:
+        rollup_syncer = asyncio.create_task(
+            app.state.rollup.sync_periodically(
+                app.state.bigquery, app.state.query_executor, app.state.dimensions, settings.rollup_sync_interval
+            )
+        )
+
+    # 可选的零销量商品位图索引，定时全量重建
+    app.state.zero_sales_index = create_zero_sales_index()
+    zero_sales_refresher = None
+    if app.state.zero_sales_index is not None:
+        zero_sales_refresher = asyncio.create_task(
+            app.state.zero_sales_index.refresh_periodically(
+                app.state.bigquery, app.state.query_executor, settings.zero_sales_index_refresh_interval
+            )
+        )
+
+    # 可选的标题 / 标签倒排索引，定时增量更新
+    app.state.search_index = create_search_index()
+    search_refresher = None
+    if app.state.search_index is not None:
+        search_refresher = asyncio.create_task(
+            app.state.search_index.refresh_periodically(
+                app.state.bigquery, app.state.query_executor,
+                settings.search_index_refresh_interval, settings.search_index_rebuild_interval,
+            )
+        )
+    try:
+        yield
+    finally:
+        if search_refresher is not None:
+            search_refresher.cancel()
+        if zero_sales_refresher is not None:
+            zero_sales_refresher.cancel()
+        if rollup_syncer is not None:
+            rollup_syncer.cancel()
+        dimension_refresher.cancel()
+        await app.state.result_cache.close()
+        app.state.orders.close()
+        app.state.query_executor.shutdown()
+        app.state.bigquery.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# 每个请求的各阶段耗时、BigQuery 作业统计，写入 /metrics 和 Server-Timing 响应头
+app.middleware("http")(instrument_request)
 
 app.include_router(api_router)
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the Order API!"}
\ No newline at end of file
+    return {"message": "Welcome to the Order API!"}
@@ -0,0 +1,22 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.db.bigquery import MemoryBackend, register_backend
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend()
+
+
+# The app started against the in-memory BigQuery stand-in
+@pytest.fixture
+def client(backend, monkeypatch):
+    register_backend("test", lambda: backend)
+    monkeypatch.setattr(settings, "bigquery_backend", "test")
+    monkeypatch.setattr(settings, "orders_backend", "memory")
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,50 @@
+from datetime import date
+
+from google.cloud import bigquery
+
+from app.core.currency import usd_factors_param
+from app.db.bigquery import InstrumentedClient, MemoryBackend, create_registry, register_backend
+
+
+def test_registered_backend_serves_the_endpoints(client, backend):
+    def summary(query, query_params):
+        values = {param.name: getattr(param, "value", None) or getattr(param, "values", None) for param in query_params}
+        assert values["product_ids"] == ["p1", "p2"]
+        return [{"total_quantity": 12, "percentage": 0.25}]
+
+    backend.add("product_sales AS", summary)
+    response = client.post(
+        "/api/product-sales-summary",
+        json={"product_ids": ["p2", "p1"], "start_date": "2024-01-01", "end_date": "2024-01-31"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"result": {"total_quantity": 12, "percentage": 0.25}}
+    assert any("product_sales AS" in query for query, _ in backend.queries)
+
+
+def test_memory_backend_answers_unmatched_queries_with_no_rows():
+    backend = MemoryBackend()
+    register_backend("memory-test", lambda: backend)
+    registry = create_registry("memory-test")
+
+    assert isinstance(registry.client, InstrumentedClient)
+    job = registry.client.query("SELECT 1")
+    assert list(job.result()) == []
+    assert backend.queries == [("SELECT 1", None)]
+    registry.close()
+
+
+def test_memory_backend_passes_empty_struct_arrays_to_handlers():
+    backend = MemoryBackend()
+    seen = {}
+    backend.add("SELECT", lambda query, query_params: seen.update({param.name: param for param in query_params}) or [])
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        usd_factors_param([]),
+        bigquery.ArrayQueryParameter("ids", "STRING", []),
+        bigquery.ScalarQueryParameter("day", "DATE", date(2024, 1, 2)),
+    ])
+    backend.create_client().query("SELECT 1", job_config=job_config)
+
+    assert seen["usd_factors"].values == [] and seen["ids"].values == []
+    assert seen["day"].value == date(2024, 1, 2)
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from pydantic import BaseModel
+
+from app.core import cache as cache_module
+from app.core.cache import MemoryCacheBackend, RedisCacheBackend, ResultCache, make_cache_key
+
+
+class Params(BaseModel):
+    a: int = 1
+
+
+def test_follower_survives_leader_cancellation():
+    async def scenario():
+        cache = ResultCache(MemoryCacheBackend())
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"value": 42}
+
+        leader = asyncio.ensure_future(cache.get_or_load("ns", Params(), 60, loader))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(cache.get_or_load("ns", Params(), 60, loader))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == {"value": 42}
+        assert leader.cancelled()
+        assert len(calls) == 1
+        # 结果已写入缓存
+        assert await cache.get_or_load("ns", Params(), 60, loader) == {"value": 42}
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_load_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        cache = ResultCache(MemoryCacheBackend())
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            cache.get_or_load("ns", Params(), 60, loader),
+            cache.get_or_load("ns", Params(), 60, loader),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert cache.stats()["entries"] == 0
+
+    asyncio.run(scenario())
+
+
+def _redis_cache(monkeypatch) -> ResultCache:
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(cache_module.aioredis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+    return ResultCache(RedisCacheBackend("redis://stand-in"))
+
+
+def test_redis_backend_round_trips_entries_with_their_ttl(monkeypatch):
+    async def scenario():
+        cache = _redis_cache(monkeypatch)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"day": date(2024, 1, 2), "amount": Decimal("1.50")}
+
+        value = await cache.get_or_load("ns", Params(), 60, loader, stale_ttl=120)
+        assert await cache.get_or_load("ns", Params(), 60, loader, stale_ttl=120) == value
+        assert value == {"day": date(2024, 1, 2), "amount": Decimal("1.50")}
+        assert len(calls) == 1
+
+        # 过期时间包含 stale 窗口
+        key = "bia:" + make_cache_key("ns", Params())
+        assert 179_000 < await cache.backend._redis.pttl(key) <= 180_000
+        await cache.backend.delete(make_cache_key("ns", Params()))
+        assert await cache.backend.get(make_cache_key("ns", Params())) is None
+        await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_backend_serves_stale_entries_while_refreshing(monkeypatch):
+    async def scenario():
+        cache = _redis_cache(monkeypatch)
+        versions = iter(["old", "new"])
+
+        async def loader():
+            return next(versions)
+
+        assert await cache.get_or_load("ns", Params(), 60, loader, stale_ttl=120) == "old"
+
+        now = time.time()
+        monkeypatch.setattr(cache_module.time, "time", lambda: now + 90)
+        assert await cache.get_or_load("ns", Params(), 60, loader, stale_ttl=120) == "old"
+        assert cache.stale_hits == 1
+        await asyncio.gather(*cache._tasks)
+        assert await cache.get_or_load("ns", Params(), 60, loader, stale_ttl=120) == "new"
+
+        # stale 窗口之后不再返回旧值
+        monkeypatch.setattr(cache_module.time, "time", lambda: now + 500)
+        assert await cache.peek("ns", Params()) is None
+        await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_drops_only_the_namespace(monkeypatch):
+    async def scenario():
+        cache = _redis_cache(monkeypatch)
+
+        async def loader():
+            return 1
+
+        for a in range(3):
+            await cache.get_or_load("report", Params(a=a), 60, loader)
+        await cache.put("report:total:x", 10, 60)
+        await cache.get_or_load("report_v2", Params(), 60, loader)
+        await cache.get_or_load("rep*", Params(), 60, loader)
+
+        assert await cache.invalidate("report") == 4
+        assert await cache.peek("report", Params(a=0)) is None
+        assert await cache.peek("report_v2", Params()) == 1
+        assert await cache.peek("rep*", Params()) == 1
+        assert await cache.invalidate("rep*") == 1
+        assert await cache.peek("report_v2", Params()) == 1
+        await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_invalidates_by_namespace():
+    async def scenario():
+        cache = ResultCache(MemoryCacheBackend())
+        await cache.put("report:a", 1, 60)
+        await cache.put("report:total:b", 2, 60)
+        await cache.put("report_v2:a", 3, 60)
+
+        assert await cache.invalidate("report") == 2
+        assert await cache.get_fresh("report_v2:a") == 3
+        assert cache.stats()["entries"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_endpoint(client):
+    asyncio.run(client.app.state.result_cache.put("top_products:a", 1, 60))
+    response = client.delete("/api/cache/top_products")
+    assert response.json() == {"namespace": "top_products", "deleted": 1}
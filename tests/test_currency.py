@@ -0,0 +1,20 @@
+import numpy as np
+
+from app.core.currency import ExchangeRateMatrix, usd_amount_sql, usd_factors_param
+
+
+def test_usd_amounts_are_not_rounded():
+    rates = ExchangeRateMatrix({("USD", "2024-01"): 7.0, ("EUR", "2024-01"): 7.7})
+    amounts = rates.convert_to_usd([10.005, 10.005, None], ["USD", "EUR", "EUR"], ["2024-01"] * 3)
+
+    # 与原 SQL 的 CASE WHEN currency = 'USD' 一致：美元原样，其他币种换算后保留两位
+    assert amounts[0] == 10.005
+    assert amounts[1] == 11.01
+    assert np.isnan(amounts[2])
+
+
+def test_usd_amount_sql_rounds_only_converted_amounts():
+    assert usd_amount_sql("dps.amount") == "IF(fx.is_usd, dps.amount, ROUND(dps.amount * fx.usd_factor, 2))"
+    param = usd_factors_param([(1, "2024-01", 1.0, True)])
+    values = param.to_api_repr()["parameterValue"]["arrayValues"][0]["structValues"]
+    assert values["is_usd"] == {"value": "true"}
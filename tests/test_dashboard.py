@@ -0,0 +1,52 @@
+DAYS = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+
+
+def _summary(query, query_params):
+    product_ids = next(param.values for param in query_params if param.name == "product_ids")
+    if "broken" in product_ids:
+        raise RuntimeError("backend exploded")
+    return [{"total_quantity": 3 * len(product_ids), "percentage": 0.5}]
+
+
+def _summary_queries(backend):
+    return [query for query, _ in backend.queries if "product_sales AS" in query]
+
+
+def test_identical_parts_run_once(client, backend):
+    backend.add("product_sales AS", _summary)
+    response = client.post("/api/dashboard", json={"parts": [
+        {"name": "a", "report": "product-sales-summary", "params": {"product_ids": ["p1", "p2"], **DAYS}},
+        # 规范化后与上一个相同：顺序不同、有重复
+        {"name": "b", "report": "product-sales-summary", "params": {"product_ids": ["p2", "p1", "p2"], **DAYS}},
+        {"name": "c", "report": "product-sales-summary", "params": {"product_ids": ["p3"], **DAYS}},
+    ]})
+
+    parts = response.json()["parts"]
+    assert [part["name"] for part in parts] == ["a", "b", "c"]
+    assert parts[0]["data"] == parts[1]["data"] == {"result": {"total_quantity": 6, "percentage": 0.5}}
+    assert parts[2]["data"]["result"]["total_quantity"] == 3
+    assert len(_summary_queries(backend)) == 2
+
+
+def test_failing_parts_do_not_fail_the_dashboard(client, backend):
+    backend.add("product_sales AS", _summary)
+    response = client.post("/api/dashboard", json={"parts": [
+        {"report": "product-sales-summary", "params": {"product_ids": ["broken"], **DAYS}},
+        {"report": "product-sales-summary", "params": {"product_ids": ["p1"], **DAYS}},
+        {"report": "no-such-report"},
+        {"report": "product-sales-summary", "params": {"product_ids": ["p1"]}},
+    ]})
+
+    assert response.status_code == 200
+    broken, ok, unknown, invalid = response.json()["parts"]
+    assert broken["status"] == 400 and "backend exploded" in broken["error"]
+    assert ok["status"] == 200 and ok["data"]["result"]["total_quantity"] == 3
+    assert unknown == {"name": "no-such-report", "report": "no-such-report", "status": 404, "error": "Unknown report: no-such-report"}
+    assert invalid["status"] == 422
+    assert {error["loc"][0] for error in invalid["error"]} == {"start_date", "end_date"}
+
+
+def test_too_many_parts_are_rejected(client, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.dashboard_max_parts", 1)
+    response = client.post("/api/dashboard", json={"parts": [{"report": "top-products"}, {"report": "top-products"}]})
+    assert response.status_code == 400
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import date
+
+from app.db.bigquery import ClientRegistry, MemoryBackend
+from app.db.dimensions import DimensionStore
+from app.db.executor import QueryExecutor
+
+SITES = [
+    {"site_id": 1, "brand": "Alpha", "site_type": "shop", "currency": "EUR", "brand_department_id": 10},
+    {"site_id": 2, "brand": "Beta", "site_type": "shop", "currency": "USD", "brand_department_id": 99},
+]
+DEPARTMENTS = [{"id": 10, "department_name": "Home", "department_type": 1}]
+RATES = [
+    {"currency_symbol": "USD", "exchange_date": "2024-01", "rate_to_cny": 7.0},
+    {"currency_symbol": "EUR", "exchange_date": "2024-01", "rate_to_cny": 7.7},
+    {"currency_symbol": "EUR", "exchange_date": "2024-02", "rate_to_cny": None},
+]
+
+
+def _backend(sites=SITES):
+    backend = MemoryBackend()
+    backend.add("tb_sites", sites)
+    backend.add("tb_brand_department", DEPARTMENTS)
+    backend.add("tb_exchange_rates", RATES)
+    return backend
+
+
+def test_load_builds_lookups_from_the_dimension_tables():
+    dims = DimensionStore().load(_backend().create_client())
+
+    assert dims.version == 1
+    assert dims.site_fields(1) == {"site_name": "Alpha", "site_type": "shop", "currency": "EUR", "department_name": "Home"}
+    assert dims.site_currencies([2, 1]) == ["USD", "EUR"]
+    # NULL 汇率不进矩阵
+    assert dims.exchange_rates.months == ["2024-01"]
+
+
+def test_lookup_misses():
+    dims = DimensionStore().load(_backend().create_client())
+
+    assert dims.site_fields(404) == {"site_name": None, "site_type": None, "currency": None, "department_name": None}
+    assert dims.site_fields(None)["site_name"] is None
+    # 站点存在但部门缺失
+    assert dims.site_fields(2)["site_name"] == "Beta"
+    assert dims.site_fields(2)["department_name"] is None
+    assert dims.site_currencies([404, None]) == [None, None]
+
+
+def test_site_usd_factors_skip_months_without_a_rate():
+    dims = DimensionStore().load(_backend().create_client())
+
+    factors = dims.site_usd_factors(date(2024, 1, 1), date(2024, 2, 29))
+    assert sorted(factors) == [(1, "2024-01", 1.1, False), (2, "2024-01", 1.0, True), (2, "2024-02", 1.0, True)]
+    assert dims.site_usd_factors(date(2023, 1, 1), date(2023, 1, 31)) == [(2, "2023-01", 1.0, True)]
+    assert DimensionStore().load(MemoryBackend().create_client()).site_usd_factors() == []
+
+
+def test_get_loads_once_and_reload_swaps_in_a_new_version():
+    backend = _backend()
+    client = backend.create_client()
+    store = DimensionStore()
+
+    first = store.get(client)
+    assert store.get(client) is first
+    assert len(backend.queries) == 3
+
+    backend.handlers.insert(0, ("tb_sites", [dict(SITES[0], brand="Alpha 2")], 0))
+    second = store.load(client)
+
+    assert second.version == 2
+    assert store.current is second
+    assert second.site_fields(1)["site_name"] == "Alpha 2"
+    assert second.site_fields(2)["site_name"] is None
+    # 旧快照不受影响
+    assert first.site_fields(1)["site_name"] == "Alpha"
+
+
+def test_failed_refresh_keeps_the_previous_tables():
+    backend = _backend()
+    registry = ClientRegistry(backend)
+    store = DimensionStore()
+    calls = []
+
+    def sites(query, query_params):
+        calls.append(query)
+        if len(calls) > 1:
+            raise RuntimeError("BigQuery unavailable")
+        return SITES
+    backend.handlers[0] = ("tb_sites", sites, 0)
+
+    async def run():
+        executor = QueryExecutor(max_workers=1)
+        task = asyncio.create_task(store.refresh_periodically(registry, executor, 0.01))
+        while len(calls) < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        executor.shutdown()
+
+    asyncio.run(run())
+
+    assert store.current.version == 1
+    assert store.current.site_fields(1)["site_name"] == "Alpha"
@@ -0,0 +1,36 @@
+import asyncio
+import json
+import time
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+from fastapi import HTTPException
+
+from app.core.export import _encode_csv, _encode_ndjson, _next_batch
+from app.core.responses import FastJSONResponse
+from app.db.executor import QueryExecutor
+
+
+def test_export_decimals_match_json_api():
+    table = pa.table({"amount": pa.array([Decimal("1.50"), Decimal("2"), None], type=pa.decimal128(10, 2))})
+    columns = _next_batch(iter(table.to_batches()))
+
+    api = json.loads(FastJSONResponse._dumps({"amount": [Decimal("1.50")]}))["amount"]
+    assert json.loads(_encode_ndjson(columns, True).splitlines()[0])["amount"] == api[0] == 1.5
+    assert _encode_csv(columns, True).splitlines()[1] == "1.5"
+
+
+def test_admitted_work_is_not_rejected_when_busy():
+    async def scenario():
+        executor = QueryExecutor(max_workers=1, max_pending=0)
+        blocker = asyncio.ensure_future(executor.run(time.sleep, 0.05))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as rejected:
+            executor.admit()
+        assert rejected.value.status_code == 503
+        assert await executor.run_admitted(lambda: "batch") == "batch"
+        await blocker
+        executor.shutdown()
+
+    asyncio.run(scenario())
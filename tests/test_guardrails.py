@@ -0,0 +1,97 @@
+import pytest
+
+from app.core.config import settings
+from app.db.guardrails import PLAN_FULL, PLAN_REJECTED, PLAN_WITHOUT_TOTAL, QueryBudget, choose_plan, query_job_config
+
+ROW = {
+    "product_id": "p1", "product_title": None, "online_time": None, "create_time": None,
+    "product_img": None, "tags": None, "site_name": None, "department_name": None,
+}
+PAGE_BYTES = 500
+COUNT_BYTES = 5000
+
+
+@pytest.mark.parametrize("limit, page, count, plan", [
+    (0, 10 ** 12, 10 ** 12, PLAN_FULL),
+    (1000, 500, 1000, PLAN_FULL),
+    (1000, 1000, 1001, PLAN_WITHOUT_TOTAL),
+    (1000, 1001, 10, PLAN_REJECTED),
+])
+def test_choose_plan(limit, page, count, plan):
+    assert choose_plan(QueryBudget(max_bytes_billed=limit), {"page": page, "count": count}) == plan
+
+
+def test_job_config_carries_the_endpoint_budget(monkeypatch):
+    monkeypatch.setattr(settings, "query_max_bytes_billed", 10)
+    monkeypatch.setattr(settings, "query_max_bytes_billed_overrides", {"product_analysis": 20})
+    monkeypatch.setattr(settings, "query_timeout_ms", 3000)
+    assert query_job_config("product_analysis").maximum_bytes_billed == 20
+    assert query_job_config("daily_product_report").maximum_bytes_billed == 10
+    assert int(query_job_config("daily_product_report").job_timeout_ms) == 3000
+
+
+@pytest.fixture
+def budgeted(backend, monkeypatch):
+    # dry run 的扫描量由替身给出：页查询 500 字节，计数查询 5000 字节
+    backend.add("main_query.*", [ROW], bytes_processed=PAGE_BYTES)
+    backend.add("COUNT(*) AS total_records", [{"total_records": 1}], bytes_processed=COUNT_BYTES)
+
+    def limit(max_bytes):
+        monkeypatch.setattr(settings, "query_max_bytes_billed_overrides", {"get_zero_sales_products": max_bytes})
+    return limit
+
+
+# 报表查询（维度表的加载除外）
+def _executed(backend):
+    return [query for query, job_config in backend.queries if "main_query" in query and not job_config.dry_run]
+
+
+def _dry_runs(backend):
+    return [query for query, job_config in backend.queries if "main_query" in query and job_config.dry_run]
+
+
+def test_full_plan_runs_page_and_count(client, backend, budgeted):
+    budgeted(COUNT_BYTES)
+    response = client.post("/api/get-zero-sales-products", json={"site_ids": "1"})
+
+    assert response.json()["total"] == 1
+    assert len(_dry_runs(backend)) == 2
+    assert any("COUNT(*)" in query for query in _executed(backend))
+
+
+def test_count_is_dropped_when_only_the_page_fits(client, backend, budgeted):
+    budgeted(PAGE_BYTES)
+    response = client.post("/api/get-zero-sales-products", json={"site_ids": "2"})
+
+    assert response.status_code == 200
+    assert response.json()["total"] is None
+    assert [row["product_id"] for row in response.json()["result"]] == ["p1"]
+    assert not any("COUNT(*)" in query for query in _executed(backend))
+
+
+def test_request_is_rejected_when_the_page_does_not_fit(client, backend, budgeted):
+    budgeted(PAGE_BYTES - 1)
+    response = client.post("/api/get-zero-sales-products", json={"site_ids": "3"})
+
+    assert response.status_code == 400
+    assert "above the limit of 499" in response.json()["detail"]
+    assert _executed(backend) == []
+
+
+def test_explain_returns_the_estimate_without_running(client, backend, budgeted):
+    budgeted(PAGE_BYTES)
+    response = client.post("/api/get-zero-sales-products", json={"site_ids": "4", "explain": True})
+
+    explain = response.json()["explain"]
+    assert response.json()["result"] == []
+    assert explain["plan"] == PLAN_WITHOUT_TOTAL
+    assert explain["max_bytes_billed"] == PAGE_BYTES
+    assert explain["total_bytes_processed"] == PAGE_BYTES + COUNT_BYTES
+    assert {query["name"]: query["total_bytes_processed"] for query in explain["queries"]} == {"page": PAGE_BYTES, "count": COUNT_BYTES}
+    assert _executed(backend) == []
+
+
+def test_explain_works_without_a_budget(client, backend, budgeted):
+    response = client.post("/api/get-zero-sales-products", json={"explain": True})
+    assert response.json()["explain"]["plan"] == PLAN_FULL
+    assert response.json()["explain"]["max_bytes_billed"] is None
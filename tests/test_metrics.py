@@ -0,0 +1,64 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.metrics import PHASE_SECONDS, REQUEST_SECONDS, RESULT_ROWS, instrument_request, record_rows, timed
+
+
+def _count(histogram, *labels) -> float:
+    for metric in histogram.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and tuple(sample.labels.values()) == labels:
+                return sample.value
+    return 0.0
+
+
+def test_phases_recorded_while_streaming_reach_the_route_histograms():
+    app = FastAPI()
+    app.middleware("http")(instrument_request)
+
+    @app.get("/metrics-test/stream")
+    def stream():
+        with timed("execute"):
+            pass
+
+        # 响应头发出之后才逐批转换
+        def batches():
+            for batch in range(3):
+                with timed("convert"):
+                    record_rows(10)
+                yield f"{batch}\n"
+
+        return StreamingResponse(batches())
+
+    route = "/metrics-test/stream"
+    with TestClient(app) as client:
+        response = client.get(route)
+    assert response.text == "0\n1\n2\n"
+    assert _count(PHASE_SECONDS, route, "execute") == 1
+    assert _count(PHASE_SECONDS, route, "convert") == 3
+    assert _count(RESULT_ROWS, route) == 3
+
+
+def test_routes_are_labelled_with_the_prefixed_template():
+    router = APIRouter()
+
+    @router.get("/metrics-test/items/{item_id}")
+    def item(item_id: int):
+        return {"id": item_id}
+
+    app = FastAPI()
+    app.middleware("http")(instrument_request)
+    app.include_router(router, prefix="/api")
+
+    with TestClient(app) as client:
+        client.get("/api/metrics-test/items/5")
+        client.get("/api/metrics-test/items/6")
+        client.get("/api/metrics-test/missing")
+    assert _count(REQUEST_SECONDS, "/api/metrics-test/items/{item_id}", "GET", "200") == 2
+    assert _count(REQUEST_SECONDS, "unmatched", "GET", "404") >= 1
+
+
+def test_nested_routers_keep_their_full_prefix(client):
+    client.get("/api/cache/stats")
+    assert _count(REQUEST_SECONDS, "/api/cache/stats", "GET", "200") >= 1
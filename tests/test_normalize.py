@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from app.api.endpoints.daily_product_report import DailyProductReportParams
+from app.api.endpoints.product_analysis import QueryParams
+from app.api.endpoints.product_sales_report import ProductSalesReportBatchParams, ProductSalesReportParams
+
+
+def test_equivalent_requests_normalize_to_one_form():
+    tomorrow = date.today() + timedelta(days=1)
+    params = DailyProductReportParams(site_ids=" 3,1, 2,3", end_date=f"{tomorrow.isoformat()} 10:00:00")
+    assert params.site_ids == "1,2,3"
+    assert params.end_date == date.today()
+
+    assert QueryParams(department_types="10,2,x").department_types == "2,10,x"
+
+    report = ProductSalesReportParams(product_ids=["b", " a", "b"], start_date="2024-01-01 00:00:00", end_date="2024-01-02")
+    assert report.product_ids == ["a", "b"]
+    assert report.start_date == "2024-01-01"
+
+
+def test_group_order_is_kept():
+    params = ProductSalesReportBatchParams(groups=[["2", "1"], ["0"]], start_date="2024-01-01", end_date="2024-01-02")
+    assert params.groups == [["1", "2"], ["0"]]
+
+
+def test_values_of_the_wrong_type_are_still_rejected():
+    with pytest.raises(ValidationError):
+        ProductSalesReportParams(product_ids="a,b", start_date="2024-01-01", end_date="2024-01-02")
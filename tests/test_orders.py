@@ -0,0 +1,105 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app.db.orders import MemoryOrderRepository, Order, SQLiteOrderRepository
+from tests.benchmark import benchmark, per_1k_rows
+
+FIXTURES = [
+    Order(id=1, item_name="Item A", item_price=10.0, quantity=2, total_price=20.0),
+    Order(id=2, item_name="Item B", item_price=20.0, quantity=1, total_price=20.0),
+]
+
+
+def _order(order_id: int) -> Order:
+    return Order(id=order_id, item_name=f"Item {order_id % 50}", item_price=1.5, quantity=2, total_price=3.0)
+
+
+# 两种实现跑同一组用例，避免行为不一致
+@pytest.fixture(params=["memory", "sqlite"])
+def repository(request, tmp_path):
+    if request.param == "memory":
+        repository = MemoryOrderRepository()
+    else:
+        repository = SQLiteOrderRepository(str(tmp_path / "orders.db"))
+    yield repository
+    repository.close()
+
+
+def test_create_get_and_list(repository):
+    assert repository.create_many([]) == []
+    repository.create_many(FIXTURES)
+    repository.create(_order(57))
+
+    assert len(repository) == 3
+    assert repository.get(1) == FIXTURES[0]
+    assert repository.get(99) is None
+    assert [order.id for order in repository.list()] == [1, 2, 57]
+    assert [order.id for order in repository.list(skip=1, limit=1)] == [2]
+    assert [order.id for order in repository.list(item_name="Item 7")] == [57]
+    assert repository.list(item_name="missing") == []
+
+
+def test_duplicate_ids_reject_the_whole_batch(repository):
+    repository.create_many(FIXTURES)
+    with pytest.raises(HTTPException) as error:
+        repository.create_many([_order(3), _order(2), _order(3)])
+
+    assert error.value.status_code == 409
+    assert error.value.detail == "Order ids already exist: [2, 3]"
+    assert repository.get(3) is None
+    assert len(repository) == 2
+
+
+def test_concurrent_creates_keep_every_order(repository):
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda order_id: repository.create(_order(order_id)), range(1, 201)))
+
+    assert len(repository) == 200
+    assert sorted(order.id for order in repository.list(limit=500)) == list(range(1, 201))
+    assert len(repository.list(limit=10, item_name="Item 7")) == 4
+
+
+def test_workers_seeding_at_once_do_not_conflict(tmp_path):
+    path = str(tmp_path / "orders.db")
+    workers = 4
+    barrier = threading.Barrier(workers)
+
+    # 每个 worker 一个仓库（各自的连接和写线程），同时写入固定数据
+    def start_worker(_):
+        repository = SQLiteOrderRepository(path, pool_size=1)
+        barrier.wait()
+        repository.seed(FIXTURES)
+        return repository
+
+    with ThreadPoolExecutor(workers) as pool:
+        repositories = list(pool.map(start_worker, range(workers)))
+    try:
+        assert len(repositories[0]) == 2
+        assert repositories[-1].get(1) == FIXTURES[0]
+    finally:
+        for repository in repositories:
+            repository.close()
+
+
+@benchmark
+def test_benchmark_insert_throughput_and_lookup_latency(repository):
+    name = type(repository).__name__
+    ids = itertools.count(1)
+
+    # 并发的单条写入（SQLite 由写线程合并提交）
+    def insert_concurrently(count: int = 2000, threads: int = 16) -> None:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(lambda _: repository.create(_order(next(ids))), range(count)))
+
+    per_1k_rows(f"{name} concurrent inserts", insert_concurrently, 2000, repeat=3)
+    per_1k_rows(f"{name} bulk insert", lambda: repository.create_many([_order(next(ids)) for _ in range(2000)]), 2000, repeat=3)
+
+    total = len(repository)
+    per_1k_rows(f"{name} get by id", lambda: [repository.get(order_id) for order_id in range(1, 1001)], 1000)
+    per_1k_rows(f"{name} list by item_name", lambda: [repository.list(limit=10, item_name=f"Item {n % 50}") for n in range(1000)], 1000)
+    assert repository.get(total).id == total
+    assert len(repository.list(limit=10, item_name="Item 7")) == 10
@@ -0,0 +1,92 @@
+import base64
+import json
+import re
+import sqlite3
+
+import pytest
+
+from app.core.pagination import SortKey, decode_cursor, encode_cursor, next_cursor, order_by_clause, seek_clause
+
+KEYS = [
+    SortKey("total_daily_purchase_quantity", "FLOAT64"),
+    SortKey("product_id", "STRING"),
+    SortKey("site_id", "INT64"),
+]
+
+# 数量可为 NULL，且有相同数量 / 相同商品的行，靠后面的键区分
+ROWS = [
+    (5.0, "p1", 1), (5.0, "p1", 2), (5.0, "p2", 1), (3.5, "p1", 1),
+    (None, "p3", 1), (None, "p3", 2), (None, "p1", 7), (3.5, "p0", 9),
+    (1.0, "p9", 1), (None, "p0", 1),
+]
+
+
+def _database() -> sqlite3.Connection:
+    # SQLite 与 BigQuery 一样：DESC 时 NULL 排在最后
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE main_query (total_daily_purchase_quantity REAL, product_id TEXT, site_id INTEGER)")
+    db.executemany("INSERT INTO main_query VALUES (?, ?, ?)", ROWS)
+    return db
+
+
+def _page(db: sqlite3.Connection, cursor, limit: int):
+    seek, query_params = seek_clause(cursor, KEYS)
+    query = f"SELECT * FROM main_query {seek} {order_by_clause(KEYS)} LIMIT {limit}"
+    query = re.sub(r"@(\w+)", r":\1", query)
+    db.row_factory = sqlite3.Row
+    rows = [dict(row) for row in db.execute(query, {param.name: param.value for param in query_params})]
+    return rows, next_cursor(rows, KEYS, limit)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_cursor_pages_cover_every_row_once_in_order(limit):
+    db = _database()
+    expected = [tuple(row) for row in db.execute(f"SELECT * FROM main_query {order_by_clause(KEYS)}")]
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = _page(db, cursor, limit)
+        seen.extend(tuple(row.values()) for row in rows)
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_seek_after_a_null_key_only_keeps_later_nulls():
+    cursor = encode_cursor({"total_daily_purchase_quantity": None, "product_id": "p1", "site_id": 7}, KEYS)
+    clause, query_params = seek_clause(cursor, KEYS)
+
+    assert "total_daily_purchase_quantity IS NULL" in clause
+    assert [param.name for param in query_params] == ["cursor_1", "cursor_2"]
+    rows, _ = _page(_database(), cursor, 10)
+    assert [(row["product_id"], row["site_id"]) for row in rows] == [("p0", 1)]
+
+
+def test_cursor_round_trip_restores_types():
+    row = {"total_daily_purchase_quantity": 3.5, "product_id": "p1", "site_id": 2}
+    assert decode_cursor(encode_cursor(row, KEYS), KEYS) == [3.5, "p1", 2]
+    assert seek_clause(None, KEYS) == ("", [])
+
+
+def _raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    _raw_cursor({"product_id": "p1"}),
+    _raw_cursor([3.5, "p1"]),
+    _raw_cursor(["many", "p1", 2]),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, KEYS)
+
+
+def test_tampered_cursor_returns_400(client):
+    response = client.post(
+        "/api/product-sales-analysis-spu",
+        json={"start_date": "2024-01-01", "end_date": "2024-01-31", "cursor": _raw_cursor(["many", "p1", 2])},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
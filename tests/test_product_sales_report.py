@@ -0,0 +1,69 @@
+import json
+from datetime import date
+
+import pytest
+
+CALENDAR = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+# (product_id, order_date) -> (quantity, USD amount)
+SALES = {
+    ("p1", date(2024, 1, 1)): (2, 10.5),
+    ("p2", date(2024, 1, 1)): (1, 4.25),
+    ("p2", date(2024, 1, 3)): (5, 20.0),
+}
+
+
+def _param_values(query_params, name):
+    param = next(param for param in query_params if param.name == name)
+    return param.values if hasattr(param, "values") else param.value
+
+
+def _days(query_params):
+    start, end = (date.fromisoformat(_param_values(query_params, name)[:10]) for name in ("start_date", "end_date"))
+    return [day for day in CALENDAR if start <= day <= end]
+
+
+# 单个分组：日期维度 LEFT JOIN 销量，COALESCE 成 0
+def _single(query, query_params):
+    product_ids = set(_param_values(query_params, "product_ids"))
+    rows = []
+    for day in _days(query_params):
+        sales = [value for (product_id, order_date), value in SALES.items() if order_date == day and product_id in product_ids]
+        rows.append({
+            "item_date": day,
+            "daily_purchase_quantity": sum(qty for qty, _ in sales),
+            "total_order_amount": float(sum(amount for _, amount in sales)),
+        })
+    return rows
+
+
+# 批量：按 (分组, 日期) 汇总，没有销量的日期只有一行 NULL 分组
+def _batch(query, query_params):
+    members = [(param.struct_values["group_index"], param.struct_values["product_id"]) for param in _param_values(query_params, "group_products")]
+    rows = []
+    for day in _days(query_params):
+        groups = {}
+        for index, product_id in members:
+            if (product_id, day) in SALES:
+                qty, amount = SALES[(product_id, day)]
+                total = groups.setdefault(index, [0, 0.0])
+                total[0] += qty
+                total[1] += amount
+        if not groups:
+            rows.append({"item_date": day, "group_index": None, "daily_purchase_quantity": None, "total_order_amount": None})
+        for index, (qty, amount) in sorted(groups.items()):
+            rows.append({"item_date": day, "group_index": index, "daily_purchase_quantity": qty, "total_order_amount": amount})
+    return rows
+
+
+@pytest.mark.parametrize("group", [["p1", "p2"], ["p2"], ["p-without-sales"], []])
+def test_batch_report_matches_the_single_endpoint(client, backend, group):
+    backend.add("JOIN\n            group_products AS gp", _batch)
+    backend.add("dps.product_id IN UNNEST(@product_ids)", _single)
+    days = {"start_date": "2024-01-01", "end_date": "2024-01-03"}
+
+    single = client.post("/api/product-sales-report", json={"product_ids": group, **days})
+    batch = client.post("/api/product-sales-report/batch", json={"groups": [["p1"], group], **days})
+
+    assert single.status_code == batch.status_code == 200, batch.text
+    # 比较 JSON 文本，0 与 0.0 也要一致
+    assert json.dumps(batch.json()["result"][1]) == json.dumps(single.json())
@@ -0,0 +1,58 @@
+import pytest
+from google.cloud import bigquery
+
+from app.api.endpoints import get_zero_sales_products as zero_sales
+from app.db.query_builder import FilterSet, QueryTemplate, template_stats
+
+TEMPLATE = QueryTemplate("test_query_builder", """
+    WITH sales AS (SELECT * FROM t WHERE TRUE {sales_where})
+    SELECT * FROM sales JOIN p USING (id) WHERE TRUE {products_where}
+""", {
+    "site_ids": {"sales_where": "AND site_id IN UNNEST(@site_ids)", "products_where": "AND p.site_id IN UNNEST(@site_ids)"},
+    "start_date": {"sales_where": "AND day >= @start_date"},
+    "title": {"products_where": "AND REGEXP_CONTAINS(p.title, @title)"},
+})
+
+
+def _filters(**values) -> FilterSet:
+    filters = FilterSet()
+    for name, value in values.items():
+        filters.add(name, bigquery.ScalarQueryParameter(name, "STRING", value))
+    return filters
+
+
+def test_filter_sets_with_the_same_shape_share_one_plan():
+    first = _filters(site_ids="1", title="dress")
+    second = _filters(title="hat", site_ids="2")
+    hits, compiled = TEMPLATE.hits, len(TEMPLATE._compiled)
+
+    sql = TEMPLATE.render(first.active)
+    assert TEMPLATE.render(second.active) is sql
+    assert len(TEMPLATE._compiled) == compiled + 1
+    assert TEMPLATE.hits == hits + 1
+    # 参数值不进入 SQL 文本
+    assert [param.value for param in second.params] == ["hat", "2"]
+    assert "dress" not in sql and "@title" in sql
+
+
+def test_filter_sets_with_another_shape_get_their_own_plan():
+    with_title = TEMPLATE.render(_filters(start_date="2024-01-01", title="x").active)
+    without_title = TEMPLATE.render(_filters(start_date="2024-01-01").active)
+
+    assert with_title != without_title
+    assert "@title" not in without_title and "day >= @start_date" in without_title
+    assert template_stats()["test_query_builder"]["compiled"] == len(TEMPLATE._compiled)
+    with pytest.raises(KeyError, match="nope"):
+        TEMPLATE.render(["nope"])
+
+
+def test_endpoint_requests_differing_only_in_values_reuse_the_plan():
+    def sql(**values):
+        return zero_sales.build_main_query(zero_sales.GetZeroSalesProductsParams(**values))[0]
+
+    compiled = len(zero_sales.MAIN_QUERY._compiled)
+    a = sql(site_ids="1,2", start_date="2024-01-01", title_search="dre.s")
+    b = sql(site_ids="7", start_date="2023-05-06", title_search="h[a]t")
+    assert a is b
+    assert sql(site_ids="7") is not a
+    assert len(zero_sales.MAIN_QUERY._compiled) <= compiled + 2
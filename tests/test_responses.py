@@ -0,0 +1,102 @@
+from datetime import date
+
+import pyarrow as pa
+import pytest
+
+from app.api.endpoints.get_zero_sales_products import ZeroSalesProductRow
+from app.core.responses import ARROW_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE
+
+ROWS = [
+    {"product_id": "p1", "product_title": "Mug", "online_time": "2024-01-02", "create_time": None,
+     "product_img": None, "tags": None, "site_name": None, "department_name": None},
+    {"product_id": "p2", "product_title": None, "online_time": None, "create_time": None,
+     "product_img": "a.png", "tags": "x", "site_name": None, "department_name": None},
+]
+
+
+@pytest.fixture
+def zero_sales(client, backend):
+    backend.add("COUNT(*) AS total_records", [{"total_records": 2}])
+    backend.add("main_query.*", ROWS)
+
+    # 每次用不同的 site_ids，避开结果缓存
+    def post(site_ids, accept=None):
+        headers = {"Accept": accept} if accept is not None else {}
+        return client.post("/api/get-zero-sales-products", json={"site_ids": site_ids}, headers=headers)
+    return post
+
+
+def _read_arrow(response):
+    return pa.ipc.open_stream(response.content).read_all()
+
+
+def test_plain_json_by_default(zero_sales):
+    response = zero_sales("11")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["vary"] == "Accept"
+    assert [row["product_id"] for row in response.json()["result"]] == ["p1", "p2"]
+
+
+@pytest.mark.parametrize("accept", ["text/csv", "application/xml, */*", "application/vnd.apache.arrow.file"])
+def test_unknown_accept_falls_back_to_json(zero_sales, accept):
+    response = zero_sales("12", accept)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["result"][0]["product_title"] == "Mug"
+
+
+def test_columnar_json_sends_each_column_once(zero_sales):
+    response = zero_sales("13", COLUMNAR_MEDIA_TYPE)
+    body = response.json()
+
+    assert response.headers["content-type"] == COLUMNAR_MEDIA_TYPE
+    assert response.headers["vary"] == "Accept"
+    assert list(body["result"]) == list(ZeroSalesProductRow.column_names)
+    assert body["result"]["product_id"] == ["p1", "p2"]
+    assert body["result"]["product_img"] == [None, "a.png"]
+    assert body["total"] == 2
+    assert body["next_cursor"] is None
+
+
+def test_first_supported_type_in_accept_wins(zero_sales):
+    response = zero_sales("14", f"text/html, {ARROW_MEDIA_TYPE};q=0.5, {COLUMNAR_MEDIA_TYPE}")
+
+    assert response.headers["content-type"] == ARROW_MEDIA_TYPE
+
+
+def test_arrow_stream_carries_rows_and_fields(zero_sales):
+    response = zero_sales("15", ARROW_MEDIA_TYPE)
+    table = _read_arrow(response)
+
+    assert response.headers["content-type"] == ARROW_MEDIA_TYPE
+    assert table.column_names == list(ZeroSalesProductRow.column_names)
+    assert table.schema.field("product_id").type == pa.string()
+    assert table.column("product_id").to_pylist() == ["p1", "p2"]
+    assert table.schema.metadata[b"total"] == b"2"
+    assert table.schema.metadata[b"next_cursor"] == b"null"
+
+
+def test_empty_page_keeps_every_column(client, backend):
+    response = client.post("/api/get-zero-sales-products", json={"site_ids": "16"}, headers={"Accept": COLUMNAR_MEDIA_TYPE})
+
+    assert response.json()["result"] == {name: [] for name in ZeroSalesProductRow.column_names}
+
+
+def test_top_products_matrix_formats(client, backend):
+    backend.add("tb_date_dimension", [{"item_date": date(2023, 3, 1)}, {"item_date": date(2023, 3, 2)}])
+    backend.add("mv_daily_product_sales", [
+        {"order_date": date(2023, 3, 1), "product_id": "a", "total_quantity": 3},
+        {"order_date": date(2023, 3, 2), "product_id": "b", "total_quantity": 5},
+    ])
+    body = {"start_date": "2023-03-01", "end_date": "2023-03-02", "limit": 10}
+
+    plain = client.post("/api/top-products", json=body).json()
+    columnar = client.post("/api/top-products", json=body, headers={"Accept": COLUMNAR_MEDIA_TYPE}).json()
+    table = _read_arrow(client.post("/api/top-products", json=body, headers={"Accept": ARROW_MEDIA_TYPE}))
+
+    assert plain == {"dates": ["2023-03-01", "2023-03-02"], "data": {"a": [3, 0], "b": [0, 5]}}
+    assert columnar == {"dates": plain["dates"], "product_ids": ["a", "b"], "quantities": [[3, 0], [0, 5]]}
+    assert table.column_names == ["date", "a", "b"]
+    assert table.column("b").to_pylist() == [0, 5]
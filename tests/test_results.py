@@ -0,0 +1,56 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import numpy as np
+import pyarrow as pa
+
+from app.db.results import arrow_arrays, rows_from_columns, to_list
+from tests.benchmark import benchmark, per_1k_rows
+
+
+def _report_table(rows: int) -> pa.Table:
+    return pa.table({
+        "order_date": pa.array([date(2024, 1, 1 + i % 28) for i in range(rows)]),
+        "spu": pa.array([f"spu-{i}" for i in range(rows)]),
+        "site_id": pa.array([i % 7 for i in range(rows)]),
+        "total_purchase_quantity": pa.array([None if i % 10 == 0 else i for i in range(rows)]),
+        "total_order_amount_original": pa.array([i * 1.25 for i in range(rows)]),
+        "price": pa.array([Decimal(i) / 100 for i in range(rows)], type=pa.decimal128(12, 2)),
+    })
+
+
+def test_arrays_convert_to_the_same_values_as_to_pydict():
+    table = pa.table({
+        "i": pa.array([1, None, 3]),
+        "f": pa.array([1.5, None, 2.0]),
+        "b": pa.array([True, None, False]),
+        "s": pa.array(["a", None, "c"]),
+        "d": pa.array([date(2024, 1, 1), None, date(2024, 1, 3)]),
+        "ts": pa.array([datetime(2024, 1, 1, tzinfo=timezone.utc), None, None]),
+        "dec": pa.array([Decimal("1.5"), None, Decimal("2")], type=pa.decimal128(10, 2)),
+        "tags": pa.array([["x"], [], None]),
+    })
+    arrays = arrow_arrays(table)
+    assert arrays["i"].dtype == object and arrays["i"][1] is None
+    assert arrow_arrays(table.select(["s"]))["s"].dtype == object
+
+    expected = table.to_pydict()
+    for name, values in arrays.items():
+        converted = to_list(values)
+        assert converted == expected[name]
+        assert [type(value) for value in converted] == [type(value) for value in expected[name]]
+
+
+def test_numeric_columns_without_nulls_stay_native():
+    arrays = arrow_arrays(_report_table(100))
+    assert arrays["site_id"].dtype == np.int64
+    assert arrays["total_order_amount_original"].dtype == np.float64
+    assert rows_from_columns(arrays)[1] == _report_table(100).to_pylist()[1]
+
+
+@benchmark
+def test_benchmark_column_conversion():
+    rows = 50_000
+    table = _report_table(rows)
+    per_1k_rows("to_pydict", table.to_pydict, rows)
+    per_1k_rows("arrow_arrays + tolist", lambda: {name: to_list(values) for name, values in arrow_arrays(table).items()}, rows)
@@ -0,0 +1,19 @@
+from datetime import date
+
+import numpy as np
+
+from app.db.rollup import COLUMNS, RollupTable
+
+
+def test_covers_only_the_synced_days(tmp_path):
+    columns = {name: np.zeros(1 if name == "product_offsets" else 0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    meta = {"products": [], "calendar": [], "start": "2024-01-01", "synced_on": "2024-03-31"}
+    table = RollupTable.write(str(tmp_path / "gen-1"), columns, meta)
+
+    assert table.covers(date(2024, 1, 1), date(2024, 3, 31))
+    assert table.covers(date(2024, 2, 1), date(2024, 2, 1))
+    # 早于同步起点、晚于最后同步日期、或者起止颠倒时都回退到 BigQuery
+    assert not table.covers(date(2023, 12, 31), date(2024, 1, 5))
+    assert not table.covers(date(2024, 3, 1), date(2024, 4, 1))
+    assert not table.covers(date(2024, 2, 2), date(2024, 2, 1))
+    assert not table.covers(None, date(2024, 2, 1))
@@ -0,0 +1,72 @@
+import json
+from dataclasses import fields
+from datetime import date
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from app.api.endpoints.daily_product_report import DailyProductRow
+from app.api.endpoints.get_zero_sales_products import ZeroSalesProductRow
+from app.api.endpoints.product_analysis import ProductAnalysisRow
+from app.api.endpoints.product_sales_analysis_spu import ProductSalesAnalysisSpuRow
+from app.core import responses
+from app.core.cache import decode_entry, encode_entry
+from app.core.responses import FastJSONResponse, _arrow_table, columns_from_rows
+from app.db.results import rows_from_columns
+from tests.benchmark import benchmark, per_1k_rows
+
+MODELS = [DailyProductRow, ProductAnalysisRow, ProductSalesAnalysisSpuRow, ZeroSalesProductRow]
+
+
+# 按声明的类型生成一页结果列
+def _columns(model: type, rows: int) -> Dict[str, Any]:
+    columns: Dict[str, Any] = {}
+    for i, field in enumerate(fields(model)):
+        annotation = getattr(field.type, "__args__", (field.type,))[0]
+        if annotation is int:
+            columns[field.name] = np.arange(rows, dtype=np.int64)
+        elif annotation is float:
+            columns[field.name] = np.arange(rows, dtype=np.float64) * 1.25
+        elif annotation is date:
+            columns[field.name] = np.full(rows, np.datetime64("2024-01-02"))
+        else:
+            columns[field.name] = [None if n % 5 == 0 else f"{field.name}-{n}" for n in range(rows)]
+    return columns
+
+
+@pytest.mark.parametrize("model", MODELS, ids=lambda model: model.__name__)
+def test_rows_serialize_like_dicts(model, monkeypatch):
+    columns = _columns(model, 20)
+    rows = rows_from_columns(columns, model)
+    dicts = rows_from_columns(columns)
+    assert [row.as_dict() for row in rows] == dicts
+    name = model.column_names[0]
+    assert rows[3][name] == rows[3].get(name) == dicts[3][name]
+    assert rows[3].get("missing") is None
+
+    expected = json.loads(FastJSONResponse._dumps({"result": dicts}))
+    assert json.loads(FastJSONResponse._dumps({"result": rows})) == expected
+    # 没有 orjson 时走标准库 json
+    monkeypatch.setattr(responses, "orjson", None)
+    assert json.loads(FastJSONResponse._dumps({"result": rows})) == expected
+
+    cached, _, _ = decode_entry(encode_entry({"result": rows}, 0, 0))
+    assert cached == {"result": dicts}
+
+
+def test_arrow_schema_comes_from_the_declared_types():
+    table = _arrow_table(columns_from_rows([], DailyProductRow), {}, DailyProductRow)
+    assert table.num_rows == 0
+    assert str(table.schema.field("order_date").type) == "date32[day]"
+    assert str(table.schema.field("site_id").type) == "int64"
+    assert str(table.schema.field("total_order_amount").type) == "double"
+
+
+@benchmark
+@pytest.mark.parametrize("model", MODELS, ids=lambda model: model.__name__)
+def test_benchmark_serialization(model):
+    rows = 1000
+    columns = _columns(model, rows)
+    per_1k_rows(f"{model.__name__} dict rows", lambda: FastJSONResponse._dumps({"result": rows_from_columns(columns)}), rows, repeat=20)
+    per_1k_rows(f"{model.__name__} row model", lambda: FastJSONResponse._dumps({"result": rows_from_columns(columns, model)}), rows, repeat=20)
@@ -0,0 +1,76 @@
+import re
+
+import pytest
+
+from app.api.endpoints import product_sales_analysis_spu as spu
+from app.db.bigquery import MemoryBackend
+from app.db.search_index import SearchIndexStore, literal_terms, resolve_searches
+
+GOODS = [
+    {"product_id": "p1", "title": "Red Summer Dress", "tags": "dress,summer", "created": "2024-01-01 00:00:00"},
+    {"product_id": "p2", "title": "summer HAT", "tags": "hat", "created": "2024-01-02 00:00:00"},
+    {"product_id": "p3", "title": "连衣裙 夏季 新款", "tags": "连衣裙,新款", "created": "2024-01-03 00:00:00"},
+    {"product_id": "p4", "title": None, "tags": "", "created": "2024-01-04 00:00:00"},
+    {"product_id": "p5", "title": "Dressing gown", "tags": "gown,Dress", "created": "2024-01-05 00:00:00"},
+]
+TAGS = [
+    {"product_id": "p1", "tag": "bestseller"},
+    {"product_id": "p3", "tag": "Best 新款"},
+    {"product_id": "p5", "tag": "clearance"},
+]
+
+
+def _store() -> SearchIndexStore:
+    backend = MemoryBackend()
+    backend.add("allwebi.tb_goods_tag", TAGS)
+    backend.add("allwebi.tb_goods", GOODS)
+    store = SearchIndexStore()
+    store.load(backend.create_client())
+    return store
+
+
+def _regex_matches(field, terms):
+    # 与 REGEXP_CONTAINS(text, '(?i)(a|b)') 相同的语义
+    pattern = re.compile("(?i)(" + "|".join(terms) + ")")
+    rows = TAGS if field == "tag" else GOODS
+    return {row["product_id"] for row in rows if row[field] and pattern.search(row[field])}
+
+
+@pytest.mark.parametrize("field, terms", [
+    ("title", ["dress"]),
+    ("title", ["SUMMER"]),
+    ("title", ["r d"]),
+    ("title", ["ss"]),
+    ("title", ["夏季"]),
+    ("title", ["missing"]),
+    ("tags", ["dress", "hat"]),
+    ("tags", ["新款"]),
+    ("tag", ["best"]),
+    ("tag", ["clear", "seller"]),
+])
+def test_index_agrees_with_the_regex(field, terms):
+    assert literal_terms(terms) is not None
+    assert _store().current.search(field, literal_terms(terms)) == _regex_matches(field, terms)
+
+
+def test_regex_patterns_stay_in_sql():
+    products, unresolved = resolve_searches(_store(), {"title_search": ("title", ["dre.s"]), "tag_search": ("tags", ["hat"])})
+    assert products == ["p2"]
+    assert unresolved == ["title_search"]
+
+
+class _Dimensions:
+    def site_usd_factors(self, start, end):
+        return []
+
+
+def test_spu_title_search_filters_the_daily_sales_title_in_sql():
+    params = spu.DailyProductReportParams(start_date="2024-01-01", end_date="2024-01-31", title_search="dress", tag_search="summer")
+    query, query_params = spu.build_main_query(params, _Dimensions(), _store())
+
+    assert "REGEXP_CONTAINS(dps.title" in query
+    names = {param.name: param for param in query_params}
+    assert names["title_search"].value == "dress"
+    # 标签仍由索引解析
+    assert names["search_product_ids"].values == ["p1"]
+    assert "tag_search_regex" not in names
@@ -0,0 +1,65 @@
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from app.api.endpoints import product_sales_analysis_spu as spu
+from app.core.snapshots import SnapshotStore
+
+
+class _Result:
+    def __init__(self, table):
+        self.table = table
+        self.total_rows = table.num_rows
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return self.table
+
+
+class _Client:
+    def __init__(self, table):
+        self.table = table
+
+    def query(self, query, job_config=None):
+        return type("Job", (), {"result": lambda job: _Result(self.table)})()
+
+
+class _Dimensions:
+    def get(self, client):
+        return self
+
+    def site_usd_factors(self, start, end):
+        return []
+
+    def site_fields(self, site_id):
+        return {"site_name": f"site {site_id}", "department_name": None}
+
+
+def _table(rows: int) -> pa.Table:
+    return pa.table({
+        "product_id": [f"p{i}" for i in range(rows)],
+        "site_id": [i % 3 for i in range(rows)],
+        "total_daily_purchase_quantity": list(range(rows, 0, -1)),
+    })
+
+
+def test_oversized_snapshot_is_rejected_before_conversion(monkeypatch):
+    def convert(table):
+        raise AssertionError("converted an oversized result")
+
+    monkeypatch.setattr(spu, "arrow_arrays", convert)
+    params = spu.DailyProductReportParams(start_date="2024-01-01", end_date="2024-01-31", snapshot=True)
+    with pytest.raises(ValueError, match="too large"):
+        spu.query_product_sales_analysis_spu_snapshot(params, _Client(_table(10_000)), _Dimensions(), max_bytes=1024)
+
+
+def test_snapshot_keeps_numpy_columns_and_pages_them():
+    params = spu.DailyProductReportParams(start_date="2024-01-01", end_date="2024-01-31", snapshot=True)
+    columns = spu.query_product_sales_analysis_spu_snapshot(params, _Client(_table(5)), _Dimensions(), max_bytes=1 << 20)
+    assert columns["site_id"].dtype == np.int64
+
+    snapshot = SnapshotStore().create(columns)
+    assert snapshot.row_count == 5
+    assert snapshot.size_bytes >= columns["site_id"].nbytes
+    rows = snapshot.rows(3, 10)
+    assert [row["product_id"] for row in rows] == ["p3", "p4"]
+    assert rows[0] == {"product_id": "p3", "site_id": 0, "total_daily_purchase_quantity": 2, "site_name": "site 0", "department_name": None}
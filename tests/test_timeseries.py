@@ -0,0 +1,51 @@
+import asyncio
+from datetime import date
+
+import pyarrow as pa
+
+from app.api.endpoints.top_products import TopProductsRequest, load_top_products
+from app.core.cache import MemoryCacheBackend, ResultCache
+from app.db.executor import QueryExecutor
+
+
+class _Result:
+    def __init__(self, table):
+        self.table = table
+        self.total_rows = table.num_rows
+
+    def to_arrow(self, create_bqstorage_client=False):
+        return self.table
+
+
+# 按日期参数返回数据；product_id 是 INT64，与驱动返回的类型一致
+class _Client:
+    def query(self, query, job_config=None):
+        params = {param.name: param.value for param in job_config.query_parameters}
+        days = [day for day in (date(2024, 1, d) for d in range(1, 5)) if params["start_date"] <= day <= params["end_date"]]
+        if "tb_date_dimension" in query:
+            table = pa.table({"item_date": pa.array(days, type=pa.date32())})
+        else:
+            table = pa.table({
+                "order_date": pa.array([day for day in days for _ in (9, 10)], type=pa.date32()),
+                "product_id": pa.array([product for _ in days for product in (9, 10)], type=pa.int64()),
+                "total_quantity": pa.array([day.day * product for day in days for product in (9, 10)], type=pa.int64()),
+            })
+        return type("Job", (), {"result": lambda job: _Result(table)})()
+
+
+def test_cached_and_fresh_days_merge_under_the_same_product_keys():
+    async def scenario():
+        cache = ResultCache(MemoryCacheBackend())
+        executor = QueryExecutor(max_workers=2)
+        client = _Client()
+        try:
+            # 先缓存前两天，再查询包含新日期的窗口
+            await load_top_products(TopProductsRequest(start_date="2024-01-01", end_date="2024-01-02"), client, executor, cache)
+            result = await load_top_products(TopProductsRequest(start_date="2024-01-01", end_date="2024-01-04"), client, executor, cache)
+        finally:
+            executor.shutdown()
+        assert result["dates"] == [date(2024, 1, d) for d in range(1, 5)]
+        assert result["data"] == {"9": [9, 18, 27, 36], "10": [10, 20, 30, 40]}
+        assert list(result["data"]) == ["9", "10"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from app.core.cache import MemoryCacheBackend, ResultCache
+from app.core.totals import PAGING_FIELDS, resolve_estimated_total
+
+
+class Params(BaseModel):
+    site_ids: str = "1"
+    page: int = 1
+    limit: int = 10
+
+
+def test_cached_estimated_total_is_replaced_once_counted():
+    async def scenario():
+        cache = ResultCache(MemoryCacheBackend())
+        page = {"result": [], "total": 11, "total_estimated": True}
+        assert await resolve_estimated_total("ns", Params(), page, cache) is page
+
+        async def count():
+            return 42
+
+        # 计数按筛选条件缓存，与页码无关
+        await cache.get_or_load("ns:total", Params(page=3), 60, count, exclude=PAGING_FIELDS)
+        resolved = await resolve_estimated_total("ns", Params(), page, cache)
+        assert resolved == {"result": [], "total": 42, "total_estimated": False}
+        assert page["total_estimated"] is True
+
+        exact = {"result": [], "total": 7, "total_estimated": False}
+        assert await resolve_estimated_total("ns", Params(), exact, cache) is exact
+
+    asyncio.run(scenario())
@@ -0,0 +1,134 @@
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.api.endpoints.get_zero_sales_products import SORT_KEYS
+from app.core.pagination import encode_cursor
+from app.db.bigquery import MemoryBackend
+from app.db.zero_sales import Bitmap, ZeroSalesIndex, ZeroSalesIndexStore, unix_day
+
+START = date(2024, 1, 1)
+
+
+# 20 个商品：每天创建一个，偶数号已售出，站点按 3 轮换；p5 没有上架时间
+def _catalog(size: int = 20):
+    return {
+        "product_id": [f"p{i:02d}" for i in range(size)],
+        "site_id": [i % 3 for i in range(size)],
+        "create_day": [unix_day(START + timedelta(days=i)) for i in range(size)],
+        "online_day": [None if i == 5 else unix_day(START + timedelta(days=i + 1)) for i in range(size)],
+        "online_time": [None if i == 5 else f"{START + timedelta(days=i + 1)} 08:00:00" for i in range(size)],
+        "sold": [i % 2 == 0 for i in range(size)],
+    }
+
+
+@pytest.mark.parametrize("size", [1, 7, 8, 9, 16, 17])
+def test_bitmap_packs_and_tests_bits_across_bytes(size):
+    mask = np.zeros(size, dtype=bool)
+    mask[[i for i in (0, 6, 7, 8, 15, 16) if i < size]] = True
+    bitmap = Bitmap.from_mask(mask)
+
+    assert len(bitmap.bits) == (size + 7) // 8
+    assert np.array_equal(bitmap.to_mask(), mask)
+    assert bitmap.count() == int(mask.sum())
+    everything = Bitmap.from_mask(np.ones(size, dtype=bool))
+    assert np.array_equal((bitmap & everything).to_mask(), mask)
+    assert np.array_equal((bitmap | everything).to_mask(), np.ones(size, dtype=bool))
+
+
+@pytest.mark.parametrize("start, end", [(6, 9), (7, 8), (0, 19), (15, 16), (8, 8), (3, None), (None, 12)])
+def test_day_ranges_across_byte_boundaries(start, end):
+    index = ZeroSalesIndex(1, _catalog())
+    first = START + timedelta(days=start) if start is not None else None
+    last = START + timedelta(days=end) if end is not None else None
+    positions = index.unsold_positions(create_range=(first, last))
+
+    expected = {
+        f"p{i:02d}" for i in range(20)
+        if i % 2 == 1 and (start is None or i >= start) and (end is None or i <= end)
+    }
+    assert {index.product_ids[p] for p in positions} == expected
+
+
+def test_filters_combine_and_keep_the_sql_order():
+    index = ZeroSalesIndex(1, _catalog())
+    positions = index.unsold_positions(site_ids=[1, 2], online_range=(START, None))
+    ids = [index.product_ids[p] for p in positions]
+
+    # 上架时间倒序；p05 没有上架时间，不满足上架日期条件
+    assert ids == ["p19", "p17", "p13", "p11", "p07", "p01"]
+    assert index.unsold_positions(product_ids=["p01", "p02", "missing"]).tolist() == [index.positions["p01"]]
+    # 没有上架时间的商品排在最后
+    assert index.product_ids[index.unsold_positions()[-1]] == "p05"
+
+
+def test_page_by_offset_and_by_cursor():
+    index = ZeroSalesIndex(1, _catalog())
+    positions = index.unsold_positions()
+    first = index.page(positions, 3)
+
+    assert first == ["p19", "p17", "p15"]
+    assert index.page(positions, 3, offset=3) == index.page(positions, 3, after="p15") == ["p13", "p11", "p09"]
+    assert index.page(positions, 3, after="p01") == ["p05"]
+    # 游标对应的商品不在快照中
+    assert index.page(positions, 3, after="p99") is None
+
+
+def _store(backend: MemoryBackend) -> ZeroSalesIndexStore:
+    backend.add("AS sold", [dict(zip(_catalog(), values)) for values in zip(*_catalog().values())])
+    store = ZeroSalesIndexStore()
+    store.load(backend.create_client())
+    return store
+
+
+def _sql_fallback(backend: MemoryBackend) -> None:
+    row = {
+        "product_id": "from-sql", "product_title": None, "online_time": None, "create_time": None,
+        "product_img": None, "tags": None, "site_name": None, "department_name": None,
+    }
+    backend.add("main_query.*", [row])
+    backend.add("COUNT(*) AS total_records", [{"total_records": 1}])
+
+
+def _details(query, query_params):
+    product_ids = next(param.values for param in query_params if param.name == "product_ids")
+    return [
+        {"product_id": product_id, "product_title": product_id, "online_time": None, "create_time": None, "product_img": None, "tags": None, "site_id": 1}
+        for product_id in product_ids
+    ]
+
+
+def test_endpoint_pages_from_the_index(client, backend):
+    client.app.state.zero_sales_index = _store(backend)
+    backend.add("WHERE p.p_id IN UNNEST(@product_ids)", _details)
+    _sql_fallback(backend)
+
+    response = client.post("/api/get-zero-sales-products", json={"limit": 2})
+    assert response.status_code == 200
+    assert [row["product_id"] for row in response.json()["result"]] == ["p19", "p17"]
+    assert response.json()["total"] == 10
+    assert not any("main_query.*" in query for query, _ in backend.queries)
+
+
+def test_endpoint_falls_back_to_sql_for_a_cursor_outside_the_snapshot(client, backend):
+    client.app.state.zero_sales_index = _store(backend)
+    _sql_fallback(backend)
+
+    cursor = encode_cursor({"online_time": "2025-01-01 00:00:00", "product_id": "created-after-the-load"}, SORT_KEYS)
+    response = client.post("/api/get-zero-sales-products", json={"cursor": cursor})
+    assert response.status_code == 200
+    assert [row["product_id"] for row in response.json()["result"]] == ["from-sql"]
+
+
+def test_endpoint_falls_back_to_sql_when_the_index_is_stale(client, backend, monkeypatch):
+    store = _store(backend)
+    client.app.state.zero_sales_index = store
+    _sql_fallback(backend)
+
+    store.current.loaded_at = time.time() - 10_000
+    monkeypatch.setattr("app.core.config.settings.zero_sales_index_max_age", 3600)
+    response = client.post("/api/get-zero-sales-products", json={})
+    assert [row["product_id"] for row in response.json()["result"]] == ["from-sql"]
+    assert store.fresh(3600) is None and store.fresh(20_000) is store.current